@@ -0,0 +1,205 @@
+# =====================================================
+# SJ 狀態轉換警示 - 只處理有新 K 棒的代號
+# =====================================================
+# 記住每檔最後一次的狀態與 K 棒日期；有新 K 棒時才重算，
+# 狀態改變就產生事件（from → to、Slope_Z、Score_Z）送到各個輸出端。
+# 同一檔同一天同一個目標狀態只會送一次。
+# 盤中掃描得到的是暫定狀態（final=False）；收盤定案後同一天會再評估一次，
+# 以定案狀態和前一交易日比較，需要時再送一筆「定案」事件。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import json
+import urllib.request
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from backtest_5d import get_four_dimension_advice
+from data_archive import last_z
+from fetch_guard import CACHE_DIR
+from signal_status import STATUS_LIST, map_status, map_status_array
+from trading_calendar import calendar_for
+
+# --------------------
+# 核心參數
+# --------------------
+ALERT_STATE_FILE = os.path.join(CACHE_DIR, "alert_state.json")
+ALERT_LOG_FILE = os.path.join(CACHE_DIR, "alerts.log")
+ENTRY_STATUSES = {"⭐ 多單進場", "🔻 空單進場"}   # 預設只通報進場訊號
+
+
+# --------------------
+# 輸出端
+# --------------------
+class LogFileSink:
+    """每個事件一行 JSON"""
+
+    def __init__(self, path=ALERT_LOG_FILE):
+        self.path = path
+
+    def emit(self, events):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for e in events:
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """整批 POST JSON；url 可指向本地收集服務做測試"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, events):
+        body = json.dumps({"events": events}, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(req, timeout=self.timeout).close()
+        except Exception as e:
+            print(f"Webhook 傳送失敗 {self.url}: {e}")
+
+
+class MemorySink:
+    """保留最近 maxlen 筆事件，給 Streamlit 面板顯示"""
+
+    def __init__(self, maxlen=200):
+        self.maxlen = maxlen
+        self.events = []
+
+    def emit(self, events):
+        self.events = (self.events + list(events))[-self.maxlen:]
+
+    def frame(self):
+        return pd.DataFrame(self.events[::-1])
+
+
+# --------------------
+# 警示引擎
+# --------------------
+class AlertEngine:
+    def __init__(self, sinks=None, state_file=ALERT_STATE_FILE, watch_statuses=ENTRY_STATUSES):
+        self.sinks = list(sinks or [])
+        self.state_file = state_file
+        self.watch_statuses = watch_statuses
+        self.state = {}   # 代號 -> {"date", "status", "sz", "scz", "final", "prev"}
+        self.sent = set()
+        self.pending = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.state = data.get("state", {})
+        self.sent = {tuple(k) for k in data.get("sent", [])}
+
+    def save(self):
+        # 只保留最近的去重紀錄，避免狀態檔無限成長
+        sent = sorted(self.sent, key=lambda k: k[1])[-5000:]
+        self.sent = set(sent)
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+            with open(self.state_file, "w", encoding="utf-8") as f:
+                json.dump({"state": self.state, "sent": sent}, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def last(self, symbol):
+        return self.state.get(symbol)
+
+    def needs_update(self, symbol, bar_date):
+        """有更新的 K 棒，或同一天的紀錄仍是盤中暫定值"""
+        rec = self.state.get(symbol)
+        if rec is None:
+            return True
+        day = _day(bar_date)
+        return rec["date"] < day or (rec["date"] == day and not rec.get("final", True))
+
+    def update(self, symbol, bar_date, status, slope_z, score_z, final=None, now=None):
+        """記錄一檔最新狀態；回傳產生的事件或 None。final 未指定時依交易日曆判斷是否已定案"""
+        day = _day(bar_date)
+        if final is None:
+            final = not calendar_for(symbol).is_provisional(pd.Timestamp(bar_date), now)
+        rec = self.state.get(symbol)
+        # 同一天重算（暫定 -> 定案）時和前一交易日的狀態比較，而不是和當天的暫定值比較
+        prev = (rec.get("prev") if rec["date"] == day else rec["status"]) if rec else None
+        self.state[symbol] = {"date": day, "status": status,
+                              "sz": round(float(slope_z), 2), "scz": round(float(score_z), 2),
+                              "final": bool(final), "prev": prev}
+        if prev is None or prev == status:
+            return None
+        if self.watch_statuses is not None and status not in self.watch_statuses:
+            return None
+        key = (symbol, day, status, bool(final))
+        if key in self.sent:
+            return None
+        self.sent.add(key)
+        event = {
+            "代號": symbol, "日期": day, "from": prev, "to": status,
+            "Slope_Z": round(float(slope_z), 2), "Score_Z": round(float(score_z), 2),
+            "定案": bool(final),
+            "時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.pending.append(event)
+        return event
+
+    def process(self, symbol, df):
+        """單檔：只有最後一根 K 棒比紀錄新時才計算狀態"""
+        if df is None or df.empty or not self.needs_update(symbol, df.index[-1]):
+            return None
+        op, last, sz, scz = get_four_dimension_advice(df, len(df) - 1)
+        status, _ = map_status(op, sz)
+        return self.update(symbol, df.index[-1], status, sz, scz)
+
+    def process_archive(self, archive, block=512):
+        """整個歷史資料庫的最後一天：只挑有新 K 棒的代號，分塊向量化計算"""
+        last_day = _day(archive.dates[-1])
+        slope = archive.field("Slope")
+        score = archive.field("Score")
+        fresh = [i for i, s in enumerate(archive.symbols)
+                 if self.needs_update(s, last_day)]
+        for b in range(0, len(fresh), block):
+            idx = fresh[b:b + block]
+            # 與 zscore_panel / 回測相同：視窗以有效 K 棒計，停牌日不佔位置
+            sz = last_z(slope[idx])
+            scz = last_z(score[idx])
+            ok = ~np.isnan(sz)
+            codes = map_status_array(np.where(ok, sz, np.nan))
+            for j, i in enumerate(idx):
+                if ok[j]:
+                    self.update(archive.symbols[i], last_day, STATUS_LIST[codes[j]], sz[j], scz[j])
+        return self.flush()
+
+    def flush(self):
+        """把累積的事件送到所有輸出端並存檔"""
+        events, self.pending = self.pending, []
+        if events:
+            for sink in self.sinks:
+                sink.emit(events)
+        self.save()
+        return events
+
+
+# --------------------
+# 工具函式
+# --------------------
+def _day(ts):
+    return pd.Timestamp(ts).strftime("%Y-%m-%d")
+
+
+# --------------------
+# 主程式：收盤後對歷史資料庫跑一次
+# --------------------
+if __name__ == "__main__":
+    import sys
+    from data_archive import Archive
+    engine = AlertEngine(sinks=[LogFileSink()])
+    events = engine.process_archive(Archive(sys.argv[1] if len(sys.argv) > 1 else "archive_tw"))
+    for e in events:
+        print(f"🔔 {e['代號']} {e['日期']}：{e['from']} → {e['to']}（Slope_Z {e['Slope_Z']}, Score_Z {e['Score_Z']}）")
@@ -5,10 +5,10 @@
 # --------------------
 # 套件導入
 # --------------------
-import sys
+import os
+import json
 import warnings
 import logging
-import numpy as np
 import pandas as pd
 from datetime import datetime, date, timedelta
 
@@ -17,6 +17,16 @@ from datetime import datetime, date, timedelta
 # --------------------
 import yfinance as yf
 
+from fetch_guard import guard, classify_failure, last_download_error, print_failure_report, CACHE_DIR
+from bar_cache import cached_download, is_fresh, load as load_cached
+from indicator_graph import calc_indicators
+from fetch_plan import plan_fetch
+from http_client import get_client
+from profiling import profiled
+
+# 設定 SJ_HTTP_BACKEND=<base url>（Yahoo chart API 或 fixture_server.py）改用連線池客戶端
+HTTP_BACKEND = os.environ.get("SJ_HTTP_BACKEND")
+
 # --------------------
 # 從專案 config 導入 WATCH_LIST，沒有時提供備援
 # --------------------
@@ -25,6 +35,8 @@ try:
 except ImportError:
     WATCH_LIST = ["2330", "2454", "AAPL", "NVDA"]  # 備援名單
 
+SYMBOL_MAP_FILE = os.path.join(CACHE_DIR, "tw_symbols.json")
+
 # --------------------
 # 環境與警告設定
 # --------------------
@@ -41,47 +53,123 @@ print(f"分析基準日 base_dt: {base_dt}")
 # --------------------
 # 工具函式
 # --------------------
-def get_slope_poly(series, window=5):
-    if len(series) < window:
-        return 0.0
-    y = series.values[-window:]
-    x = np.arange(window)
-    slope, _ = np.polyfit(x, y, 1)
-    base = y[0] if y[0] != 0 else 1
-    return (slope / base) * 100
 
+def _load_symbol_map():
+    try:
+        with open(SYMBOL_MAP_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_symbol_map = _load_symbol_map()
+
+def _save_symbol_map():
+    # 先併入磁碟上其他程序探測到的代號，再寫暫存檔原子替換（多個掃描子程序同時寫入）
+    try:
+        os.makedirs(os.path.dirname(SYMBOL_MAP_FILE), exist_ok=True)
+        merged = _load_symbol_map()
+        merged.update(_symbol_map)
+        _symbol_map.update(merged)
+        tmp = f"{SYMBOL_MAP_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False)
+        os.replace(tmp, SYMBOL_MAP_FILE)
+    except OSError:
+        pass
+
+@profiled
 def get_taiwan_symbol(symbol: str) -> str:
     s = str(symbol).strip()
     if not s.isdigit():
         return s
+    # 上市 / 上櫃判定結果很少變動，記住後不必每次探測兩次
+    if s in _symbol_map:
+        return _symbol_map[s]
+    # 探測也走負向快取與斷路器；只有確實抓到 K 棒才記住對應。
+    # 兩個後綴都沒資料時可能只是被限流（yfinance 限流時回傳空表），不寫入檔案，下次再探測。
     for suffix in [".TW", ".TWO"]:
+        candidate = f"{s}{suffix}"
+        if guard.check(candidate) is not None:
+            continue
         try:
-            t = yf.Ticker(f"{s}{suffix}")
-            if not t.history(period="1d").empty:
-                return f"{s}{suffix}"
-        except Exception:
+            found = _has_recent_bars(candidate)
+        except Exception as e:
+            guard.record_failure(candidate, classify_failure(exc=e), e)
             continue
+        if found:
+            guard.record_success(candidate)
+            _symbol_map[s] = candidate
+            _save_symbol_map()
+            return candidate
     return f"{s}.TW"
 
+def _download(symbol, start_dt, end_dt):
+    if HTTP_BACKEND:
+        return get_client(HTTP_BACKEND).download(symbol, start_dt, end_dt)
+    return yf.download(symbol, start=start_dt, end=end_dt, progress=False, auto_adjust=True)
+
+def _has_recent_bars(symbol):
+    if HTTP_BACKEND:
+        end = datetime.combine(date.today(), datetime.min.time()) + timedelta(days=1)
+        return not _download(symbol, end - timedelta(days=7), end).empty
+    return not yf.Ticker(symbol).history(period="1d").empty
+
+def _fetch_ohlcv(symbol, start_dt, end_dt, download=_download):
+    if guard.check(symbol) is not None:
+        return None
+    try:
+        df = download(symbol, start_dt, end_dt)
+    except Exception as e:
+        print(f"Error downloading {symbol}: {e}")
+        guard.record_failure(symbol, classify_failure(exc=e), e)
+        return None
+    if df is None or df.empty:
+        msg = None if HTTP_BACKEND else last_download_error(yf, symbol)
+        guard.record_failure(symbol, classify_failure(message=msg), msg or "")
+        return None
+    guard.record_success(symbol)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+def download_ohlcv(symbol, start_dt, end_dt):
+    # 依交易日曆判斷：上次抓取後沒有新 K 棒可能出現時，直接用快取
+    return cached_download(symbol, start_dt, end_dt, _fetch_ohlcv)
+
+def prefetch_ohlcv(plans):
+    """
+    HTTP 後端：依相同區間分組，以批次端點 + pipelining 一次抓完並寫入快取，
+    之後逐檔的 download_ohlcv 直接命中快取。yfinance 後端不做事。
+    """
+    if not HTTP_BACKEND:
+        return
+    groups = {}
+    for p in plans:
+        if guard.check(p.symbol) is None and not is_fresh(load_cached(p.symbol), p.start, p.end):
+            groups.setdefault((p.start, p.end), []).append(p.symbol)
+    client = get_client(HTTP_BACKEND)
+    for (start_dt, end_dt), symbols in groups.items():
+        try:
+            fetched = client.download_many(symbols, start_dt, end_dt)
+        except Exception as e:
+            print(f"Error prefetching {len(symbols)} symbols: {e}")
+            continue
+        for sym, res in fetched.items():
+            def _from_batch(*_, res=res):
+                if isinstance(res, Exception):
+                    raise res
+                return res if res is not None else pd.DataFrame()
+            cached_download(sym, start_dt, end_dt,
+                            lambda s, a, b: _fetch_ohlcv(s, a, b, download=_from_batch))
+
+@profiled
 def get_indicator_data(symbol, start_dt, end_dt):
+    df = download_ohlcv(symbol, start_dt, end_dt)
+    if df is None:
+        return None
     try:
-        df = yf.download(symbol, start=start_dt, end=end_dt, progress=False, auto_adjust=True)
-        if df.empty:
-            return None
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        # PVO
-        ema12_vol = df["Volume"].ewm(span=12, adjust=False).mean()
-        ema26_vol = df["Volume"].ewm(span=26, adjust=False).mean()
-        df["PVO"] = ((ema12_vol - ema26_vol) / (ema26_vol + 1e-6)) * 100
-        # VRI
-        vol_up = df["Volume"].where(df["Close"].diff() > 0, 0)
-        df["VRI"] = (vol_up.rolling(14).mean() / (df["Volume"].rolling(14).mean() + 1e-6)) * 100
-        # Slope
-        df["Slope"] = df["Close"].rolling(5).apply(lambda x: get_slope_poly(x, 5), raw=False)
-        # Score
-        df["Score"] = df["Slope"] * 0.6 + df["PVO"] * 0.2 + df["VRI"] * 0.2
-        return df.dropna()
+        return calc_indicators(df)
     except Exception as e:
         print(f"Error calculating indicators for {symbol}: {e}")
         return None
@@ -110,15 +198,20 @@ def run_analysis(target_date: date, lookback_days: int, limit_count: int):
         target_dt_obj = datetime.combine(target_date, datetime.min.time()) if isinstance(target_date, date) else target_date
 
     end_dt = target_dt_obj + timedelta(days=1)
-    start_dt = end_dt - timedelta(days=lookback_days + 100)  # 多抓資料
 
     tickers = WATCH_LIST[:limit_count]
     results = []
+    guard.reset_report()
+
+    # get_advice 只需 Z 分數視窗；lookback_days 為額外保留的歷史（交易日）
+    plans = {t: plan_fetch("zscore", end_dt, get_taiwan_symbol(t), extra_bars=lookback_days) for t in tickers}
+    prefetch_ohlcv(plans.values())
 
     for t in tickers:
         symbol = get_taiwan_symbol(t)
-        df = get_indicator_data(symbol, start_dt, end_dt)
-        if df is None or len(df) < 20:
+        plan = plans[t]
+        df = get_indicator_data(symbol, plan.start, end_dt)
+        if df is None or len(df) < plan.min_bars:
             continue
         idx = len(df) - 1
         tag, z_slope, z_score = get_advice(df, idx)
@@ -139,7 +232,7 @@ def main():
     today = date.today()
     return run_analysis(
         target_date=today,
-        lookback_days=150,
+        lookback_days=0,
         limit_count=len(WATCH_LIST)
     )
 
@@ -147,3 +240,4 @@ if __name__ == "__main__":
     res_df = main()
     if not res_df.empty:
         print(res_df.drop(columns=['_df']).head())
+    print_failure_report()
@@ -1,27 +1,37 @@
 # ====== 1stock_app.py ======
-import sys
+import os
+import time
 import numpy as np
 import pandas as pd
 import streamlit as st
-import altair as alt
 from datetime import datetime, date, timedelta  # ✅ 加入 timedelta
 
 # ===================================================================
 # 基本時間設定
 # ===================================================================
-LOOKBACK_1Y = 365
 target_date = date.today()
 base_dt = datetime.combine(target_date, datetime.min.time()) if isinstance(target_date, date) else target_date
 end_dt = base_dt + timedelta(days=1)
-start_1y = end_dt - timedelta(days=LOOKBACK_1Y)
 
 # ===================================================================
 # 導入自訂模組
 # ===================================================================
-from analysis_engine import get_indicator_data, get_taiwan_symbol, get_advice
+from analysis_engine import get_indicator_data, get_taiwan_symbol
 from backtest_5d import get_four_dimension_advice
 from config import WATCH_LIST as TAIWAN_LIST
 from configA import WATCH_LIST as US_LIST
+from fetch_guard import guard
+from fetch_plan import plan_fetch
+from signal_status import map_status, STATUS_RANK
+from live_monitor import LiveMonitor, LocalQuoteFeed, YFinanceQuoteFeed
+from chart_utils import build_chart_spec
+from timeframes import TIMEFRAMES, get_timeframe_status
+from alerts import AlertEngine, LogFileSink, MemorySink
+from correlation import RollingCorrelation, returns_from_close, annotate_clusters, CORR_WINDOW
+from scan_history import ScanHistory
+from trend_stability import calc_trend_stability, interpret_trend_stability, calc_last5_trend_series
+from market_scan import run_scan
+from profiling import profiler, ProfileState
 
 # ===================================================================
 # Streamlit UI 設定
@@ -37,88 +47,33 @@ table td {font-size:14px !important;}
 </style>
 """, unsafe_allow_html=True)
 
-# ===================================================================
-# 狀態分類函式
-# ===================================================================
-def map_status(op_text, slope_z):
-    if "做空" in op_text or "空單" in op_text:
-        if slope_z < -1.0:
-            return "🔻 空單進場", 1
-        else:
-            return "⚠️ 空頭觀望", 4
-    if slope_z > 1.5:
-        return "⭐ 多單進場", 1
-    if 0.5 < slope_z <= 1.5:
-        return "✅ 多單續抱", 2
-    if abs(slope_z) <= 0.3:
-        return "⚠️ 空手觀望", 4
-    if slope_z > 0:
-        return "⚠️ 多頭觀望", 4
-    return "⚠️ 空頭觀望", 4
-
-STATUS_RANK = {
-    "⭐ 多單進場": 1,
-    "✅ 多單續抱": 2,
-    "⚠️ 多頭觀望": 3,
-    "⚠️ 空手觀望": 4,
-    "🔻 空單進場": 5,
-    "⚠️ 空頭觀望": 6,
-}
-
-# ===================================================================
-# 20日個股擴散率模組
-# ===================================================================
-def calc_trend_stability(df, window=20):
-    if df is None or len(df) < window + 2:
-        return None, 0, window
-    count_long = 0
-    for i in range(len(df) - window, len(df)):
-        op, last, sz, scz = get_four_dimension_advice(df, i)
-        status, _ = map_status(op, sz)
-        if status in ["⭐ 多單進場", "✅ 多單續抱"]:
-            count_long += 1
-    ratio = round(count_long / window * 100, 1)
-    return ratio, count_long, window
-
-def interpret_trend_stability(ratio):
-    if ratio is None:
-        return "未提供", "—"
-    if ratio > 70:
-        return "🔥 強勢主升段", "可續抱 / 加碼"
-    elif ratio >= 50:
-        return "⭐ 穩定多頭", "正常波段操作"
-    elif ratio >= 30:
-        return "⚠️ 震盪偏多", "低買高賣"
-    elif ratio >= 15:
-        return "🧊 弱勢整理", "觀望為主"
-    else:
-        return "❄️ 空頭或底部", "型態觀察"
-
-# ===================================================================
-# 最近5日擴散率變化
-# ===================================================================
-def calc_last5_trend_series(df, window=20, days=5):
-    series = []
-    if df is None or len(df) < window + days + 2:
-        return series
-    for k in range(days, 0, -1):
-        idx = len(df) - k
-        sub_df = df.iloc[:idx+1]
-        ratio, _, _ = calc_trend_stability(sub_df, window)
-        series.append(ratio)
-    return series
+# 分析器是模組層級的單例，所有使用者共用；開關與統計改放本 session 的 session_state，
+# 每次 rerun 綁定到執行這次腳本的執行緒，不會開到別人的分析或混進別人的報表
+profiler.bind(st.session_state.setdefault("profile_state", ProfileState()))
 
 # ===================================================================
 # 側邊欄選項
 # ===================================================================
 with st.sidebar:
     st.title("🎯 分析模式")
-    mode = st.radio("選擇分析類型", ["單股分析", "台股市場分析", "美股市場分析"])
+    mode = st.radio("選擇分析類型", ["單股分析", "台股市場分析", "美股市場分析", "盤中即時監控"])
     st.divider()
     target_date = st.date_input("分析基準日", date.today())
     st.divider()
     ticker_input = st.text_input("單股代號", "2330")
+    chart_years = st.select_slider("單股圖表區間（年）", [1, 2, 3, 5, 10], value=3)
+    chart_method = st.radio("降採樣方式", ["lttb", "minmax"], horizontal=True)
+    scan_workers = int(os.environ.get("SJ_SCAN_WORKERS", 0))
+    if mode in ["台股市場分析", "美股市場分析"]:
+        scan_workers = st.number_input("掃描子程序數（0 = 本程序）", 0, 16, scan_workers)
+    profile_on = st.checkbox("效能分析模式", profiler.shared.enabled, key="profile_on",
+                             help="逐檔記錄熱點函式耗時（SJ_PROFILE=alloc 時含記憶體配置）")
     run_btn = st.button("開始分析")
+    if mode == "盤中即時監控":
+        st.divider()
+        live_list = st.radio("監控清單", ["台股", "美股"], horizontal=True)
+        live_interval = st.slider("輪詢間隔（秒）", 5, 300, 30)
+        live_local = st.checkbox("使用本地模擬報價", False)
 
 # ===================================================================
 # 工具函式
@@ -143,6 +98,45 @@ def format_price(symbol, price):
         return int(round(price,0))
     return round(price,2)
 
+@st.cache_resource
+def get_alert_engine():
+    # 跨 rerun 共用：保留各檔最後狀態與 UI 面板的事件紀錄
+    return AlertEngine(sinks=[LogFileSink(), MemorySink()])
+
+@st.cache_resource
+def get_scan_history(name):
+    # 每個市場一個只增不改的掃描歷史庫（台股 / 美股）
+    return ScanHistory(name)
+
+@st.cache_resource
+def get_corr_model(name):
+    # 每個市場一份滾動相關矩陣：隔天掃描只推入新的一天，不重算整個視窗
+    return RollingCorrelation()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_chart_spec(symbol, years, end, method):
+    # 以 (代號, 區間, 基準日, 降採樣方式) 為鍵快取，切換元件時不重抓、不重算
+    start = end - timedelta(days=365 * years)
+    df = get_indicator_data(symbol, start, end)
+    if df is None or df.empty:
+        return None
+    return build_chart_spec(df, f"{symbol} 近 {years} 年", method=method)
+
+def show_profile_report():
+    # 只顯示本次分析的統計；同時寫出 report.csv 與 stacks.folded 供離線比較
+    if not profiler.enabled:
+        return
+    report = profiler.report()
+    if report.empty:
+        return
+    with st.expander(f"⏱️ 效能分析（{report['代號'].nunique()} 檔，共 {report['自身秒'].sum():.2f} 秒）"):
+        st.caption("最耗時的代號")
+        st.dataframe(profiler.by_symbol().head(20), use_container_width=True)
+        st.caption("最耗時的（代號, 函式）")
+        st.dataframe(report.head(30), use_container_width=True)
+        report_path, stacks_path = profiler.dump()
+        st.caption(f"已寫出：{report_path}、{stacks_path}")
+
 def calc_market_heat(status_count, total):
     long_cnt = status_count.get("⭐ 多單進場",0) + status_count.get("✅ 多單續抱",0)
     if total == 0:
@@ -154,15 +148,25 @@ def calc_market_heat(status_count, total):
 # ===================================================================
 st.title("🛡️ SJ 四維量價分析系統")
 
+if run_btn:
+    if profile_on:
+        profiler.reset()
+        profiler.enable(track_alloc=os.environ.get("SJ_PROFILE") == "alloc")
+    else:
+        profiler.disable()
+
 # ============================================================
 # 單股分析
 # ============================================================
 if run_btn and mode=="單股分析":
     st.subheader("📌 單股即時分析")
     symbol = get_taiwan_symbol(ticker_input)
-    df = get_indicator_data(symbol, start_1y, end_dt)
-    if df is None or len(df)<150:
-        st.warning("資料不足")
+    # 擴散率 + 近5日變化 + 週 / 月線：區間由指標視窗推導，不再固定抓一年
+    plan = plan_fetch("last5", end_dt, symbol, timeframes=TIMEFRAMES)
+    df = get_indicator_data(symbol, plan.start, end_dt)
+    if df is None or len(df)<plan.min_bars:
+        failures = [r for r in guard.failure_report() if r["代號"] == symbol]
+        st.warning(f"資料不足｜{failures[0]['說明']}" if failures else "資料不足")
     else:
         op, last, sz, scz = get_four_dimension_advice(df,len(df)-1)
         status, _ = map_status(op, sz)
@@ -194,55 +198,66 @@ if run_btn and mode=="單股分析":
         col5.metric("Score_Z", f"{scz:.2f}")
         col6.metric("20日擴散率", f"{trend_ratio}%")
 
+        tf_cols = st.columns(len(TIMEFRAMES))
+        for col, tf in zip(tf_cols, TIMEFRAMES):
+            tf_status, tf_sz, tf_scz = get_timeframe_status(symbol, df, tf)
+            col.metric(f"{tf}線狀態", tf_status, f"Slope_Z {tf_sz:.2f}" if tf_sz is not None else None)
+        st.session_state["chart_symbol"] = symbol
+
+        # 歷次市場掃描紀錄：不必重跑就能查「上次進入多單續抱」
+        for name in ["tw", "us"]:
+            timeline = get_scan_history(name).timeline(ticker_input)
+            if not timeline.empty:
+                with st.expander(f"📜 {ticker_input} 歷史狀態區段（市場掃描紀錄）"):
+                    st.dataframe(timeline.iloc[::-1], use_container_width=True)
+                break
+
+    show_profile_report()
+
+# 圖表不綁「開始分析」按鈕：調整區間 / 降採樣方式時直接從快取重繪
+if mode=="單股分析" and st.session_state.get("chart_symbol"):
+    with st.spinner("繪製圖表..."):
+        spec = cached_chart_spec(st.session_state["chart_symbol"], chart_years, end_dt, chart_method)
+    if spec is not None:
+        st.vega_lite_chart(spec, use_container_width=True)
+
 # ============================================================
 # 市場分析
 # ============================================================
 if run_btn and mode in ["台股市場分析","美股市場分析"]:
     watch = TAIWAN_LIST if mode=="台股市場分析" else US_LIST
 
-    results = []
-    status_count = {}
-    prev_status_count = {}
+    guard.reset_report()
+    alert_engine = get_alert_engine()
+    history_name = "tw" if mode=="台股市場分析" else "us"
+    history = get_scan_history(history_name)
 
-    for sym in watch:
-        symbol = get_taiwan_symbol(sym)
-        df = get_indicator_data(symbol, start_1y, end_dt)
-        if df is None or len(df)<150:
-            continue
-
-        op, last, sz, scz = get_four_dimension_advice(df,len(df)-1)
-        status, _ = map_status(op, sz)
-        curr = df.iloc[-1].to_dict()
+    # 逐檔計算在 market_scan；多程序時結果經 Arrow IPC 記憶體映射檔交回，不經 pickle
+    with st.spinner("市場掃描中..."):
+        scan = run_scan(watch, end_dt, history_name, workers=scan_workers)
+    table = scan.rows.to_pandas() if scan.rows is not None else pd.DataFrame()
+    results = table.drop(columns=["_日期","_定案","_昨日狀態"], errors="ignore")
 
-        trend_ratio, _, _ = calc_trend_stability(df, 20)
-        trend_text, _ = interpret_trend_stability(trend_ratio)
-
-        results.append({
-            "代號": sym,
-            "收盤": format_price(symbol,curr.get("Close",np.nan)),
-            "狀態": status,
-            "PVO": safe_get_value(curr,'PVO',None),
-            "VRI": safe_get_value(curr,'VRI',None),
-            "Slope_Z": round(sz,2),
-            "Score_Z": round(scz,2),
-            "20日擴散率%": trend_ratio,
-            "趨勢解讀": trend_text,
-            "_rank": STATUS_RANK.get(status,99)
-        })
-
-        status_count[status] = status_count.get(status,0)+1
-
-        if len(df)>1:
-            op_prev, _, sz_prev, _ = get_four_dimension_advice(df,len(df)-2)
-            status_prev, _ = map_status(op_prev, sz_prev)
-            prev_status_count[status_prev] = prev_status_count.get(status_prev,0)+1
+    status_count, prev_status_count = {}, {}
+    if not table.empty:
+        status_count = table["狀態"].value_counts().to_dict()
+        prev_status_count = table["_昨日狀態"].dropna().value_counts().to_dict()
+        for sym, day, status, sz, scz in zip(table["代號"], table["_日期"], table["狀態"],
+                                             table["Slope_Z"], table["Score_Z"]):
+            if alert_engine.needs_update(sym, day):
+                alert_engine.update(sym, day, status, sz, scz)
+        scan_day = table["_日期"].max()
+        history.append(scan_day, results.drop(columns=["_rank"]), final=table["_定案"].to_numpy())
 
     heat = calc_market_heat(status_count, len(results))
     st.subheader(f"📊 市場整體強弱分析 ｜ 多單比例 {heat}%")
     st.progress(heat)
 
-    if results:
-        df_show = pd.DataFrame(results)\
+    if not results.empty:
+        # 同群組（報酬高度相關）的訊號視為同一筆交易，標出群組與龍頭
+        returns = returns_from_close(scan.close_panel(tail=CORR_WINDOW+1))
+        corr = get_corr_model(history_name).update(returns).corr()
+        df_show = annotate_clusters(results, returns, corr=corr)\
             .sort_values(["20日擴散率%","_rank"], ascending=[False,True])\
             .drop(columns=["_rank"])
         st.dataframe(df_show, use_container_width=True)
@@ -258,5 +273,70 @@ if run_btn and mode in ["台股市場分析","美股市場分析"]:
             })
         st.subheader("📈 狀態統計")
         st.dataframe(pd.DataFrame(count_rows), use_container_width=True)
+
+        changes = history.diff(scan_day)
+        with st.expander(f"📜 與上次掃描相比狀態改變 {len(changes)} 檔"):
+            if not changes.empty:
+                st.dataframe(changes, use_container_width=True)
+            else:
+                st.caption("沒有狀態改變（或尚無前次紀錄）")
     else:
         st.warning("市場清單沒有可用資料")
+
+    new_events = alert_engine.flush()
+    st.subheader(f"🔔 狀態轉換警示（本次新增 {len(new_events)} 筆）")
+    alert_log = next(k for k in alert_engine.sinks if isinstance(k, MemorySink)).frame()
+    if not alert_log.empty:
+        st.dataframe(alert_log, use_container_width=True)
+    else:
+        st.caption("尚無進場訊號轉換")
+
+    failures = guard.failure_report()
+    if failures:
+        with st.expander(f"⚠️ 資料抓取失敗 {len(failures)} 檔"):
+            st.dataframe(pd.DataFrame(failures), use_container_width=True)
+
+    show_profile_report()
+
+# ============================================================
+# 盤中即時監控
+# ============================================================
+if run_btn and mode=="盤中即時監控":
+    watch = TAIWAN_LIST if live_list=="台股" else US_LIST
+    key = (live_list, live_local)
+    if st.session_state.get("live_key") != key:
+        feed = LocalQuoteFeed() if live_local else YFinanceQuoteFeed()
+        with st.spinner("載入歷史資料..."):
+            st.session_state["live_monitor"] = LiveMonitor(watch, feed=feed, target_date=target_date)
+        st.session_state["live_key"] = key
+    monitor = st.session_state["live_monitor"]
+
+    st.subheader("📡 盤中即時監控（按側邊欄任一按鈕即停止）")
+    count_box = st.empty()
+    changed_box = st.empty()
+    st.caption("監控清單快照")
+    st.dataframe(monitor.table(), use_container_width=True)
+
+    def render_counts(counts):
+        with count_box.container():
+            cols = st.columns(len(STATUS_RANK))
+            for col, k in zip(cols, STATUS_RANK):
+                col.metric(k, counts.get(k, 0))
+
+    def render_diff(diff):
+        render_counts(diff["counts"])
+        changed = monitor.diff_table(diff)
+        with changed_box.container():
+            st.caption(f"🕒 {datetime.now().strftime('%H:%M:%S')} 更新 {len(changed)} 檔")
+            st.dataframe(changed, use_container_width=True)
+            for code, old, new in diff["transitions"]:
+                st.write(f"🔔 {code}：{old} → {new}")
+
+    render_counts(monitor.status_count)
+    while True:
+        if live_local:
+            monitor.feed.tick(monitor.raw, n=3)
+        diff = monitor.step()
+        if diff["changed"]:
+            render_diff(diff)
+        time.sleep(live_interval)
@@ -5,19 +5,18 @@
 # --------------------
 # 套件導入
 # --------------------
-import sys
+import os
 import unicodedata
 import warnings
 import logging
-import numpy as np
-import pandas as pd
 from datetime import datetime, date, timedelta
 
-# --------------------
-# yfinance 與 pandas_ta 導入（假設已安裝）
-# --------------------
-import yfinance as yf
-import pandas_ta as ta
+from fetch_guard import guard, print_failure_report
+from analysis_engine import download_ohlcv, get_taiwan_symbol as resolve_taiwan_symbol
+from data_archive import Archive
+from indicator_graph import calc_indicators
+from fetch_plan import plan_fetch
+from profiling import profiled
 
 # --------------------
 # 屏蔽警告
@@ -33,7 +32,8 @@ WATCH_LIST = ["4576", "3706", "3005", "2313","5347","6239","8046","6438","2337",
               "2375","6173"]
 BENCHMARK_TICKER = "0050.TW"
 TARGET_DATE = "2026-01-12"
-LOOKBACK_DAYS = 360
+SHOW_DAYS = 5  # 輸出最近幾個交易日
+ARCHIVE_PATH = os.environ.get("SJ_ARCHIVE")  # 設定時改由歷史資料庫讀取（見 data_archive.py）
 
 # --------------------
 # 時間初始化
@@ -50,27 +50,14 @@ def align_text(text, width):
     cur_len = sum(2 if unicodedata.east_asian_width(c) in ('W','F','A') else 1 for c in text)
     return text + ' ' * max(0, width - cur_len)
 
-def get_slope_poly(series, window=5):
-    if len(series) < window: return 0
-    y, x = series.values[-window:], np.arange(window)
-    slope, _ = np.polyfit(x, y, 1)
-    return (slope / (y[0] if y[0] != 0 else 1)) * 100
 
 def get_taiwan_symbol(symbol):
-    s = str(symbol).replace('$','').strip()
-    if not s.isdigit(): return s
-    for suffix in [".TW", ".TWO"]:
-        target = f"{s}{suffix}"
-        try:
-            t = yf.Ticker(target)
-            if not t.history(period="1d").empty:
-                return target
-        except: continue
-    return f"{s}.TW"
+    return resolve_taiwan_symbol(str(symbol).replace('$',''))
 
 # --------------------
 # 核心決策引擎
 # --------------------
+@profiled
 def get_four_dimension_advice(df, c_idx):
     window = 60
     hist_slopes = df['Slope'].iloc[max(0,c_idx-window):c_idx+1]
@@ -118,19 +105,13 @@ def get_four_dimension_advice(df, c_idx):
 # --------------------
 # 取得指標資料
 # --------------------
+@profiled
 def get_indicator_data(symbol, start_dt, end_dt):
+    # 下載、快取與失敗防護統一走 analysis_engine.download_ohlcv
+    df = download_ohlcv(symbol, start_dt, end_dt)
+    if df is None: return None
     try:
-        df = yf.download(symbol, start=start_dt, end=end_dt, progress=False, auto_adjust=True)
-        if df is None or df.empty: return None
-        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-        df.columns = [str(c).strip() for c in df.columns]
-        # 使用 pandas_ta 計算 PVO / VRI
-        ev12, ev26 = ta.ema(df['Volume'],12), ta.ema(df['Volume'],26)
-        df['PVO'] = ((ev12-ev26)/(ev26+1e-6))*100
-        df['VRI'] = (ta.sma(df['Volume'].where(df['Close'].diff()>0,0),14)/(ta.sma(df['Volume'],14)+1e-6))*100
-        df['Slope'] = df['Close'].rolling(5).apply(lambda x: get_slope_poly(x,5))
-        df['Score'] = df['PVO']*0.2 + df['VRI']*0.2 + df['Slope']*0.6
-        return df.dropna()
+        return calc_indicators(df)
     except Exception as e:
         print(f"Error fetching data for {symbol}: {e}")
         return None
@@ -141,9 +122,20 @@ def get_indicator_data(symbol, start_dt, end_dt):
 def main():
     print(f"系統訊息：邏輯對齊分析啟動... [目標日: {TARGET_DATE}]\n")
     end_dt = datetime.strptime(TARGET_DATE,"%Y-%m-%d")+timedelta(days=1)
-    start_dt = end_dt - timedelta(days=LOOKBACK_DAYS)
     tickers = [BENCHMARK_TICKER]+WATCH_LIST
-    all_data = {t: get_indicator_data(get_taiwan_symbol(t),start_dt,end_dt) for t in tickers}
+    if ARCHIVE_PATH:
+        # 代號對應取自資料庫的代號清單，不呼叫 get_taiwan_symbol（會連網探測 .TW/.TWO）
+        arc = Archive(ARCHIVE_PATH)
+        symbols = {t: arc.resolve(t) for t in tickers}
+    else:
+        symbols = {t: get_taiwan_symbol(t) for t in tickers}
+    # 最近 SHOW_DAYS 天都要完整回溯：區間依各檔交易日曆推算
+    plans = {t: plan_fetch("advice",end_dt,symbols[t] or t,extra_bars=SHOW_DAYS-1) for t in tickers}
+    guard.reset_report()
+    if ARCHIVE_PATH:
+        all_data = {t: arc.frame(symbols[t],plans[t].start,end_dt).dropna() if symbols[t] else None for t in tickers}
+    else:
+        all_data = {t: get_indicator_data(symbols[t],plans[t].start,end_dt) for t in tickers}
 
     w={"n":8,"d":12,"last":16,"a":10,"st":12,"o":16,"num":10}
     header=["名稱","日期","前次行動","建議","PVO狀態","VRI狀態","操作建議","現價","PVO","VRI","斜率%","斜率Z","評分","評分Z"]
@@ -154,9 +146,9 @@ def main():
     print(h_str)
 
     for ticker, df in all_data.items():
-        if df is None or len(df)<5: continue
+        if df is None or len(df)<SHOW_DAYS: continue
         name = ticker.split('.')[0]
-        for i in reversed(range(5)):
+        for i in reversed(range(SHOW_DAYS)):
             c_idx = len(df)-1-i
             if c_idx<2: continue
             day, prev = df.iloc[c_idx], df.iloc[c_idx-1]
@@ -177,6 +169,7 @@ def main():
                 r_str+=align_text(r,width)
             print(r_str)
         print("-"*175)
+    print_failure_report()
 
 if __name__=="__main__":
     main()
@@ -0,0 +1,94 @@
+# =====================================================
+# SJ 日 K 快取 - 依交易日曆判斷是否需要重抓
+# =====================================================
+# 每檔保存最後一次下載的 OHLCV 與「最後一根定案 K 棒」日期。
+# 之後的請求若在該日期之後、請求區間之內沒有任何已開盤的交易日，
+# 直接回傳快取，不碰網路；週末與休市日開啟 app 因此是零網路 I/O。
+# 盤中尚未收盤的 K 棒視為暫定：不算定案，但 PROVISIONAL_TTL 內不重複抓取。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import time
+import pandas as pd
+
+from fetch_guard import CACHE_DIR
+from trading_calendar import calendar_for
+
+# --------------------
+# 核心參數
+# --------------------
+BAR_CACHE_DIR = os.path.join(CACHE_DIR, "ohlcv")
+PROVISIONAL_TTL = 5 * 60  # 秒；盤中暫定 K 棒的重抓間隔
+
+_memory = {}
+
+
+def _path(symbol):
+    safe = "".join(c if c.isalnum() or c in ".-_" else "_" for c in str(symbol))
+    return os.path.join(BAR_CACHE_DIR, f"{safe}.pkl")
+
+
+def load(symbol):
+    if symbol in _memory:
+        return _memory[symbol]
+    try:
+        entry = pd.read_pickle(_path(symbol))
+    except Exception:
+        return None
+    _memory[symbol] = entry
+    return entry
+
+
+def save(symbol, entry):
+    _memory[symbol] = entry
+    try:
+        os.makedirs(BAR_CACHE_DIR, exist_ok=True)
+        pd.to_pickle(entry, _path(symbol))
+    except OSError:
+        pass
+
+
+def _slice(df, start_dt, end_dt):
+    idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    mask = (idx >= pd.Timestamp(start_dt)) & (idx < pd.Timestamp(end_dt))
+    return df.loc[mask].copy()
+
+
+def is_fresh(entry, start_dt, end_dt, now=None):
+    """快取是否足以回答 [start_dt, end_dt) 的請求"""
+    if entry is None or pd.Timestamp(start_dt) < entry["req_start"]:
+        return False
+    cal = calendar_for(entry["symbol"])
+    pending = cal.pending_sessions(entry["last_final"], end_dt, now)
+    if not pending:
+        return True
+    # 唯一未定案的是上次抓到的那根盤中 K 棒：短時間內沿用
+    return (pending == [entry["last_bar"]]
+            and time.time() - entry["fetched_at"] < PROVISIONAL_TTL)
+
+
+def cached_download(symbol, start_dt, end_dt, fetch, now=None):
+    """fetch(symbol, start_dt, end_dt) -> DataFrame 或 None；失敗結果不快取"""
+    entry = load(symbol)
+    if is_fresh(entry, start_dt, end_dt, now):
+        return _slice(entry["df"], start_dt, end_dt)
+    df = fetch(symbol, start_dt, end_dt)
+    if df is None or df.empty:
+        return df
+    cal = calendar_for(symbol)
+    last_bar = pd.Timestamp(df.index[-1]).date()
+    if cal.is_provisional(last_bar, now):
+        last_final = df.index[-2].date() if len(df) > 1 else cal.prev_session(last_bar)
+    else:
+        last_final = last_bar
+    save(symbol, {
+        "symbol": symbol,
+        "df": df,
+        "req_start": pd.Timestamp(start_dt),
+        "last_bar": last_bar,
+        "last_final": last_final,
+        "fetched_at": time.time(),
+    })
+    return df.copy()
@@ -0,0 +1,132 @@
+# =====================================================
+# SJ 單股圖表 - 伺服器端降採樣 + 狀態色帶
+# =====================================================
+# 多年期走勢不必把每根 K 棒送到瀏覽器：每條線先以 LTTB（或每像素區間 min/max）
+# 降到數千點以內，再組成 Vega-Lite 規格（dict），方便由 st.cache_data 快取。
+
+# --------------------
+# 套件導入
+# --------------------
+import numpy as np
+import pandas as pd
+import altair as alt
+
+from data_archive import rolling_z
+from signal_status import STATUS_LIST, map_status_array
+
+# --------------------
+# 核心參數
+# --------------------
+MAX_POINTS = 600    # 每條線最多送出的點數（5 條線合計約 3,000 點）
+STATUS_COLORS = ["#d62728", "#ff7f0e", "#ffbb78", "#c7c7c7", "#1f77b4", "#9edae5"]
+PANELS = [
+    ("Close", "收盤價"),
+    ("PVO", "PVO"),
+    ("VRI", "VRI"),
+    ("Slope", "Slope%"),
+    ("Slope_Z", "Slope_Z"),
+]
+
+
+# --------------------
+# 降採樣
+# --------------------
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets，回傳保留點的索引"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        cx = x[nxt_lo:nxt_hi].mean()
+        cy = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_downsample(y, n_buckets):
+    """每個區間保留最小與最大值（依時間順序），另保留首尾兩點讓線條涵蓋完整日期，回傳索引"""
+    n = len(y)
+    if n <= n_buckets * 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    lo = np.minimum.reduceat(y, edges[:-1])
+    hi = np.maximum.reduceat(y, edges[:-1])
+    keep = [0]
+    for i in range(n_buckets):
+        seg = y[edges[i]:edges[i + 1]]
+        i_lo = edges[i] + int(np.flatnonzero(seg == lo[i])[0])
+        i_hi = edges[i] + int(np.flatnonzero(seg == hi[i])[0])
+        keep.extend(sorted({i_lo, i_hi}))
+    keep.append(n - 1)
+    return np.unique(keep)
+
+
+def downsample(series, max_points=MAX_POINTS, method="lttb"):
+    s = series.dropna()
+    if len(s) <= max_points:
+        return s
+    if method == "minmax":
+        idx = minmax_downsample(s.to_numpy(), (max_points - 2) // 2)
+    else:
+        idx = lttb(s.index.asi8, s.to_numpy(), max_points)
+    return s.iloc[idx]
+
+
+# --------------------
+# 狀態色帶
+# --------------------
+def status_bands(df):
+    """把每日 map_status 狀態壓成連續區段 (start, end, 狀態)，同時回傳 Slope_Z 序列"""
+    sz = rolling_z(df["Slope"].to_numpy()[None, :])[0]
+    codes = map_status_array(sz)
+    if len(codes) == 0:
+        return pd.DataFrame(columns=["start", "end", "狀態"]), pd.Series(sz, index=df.index)
+    cut = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.r_[0, cut]
+    ends = np.r_[cut, len(codes)] - 1
+    dates = df.index
+    bands = pd.DataFrame({
+        "start": dates[starts],
+        "end": dates[np.minimum(ends + 1, len(dates) - 1)],
+        "狀態": [STATUS_LIST[c] if c >= 0 else "—" for c in codes[starts]],
+    })
+    return bands[bands["狀態"] != "—"], pd.Series(sz, index=dates)
+
+
+# --------------------
+# 圖表規格
+# --------------------
+def build_chart_spec(df, title="", max_points=MAX_POINTS, method="lttb", width=900):
+    """回傳 Vega-Lite dict；df 需含 Close / PVO / VRI / Slope"""
+    bands, slope_z = status_bands(df)
+    df = df.assign(Slope_Z=slope_z)
+    color = alt.Color("狀態:N", scale=alt.Scale(domain=STATUS_LIST, range=STATUS_COLORS),
+                      legend=alt.Legend(orient="top", title=None))
+    band_layer = alt.Chart(bands).mark_rect(opacity=0.15).encode(
+        x="start:T", x2="end:T", color=color)
+
+    charts = []
+    for col, label in PANELS:
+        pts = downsample(df[col], max_points, method)
+        data = pd.DataFrame({"date": pts.index, "value": pts.to_numpy()})
+        line = alt.Chart(data).mark_line(strokeWidth=1, color="#333").encode(
+            x=alt.X("date:T", title=None),
+            y=alt.Y("value:Q", title=label, scale=alt.Scale(zero=False)),
+            tooltip=[alt.Tooltip("date:T", title="日期"), alt.Tooltip("value:Q", title=label, format=".2f")],
+        )
+        height = 220 if col == "Close" else 110
+        charts.append(alt.layer(band_layer, line).properties(width=width, height=height))
+
+    chart = alt.vconcat(*charts, title=title).resolve_scale(x="shared")
+    return chart.to_dict()
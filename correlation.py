@@ -0,0 +1,178 @@
+# =====================================================
+# SJ 相關性分群 - 分塊滾動相關矩陣 + 階層式分群
+# =====================================================
+# 強勢日半個半導體清單一起亮「⭐ 多單進場」，其實是同一筆交易。
+# 這裡用報酬面板算滾動相關矩陣（分塊 B×B 計算，控制暫存記憶體），
+# 再做階層式分群，標出每個群組的「龍頭」。
+# 新增一天只需對累積量做一次秩 2 更新（加入新的一天、移除最舊的一天），不必重算整個視窗。
+
+# --------------------
+# 套件導入
+# --------------------
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+
+# --------------------
+# 核心參數
+# --------------------
+CORR_WINDOW = 60
+BLOCK = 256
+CLUSTER_THRESHOLD = 0.6   # 距離 sqrt(2(1-ρ)) 的切點；約等於 ρ >= 0.82 併成一群
+REFIT_EVERY = 250         # 增量更新累積誤差，定期整段重算
+
+
+# --------------------
+# 分塊相關矩陣
+# --------------------
+def blocked_corr(returns, block=BLOCK, dtype=np.float32):
+    """returns：(日期, 代號)；NaN 視為 0 報酬。輸出 (代號, 代號) 相關矩陣"""
+    x = np.nan_to_num(np.asarray(returns, dtype=float))
+    x = x - x.mean(axis=0)
+    norm = np.sqrt((x ** 2).sum(axis=0))
+    x = np.divide(x, norm, out=np.zeros_like(x), where=norm > 0)
+    n = x.shape[1]
+    out = np.empty((n, n), dtype=dtype)
+    for i in range(0, n, block):
+        xi = x[:, i:i + block]
+        for j in range(i, n, block):
+            tile = xi.T @ x[:, j:j + block]
+            out[i:i + block, j:j + block] = tile
+            if j != i:
+                out[j:j + block, i:i + block] = tile.T
+    np.fill_diagonal(out, 1.0)
+    return out
+
+
+class RollingCorrelation:
+    """維護視窗內 Σx、ΣxxT，每推入一天 O(N²) 更新"""
+
+    def __init__(self, window=CORR_WINDOW, block=BLOCK):
+        self.window = window
+        self.block = block
+        self.rows = deque()
+        self.s = None
+        self.p = None
+        self.pushes = 0
+        self.columns = None   # update() 使用：代號順序與最後一天
+        self.last = None
+
+    def fit(self, returns):
+        x = np.nan_to_num(np.asarray(returns, dtype=float))[-self.window:]
+        self.rows = deque(x)
+        self.s = x.sum(axis=0)
+        n = x.shape[1]
+        self.p = np.empty((n, n))
+        for i in range(0, n, self.block):
+            self.p[i:i + self.block] = x[:, i:i + self.block].T @ x
+        self.pushes = 0
+        return self
+
+    def push(self, row):
+        row = np.nan_to_num(np.asarray(row, dtype=float))
+        if self.s is None:
+            return self.fit(row[None, :])
+        self.pushes += 1
+        if self.pushes >= REFIT_EVERY:
+            return self.fit(np.vstack(list(self.rows) + [row]))
+        self.rows.append(row)
+        self.s += row
+        for i in range(0, len(row), self.block):
+            self.p[i:i + self.block] += np.outer(row[i:i + self.block], row)
+        if len(self.rows) > self.window:
+            old = self.rows.popleft()
+            self.s -= old
+            for i in range(0, len(old), self.block):
+                self.p[i:i + self.block] -= np.outer(old[i:i + self.block], old)
+        return self
+
+    def update(self, returns):
+        """
+        returns：(日期, 代號) DataFrame。代號相同且接續上次的最後一天時只推入新的日期；
+        代號改變、接不上、或最後一天的報酬被改寫（盤中暫定 K 棒）時整段重算。
+        """
+        cols = list(returns.columns)
+        x = np.nan_to_num(returns.to_numpy(dtype=float))
+        fresh = (self.s is None or cols != self.columns or self.last not in returns.index
+                 or not np.array_equal(self.rows[-1], x[returns.index.get_loc(self.last)]))
+        if fresh:
+            self.fit(x)
+        else:
+            for row in x[returns.index > self.last]:
+                self.push(row)
+        self.columns = cols
+        self.last = returns.index[-1]
+        return self
+
+    def corr(self, dtype=np.float32):
+        w = len(self.rows)
+        mean = self.s / w
+        var = np.maximum(np.diag(self.p) / w - mean ** 2, 0)
+        std = np.sqrt(var)
+        n = len(mean)
+        out = np.empty((n, n), dtype=dtype)
+        for i in range(0, n, self.block):
+            sl = slice(i, i + self.block)
+            cov = self.p[sl] / w - np.outer(mean[sl], mean)
+            den = np.outer(std[sl], std)
+            out[sl] = np.divide(cov, den, out=np.zeros_like(cov), where=den > 0)
+        np.fill_diagonal(out, 1.0)
+        return out
+
+
+# --------------------
+# 階層式分群
+# --------------------
+def cluster_labels(corr, threshold=CLUSTER_THRESHOLD, method="average"):
+    """距離 sqrt(2(1-ρ))，average linkage；回傳從 1 起算的群組編號"""
+    n = corr.shape[0]
+    if n < 2:
+        return np.ones(n, dtype=int)
+    dist = np.sqrt(np.clip(2.0 * (1.0 - np.asarray(corr, dtype=float)), 0, None))
+    np.fill_diagonal(dist, 0.0)
+    z = linkage(squareform(dist, checks=False), method=method)
+    return fcluster(z, t=threshold, criterion="distance")
+
+
+def returns_from_close(close, window=CORR_WINDOW):
+    """(日期, 代號) 收盤價面板 -> 最近 window 日的報酬面板"""
+    return close.sort_index().pct_change().iloc[1:].tail(window)
+
+
+def returns_panel(frames, window=CORR_WINDOW):
+    """{代號: 含 Close 的 DataFrame} -> 最近 window 日的報酬面板"""
+    close = pd.DataFrame({k: v["Close"] for k, v in frames.items() if v is not None and len(v) > 1})
+    return returns_from_close(close, window)
+
+
+def annotate_clusters(table, returns, code_col="代號", rank_cols=("_rank", "Score_Z"),
+                      threshold=CLUSTER_THRESHOLD, corr=None):
+    """
+    在市場表加上「群組」與「群組龍頭」欄位。
+    龍頭為群組內排序最前的一檔（預設依 _rank 升冪、Score_Z 降冪）。
+    corr：與 returns.columns 對齊的相關矩陣（例如 RollingCorrelation.corr()），未給時由 returns 重算。
+    """
+    table = table.copy()
+    codes = [c for c in dict.fromkeys(table[code_col]) if c in returns.columns]
+    if len(codes) < 2:
+        table["群組"], table["群組龍頭"] = "", ""
+        return table
+    if corr is None:
+        corr = blocked_corr(returns[codes].to_numpy())
+    else:
+        idx = returns.columns.get_indexer(codes)
+        corr = np.asarray(corr)[np.ix_(idx, idx)]
+    labels = cluster_labels(corr, threshold)
+    label_of = dict(zip(codes, labels))
+    size_of = pd.Series(labels).value_counts().to_dict()
+    table["_cluster"] = table[code_col].map(label_of)
+    ordered = table.sort_values(list(rank_cols), ascending=[True, False])
+    leader_of = ordered.dropna(subset=["_cluster"]).groupby("_cluster")[code_col].first().to_dict()
+    table["群組"] = table["_cluster"].map(
+        lambda c: f"G{int(c)}（{size_of[c]}檔）" if pd.notna(c) else "")
+    table["群組龍頭"] = table["_cluster"].map(
+        lambda c: leader_of.get(c, "") if pd.notna(c) and size_of[c] > 1 else "")
+    return table.drop(columns=["_cluster"])
@@ -0,0 +1,329 @@
+# =====================================================
+# SJ 歷史資料庫 - 記憶體映射的多年期面板
+# =====================================================
+# 目錄格式：
+#   meta.json          日期軸、代號索引、欄位清單
+#   <欄位>.npy         float32，形狀 (代號數, 日期數)，依日期對齊，缺值為 NaN
+# 每個欄位以 np.load(mmap_mode="r") 開啟，切片皆為 view，不會整包讀進記憶體。
+# 10 年 × 2,000 檔 × 9 欄 約 180 MB，16 GB 機器可直接做全市場研究。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime, date, timedelta
+
+from signal_status import STATUS_LIST, map_status_array
+from trading_calendar import calendar_for
+
+# --------------------
+# 核心參數
+# --------------------
+OHLCV_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+INDICATOR_FIELDS = ["PVO", "VRI", "Slope", "Score"]
+ALL_FIELDS = OHLCV_FIELDS + INDICATOR_FIELDS
+DTYPE = np.float32
+Z_WINDOW = 60          # 與 get_four_dimension_advice 相同：iloc[idx-60 : idx+1]
+SYMBOL_BLOCK = 256     # 面板運算每次處理的代號數，限制暫存記憶體
+
+
+# --------------------
+# 寫入
+# --------------------
+class ArchiveWriter:
+    """預先配置日期對齊的 .npy 檔，逐檔寫入，完成後剔除全體無資料的日期"""
+
+    def __init__(self, path, symbols, dates, fields=ALL_FIELDS):
+        self.path = path
+        self.symbols = list(dict.fromkeys(symbols))
+        self.dates = pd.DatetimeIndex(dates).normalize().unique().sort_values()
+        self.fields = list(fields)
+        self.sym_idx = {s: i for i, s in enumerate(self.symbols)}
+        os.makedirs(path, exist_ok=True)
+        shape = (len(self.symbols), len(self.dates))
+        self.arrays = {}
+        for f in self.fields:
+            arr = np.lib.format.open_memmap(self._file(f), mode="w+", dtype=DTYPE, shape=shape)
+            arr[:] = np.nan
+            self.arrays[f] = arr
+
+    def _file(self, field):
+        return os.path.join(self.path, f"{field}.npy")
+
+    def write_symbol(self, symbol, df):
+        if df is None or df.empty:
+            return False
+        i = self.sym_idx[symbol]
+        df = df.copy()
+        df.index = pd.DatetimeIndex(df.index).tz_localize(None).normalize()
+        pos = self.dates.get_indexer(df.index)
+        ok = pos >= 0
+        if not ok.all():
+            # 日期軸來自交易日曆；日曆外的 K 棒代表休市日表或補行交易日表過期
+            off = df.index[~ok]
+            print(f"⚠️ {symbol} 有 {len(off)} 根 K 棒不在交易日曆上（{off[0].date()}…），已略過")
+        for f in self.fields:
+            if f in df.columns:
+                self.arrays[f][i, pos[ok]] = df[f].to_numpy(dtype=DTYPE)[ok]
+        return True
+
+    def close(self):
+        # 剔除所有代號都沒有 K 棒的日期（假日），逐列搬移避免整包讀入
+        close = self.arrays["Close"] if "Close" in self.arrays else next(iter(self.arrays.values()))
+        has_bar = np.zeros(len(self.dates), dtype=bool)
+        for s in range(0, len(self.symbols), SYMBOL_BLOCK):
+            has_bar |= ~np.isnan(close[s:s + SYMBOL_BLOCK]).all(axis=0)
+        keep = np.flatnonzero(has_bar)
+        if len(keep) < len(self.dates):
+            for f in self.fields:
+                src = self.arrays[f]
+                tmp = self._file(f) + ".tmp"
+                dst = np.lib.format.open_memmap(tmp, mode="w+", dtype=DTYPE,
+                                                shape=(len(self.symbols), len(keep)))
+                for s in range(0, len(self.symbols), SYMBOL_BLOCK):
+                    dst[s:s + SYMBOL_BLOCK] = src[s:s + SYMBOL_BLOCK][:, keep]
+                dst.flush()
+                del dst, src
+                self.arrays[f] = None
+                os.replace(tmp, self._file(f))
+        else:
+            for arr in self.arrays.values():
+                arr.flush()
+        meta = {
+            "dates": [d.strftime("%Y-%m-%d") for d in self.dates[keep]],
+            "symbols": self.symbols,
+            "fields": self.fields,
+            "dtype": np.dtype(DTYPE).name,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        self.arrays = {}
+
+
+# --------------------
+# 讀取
+# --------------------
+class Archive:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.dates = pd.DatetimeIndex(self.meta["dates"])
+        self.symbols = self.meta["symbols"]
+        self.fields = self.meta["fields"]
+        self.sym_idx = {s: i for i, s in enumerate(self.symbols)}
+        self._arrays = {}
+
+    def resolve(self, code):
+        """在建檔時的代號清單中找出 code 對應的代號（不連網）；找不到回傳 None"""
+        raw = str(code).replace('$', '').strip()
+        code = raw.upper()
+        base = code.split('.')[0] if code.endswith((".TW", ".TWO")) else code
+        for s in (raw, code, base, f"{base}.TW", f"{base}.TWO"):
+            if s in self.sym_idx:
+                return s
+        return None
+
+    def field(self, name):
+        """整個欄位的記憶體映射陣列 (代號數, 日期數)"""
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def date_slice(self, start=None, end=None):
+        d0 = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side="left")
+        d1 = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side="right")
+        return slice(d0, d1)
+
+    def panel(self, name, start=None, end=None, symbols=None):
+        """回傳 (代號, 日期) 面板；symbols 為 None 或連續區段時是零複製 view"""
+        ds = self.date_slice(start, end)
+        arr = self.field(name)
+        if symbols is None:
+            return arr[:, ds]
+        if isinstance(symbols, slice):
+            return arr[symbols, ds]
+        return arr[[self.sym_idx[s] for s in symbols], ds]
+
+    def series(self, name, symbol, start=None, end=None):
+        """單一代號的時間序列 view"""
+        return self.field(name)[self.sym_idx[symbol], self.date_slice(start, end)]
+
+    def frame(self, symbol, start=None, end=None, fields=None):
+        """組回與 get_indicator_data 相同欄位的 DataFrame（僅此檔，剔除無 K 棒日）"""
+        ds = self.date_slice(start, end)
+        fields = fields or self.fields
+        data = {f: self.field(f)[self.sym_idx[symbol], ds] for f in fields}
+        df = pd.DataFrame(data, index=self.dates[ds])
+        return df.dropna(subset=["Close"]) if "Close" in df else df
+
+
+# --------------------
+# 面板運算（依代號分塊，每塊只讀需要的日期區段）
+# --------------------
+def rolling_z(block, window=Z_WINDOW):
+    """沿日期軸計算 (x - mean) / (std + 1e-6)，視窗含當日共 window+1 筆「有效 K 棒」
+
+    停牌日（NaN）不佔視窗位置：各代號先把有效值靠左壓緊再做 rolling，
+    結果與逐檔 dropna 後的 get_four_dimension_advice 一致。
+    """
+    arr = np.asarray(block, dtype=float)
+    valid = ~np.isnan(arr)
+    rank = np.cumsum(valid, axis=1) - 1
+    rows = np.broadcast_to(np.arange(arr.shape[0])[:, None], arr.shape)
+    compact = np.full(arr.shape, np.nan)
+    compact[rows[valid], rank[valid]] = arr[valid]
+    df = pd.DataFrame(compact.T)
+    r = df.rolling(window + 1, min_periods=1)
+    zc = ((df - r.mean()) / (r.std() + 1e-6)).to_numpy().T
+    z = np.full(arr.shape, np.nan)
+    z[valid] = zc[rows[valid], rank[valid]]
+    return z
+
+
+def _warmup_start(view, start, warmup):
+    """往前找到每檔在 start 之前都有 warmup 根有效 K 棒的位置（停牌越久，往前讀越多）"""
+    d0 = max(0, start - warmup)
+    while d0 > 0:
+        n_valid = (~np.isnan(np.asarray(view[:, d0:start], dtype=float))).sum(axis=1)
+        short = np.flatnonzero(n_valid < warmup)
+        if not len(short):
+            break
+        # 更早沒有資料的代號（新上市）往前讀也補不到
+        if np.isnan(np.asarray(view[short, :d0], dtype=float)).all():
+            break
+        d0 = max(0, d0 - warmup)
+    return d0
+
+
+def last_z(view, window=Z_WINDOW):
+    """每列最後一天的 z 分數（視窗以有效 K 棒計，同 zscore_panel）；最後一天無資料為 NaN"""
+    view = np.asarray(view, dtype=float)
+    d0 = _warmup_start(view, view.shape[1] - 1, window)
+    return rolling_z(view[:, d0:], window)[:, -1]
+
+
+def iter_blocks(archive, fields, start=None, end=None, warmup=Z_WINDOW, block=SYMBOL_BLOCK):
+    """依代號分塊產生 (代號區段, {欄位: view}, 暖機長度)；暖機以有效 K 棒計"""
+    ds = archive.date_slice(start, end)
+    for s in range(0, len(archive.symbols), block):
+        sl = slice(s, min(s + block, len(archive.symbols)))
+        d0 = _warmup_start(archive.field(fields[0])[sl], ds.start, warmup)
+        yield sl, {f: archive.field(f)[sl, d0:ds.stop] for f in fields}, ds.start - d0
+
+
+def zscore_panel(archive, field, start=None, end=None, dtype=DTYPE):
+    """每日每檔相對於前 60 日（含當日）的 z 分數，無資料為 NaN"""
+    ds = archive.date_slice(start, end)
+    out = np.full((len(archive.symbols), ds.stop - ds.start), np.nan, dtype=dtype)
+    for sl, v, skip in iter_blocks(archive, [field], start, end):
+        raw = np.asarray(v[field], dtype=float)
+        z = rolling_z(raw)[:, skip:]
+        z[np.isnan(raw[:, skip:])] = np.nan
+        out[sl] = z
+    return out
+
+
+def status_panel(archive, start=None, end=None):
+    """每日每檔的 map_status 狀態碼 (STATUS_LIST 索引，-1 為無資料)"""
+    sz = zscore_panel(archive, "Slope", start, end, dtype=float)
+    return map_status_array(sz).astype(np.int8)
+
+
+def market_breadth(archive, start=None, end=None):
+    """每日各狀態檔數與多單比例（同 app.py calc_market_heat）"""
+    codes = status_panel(archive, start, end)
+    ds = archive.date_slice(start, end)
+    counts = {k: (codes == i).sum(axis=0) for i, k in enumerate(STATUS_LIST)}
+    df = pd.DataFrame(counts, index=archive.dates[ds])
+    total = (codes >= 0).sum(axis=0)
+    long_cnt = df["⭐ 多單進場"] + df["✅ 多單續抱"]
+    df["多單比例%"] = np.where(total > 0, (long_cnt / np.maximum(total, 1) * 100).astype(int), 0)
+    df["有效檔數"] = total
+    return df
+
+
+def signal_forward_returns(archive, start=None, end=None, horizon=5):
+    """各狀態訊號出現後 horizon 日的報酬統計"""
+    ds = archive.date_slice(start, end)
+    sums = np.zeros(len(STATUS_LIST))
+    sq = np.zeros(len(STATUS_LIST))
+    wins = np.zeros(len(STATUS_LIST))
+    cnt = np.zeros(len(STATUS_LIST))
+    close_all = archive.field("Close")
+    for sl, v, skip in iter_blocks(archive, ["Slope"], start, end):
+        sz = rolling_z(v["Slope"])[:, skip:]
+        sz[np.isnan(np.asarray(v["Slope"], dtype=float)[:, skip:])] = np.nan
+        codes = map_status_array(sz)
+        stop = min(ds.stop + horizon, close_all.shape[1])
+        close = np.asarray(close_all[sl, ds.start:stop], dtype=float)
+        fwd = np.full(codes.shape, np.nan)
+        n = close.shape[1] - horizon
+        if n > 0:
+            fwd[:, :n] = close[:, horizon:horizon + n] / close[:, :n] - 1
+        for i in range(len(STATUS_LIST)):
+            r = fwd[(codes == i) & ~np.isnan(fwd)]
+            cnt[i] += len(r)
+            sums[i] += r.sum()
+            sq[i] += (r ** 2).sum()
+            wins[i] += (r > 0).sum()
+    mean = np.divide(sums, cnt, out=np.full_like(sums, np.nan), where=cnt > 0)
+    var = np.divide(sq, cnt, out=np.full_like(sq, np.nan), where=cnt > 0) - mean ** 2
+    return pd.DataFrame({
+        "狀態": STATUS_LIST,
+        "訊號數": cnt.astype(int),
+        f"{horizon}日平均報酬%": np.round(mean * 100, 2),
+        "標準差%": np.round(np.sqrt(np.maximum(var, 0)) * 100, 2),
+        "勝率%": np.round(np.divide(wins, cnt, out=np.full_like(wins, np.nan), where=cnt > 0) * 100, 1),
+    })
+
+
+# --------------------
+# 建檔
+# --------------------
+def build_archive(path, codes, start_dt, end_dt, loader=None, compute=None):
+    """loader(代號, start, end) -> OHLCV；compute(df) -> 含指標的 df"""
+    if loader is None or compute is None:
+        from analysis_engine import download_ohlcv, calc_indicators, get_taiwan_symbol
+        loader = loader or (lambda c, s, e: download_ohlcv(get_taiwan_symbol(c), s, e))
+        compute = compute or calc_indicators
+    # 日期軸取各代號交易日曆的聯集：剔除休市日、保留週六補行交易日
+    calendars = {calendar_for(c).name: calendar_for(c) for c in codes}
+    dates = sorted(set().union(*(cal.sessions(start_dt, end_dt) for cal in calendars.values())))
+    writer = ArchiveWriter(path, codes, dates)
+    n_ok = 0
+    for code in writer.symbols:
+        raw = loader(code, start_dt, end_dt)
+        if raw is None or raw.empty:
+            continue
+        try:
+            df = compute(raw)
+        except Exception as e:
+            print(f"Error calculating indicators for {code}: {e}")
+            continue
+        # OHLCV 保留完整歷史，指標為 dropna 後的區段
+        df = raw[OHLCV_FIELDS].join(df[INDICATOR_FIELDS], how="left")
+        n_ok += writer.write_symbol(code, df)
+    writer.close()
+    print(f"歷史資料庫完成：{path}（{n_ok}/{len(writer.symbols)} 檔）")
+    return Archive(path)
+
+
+# --------------------
+# 主程式
+# --------------------
+if __name__ == "__main__":
+    # python data_archive.py <目錄> [年數]
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else "archive_tw"
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    from config import WATCH_LIST
+    end_dt = datetime.combine(date.today(), datetime.min.time()) + timedelta(days=1)
+    start_dt = end_dt - timedelta(days=365 * years)
+    arc = build_archive(out_dir, WATCH_LIST, start_dt, end_dt)
+    print(market_breadth(arc).tail())
+    print(signal_forward_returns(arc))
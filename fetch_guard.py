@@ -0,0 +1,286 @@
+# =====================================================
+# SJ 資料抓取防護 - 負向快取 + 斷路器
+# =====================================================
+# 下市 / 打錯的代號（例如 backtest_5d 的 "ASPI"）以及 yfinance 限流，
+# 每次掃描都會整段等到逾時。這裡記住失敗的代號與原因（附到期時間），
+# 並在整體錯誤率飆高時暫停請求，避免繼續轟炸資料源。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+# --------------------
+# 核心參數
+# --------------------
+CACHE_DIR = os.environ.get("SJ_CACHE_DIR", ".sj_cache")
+NEGATIVE_CACHE_FILE = os.path.join(CACHE_DIR, "negative_cache.json")
+
+# 各失敗原因的負向快取存活秒數
+NEGATIVE_TTL = {
+    "empty": 15 * 60,        # 無資料：下市 / 代號錯誤，但 yfinance 限流時也回空表，先短後長
+    "not_found": 24 * 3600,  # 資料源明確回報查無此代號
+    "throttled": 10 * 60,    # 限流（429 / Too Many Requests）
+    "timeout": 30 * 60,      # 連線逾時
+    "network": 30 * 60,      # 連線失敗
+    "error": 60 * 60,        # 其他未分類錯誤
+}
+# 同一代號連續以同一原因失敗時，存活時間每次加倍，直到此上限（未列出的原因不加倍）
+NEGATIVE_TTL_MAX = {
+    "empty": 24 * 3600,
+}
+STRIKE_MEMORY = 3 * 24 * 3600  # 到期後仍保留紀錄多久（只用來累計連續失敗次數，不再擋抓取）
+
+REASON_TEXT = {
+    "empty": "無資料（可能下市或代號錯誤）",
+    "not_found": "查無此代號",
+    "throttled": "資料源限流",
+    "timeout": "連線逾時",
+    "network": "網路連線失敗",
+    "error": "其他錯誤",
+    "circuit_open": "斷路器開啟，暫停請求",
+}
+
+# 斷路器：最近 BREAKER_WINDOW 次請求中，錯誤率 >= BREAKER_THRESHOLD 即暫停
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 8
+BREAKER_THRESHOLD = 0.5
+BREAKER_COOLDOWN = 60  # 秒
+
+# 只有這些原因算進斷路器錯誤率（單一代號無資料不代表資料源出問題）
+BREAKER_REASONS = {"throttled", "timeout", "network", "error"}
+# 但連續 EMPTY_BURST 檔都是空表時，多半是限流：這一串空表全部算成錯誤
+EMPTY_BURST = 5
+
+
+# --------------------
+# 失敗原因分類
+# --------------------
+def classify_failure(exc=None, message=None):
+    text = f"{message or ''} {exc or ''} {type(exc).__name__ if exc else ''}".lower()
+    if any(k in text for k in ["429", "too many requests", "rate limit", "ratelimit"]):
+        return "throttled"
+    if "timeout" in text or "timed out" in text:
+        return "timeout"
+    if any(k in text for k in ["delisted", "no data found", "symbol may be", "404", "not found"]):
+        return "not_found"
+    if any(k in text for k in ["connection", "resolve", "ssl", "network", "unreachable"]):
+        return "network"
+    if exc is None and not message:
+        return "empty"
+    return "error"
+
+
+# --------------------
+# 斷路器
+# --------------------
+class CircuitBreaker:
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.window = window
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.half_open = False
+        self.tripped_at = 0.0  # 已知最近一次跳脫時間（含其他程序的），半開後不歸零
+        self.shared = None     # 多程序共用的跳脫時間（multiprocessing.Value("d")），見 share()
+
+    def share(self, value):
+        """與其他程序共用跳脫時間：任一掃描子程序跳脫，其他子程序下一次 allow() 就會停手"""
+        self.shared = value
+        self.adopt(value.value)
+
+    def _trip(self):
+        self.opened_at = time.time()
+        self.tripped_at = self.opened_at
+        if self.shared is not None:
+            with self.shared.get_lock():
+                self.shared.value = max(self.shared.value, self.opened_at)
+
+    def allow(self):
+        if self.shared is not None:
+            self.adopt(self.shared.value)
+        if self.opened_at is None:
+            return True
+        if time.time() - self.opened_at >= self.cooldown:
+            # 冷卻結束：半開，放行一筆試探請求
+            self.opened_at = None
+            self.half_open = True
+            self.outcomes.clear()
+            return True
+        return False
+
+    def record(self, ok):
+        if self.half_open:
+            self.half_open = False
+            if not ok:
+                self._trip()
+                return
+        self.outcomes.append(bool(ok))
+        if len(self.outcomes) < self.min_calls:
+            return
+        err_rate = self.outcomes.count(False) / len(self.outcomes)
+        if err_rate >= self.threshold:
+            self._trip()
+
+    def adopt(self, opened_at):
+        """併入其他程序較新的跳脫時間（0 / None 表示沒有跳脫）"""
+        if opened_at and opened_at > self.tripped_at:
+            self.tripped_at = opened_at
+            self.opened_at = opened_at
+            self.half_open = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and time.time() - self.opened_at < self.cooldown
+
+
+# --------------------
+# 負向快取 + 失敗報告
+# --------------------
+class FetchGuard:
+    def __init__(self, cache_file=NEGATIVE_CACHE_FILE, breaker=None):
+        self.cache_file = cache_file
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.negative = self._load()
+        self.report = {}
+        self.empty_run = 0  # 連續空表次數
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {k: v for k, v in data.items() if v.get("expires", 0) + STRIKE_MEMORY > now}
+
+    def _save(self, changed=(), removed=(), merge=True):
+        """與磁碟上的版本合併後寫暫存檔再原子替換：
+        掃描子程序、其他工作階段同時寫入時不會互相蓋掉或留下半個檔。
+        只有本次 changed / removed 的代號以記憶體為準，其餘以磁碟為準"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            merged = self._load() if merge else {}
+            for k in removed:
+                merged.pop(k, None)
+            for k in changed:
+                merged[k] = self.negative[k]
+            tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(merged, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.cache_file)
+            self.negative = merged
+        except OSError:
+            pass
+
+    def check(self, symbol):
+        """回傳 None 表示可以抓取，否則回傳略過原因"""
+        with self.lock:
+            entry = self.negative.get(symbol)
+            # 到期的紀錄留著累計連續失敗次數，但不再擋抓取
+            if entry is not None and entry["expires"] > time.time():
+                self.report[symbol] = dict(entry, cached=True)
+                return entry["reason"]
+            if not self.breaker.allow():
+                self.report[symbol] = {"reason": "circuit_open", "detail": "",
+                                       "expires": self.breaker.opened_at + self.breaker.cooldown,
+                                       "cached": False}
+                return "circuit_open"
+        return None
+
+    def record_success(self, symbol):
+        with self.lock:
+            self.empty_run = 0
+            self.breaker.record(True)
+            self.report.pop(symbol, None)
+            if self.negative.pop(symbol, None) is not None:
+                self._save(removed=[symbol])
+
+    def _record_outcome(self, reason):
+        if reason != "empty":
+            self.empty_run = 0
+            self.breaker.record(reason not in BREAKER_REASONS)
+            return
+        # 單一空表不影響斷路器；連續 EMPTY_BURST 次起整串算錯誤
+        self.empty_run += 1
+        if self.empty_run == EMPTY_BURST:
+            for _ in range(EMPTY_BURST):
+                self.breaker.record(False)
+        elif self.empty_run > EMPTY_BURST:
+            self.breaker.record(False)
+
+    def record_failure(self, symbol, reason, detail=""):
+        with self.lock:
+            self._record_outcome(reason)
+            prev = self.negative.get(symbol)
+            strikes = prev.get("strikes", 1) + 1 if prev is not None and prev["reason"] == reason else 1
+            base = NEGATIVE_TTL.get(reason, NEGATIVE_TTL["error"])
+            ttl = min(base * 2 ** (strikes - 1), NEGATIVE_TTL_MAX.get(reason, base))
+            entry = {"reason": reason, "detail": str(detail)[:200],
+                     "expires": time.time() + ttl, "strikes": strikes}
+            self.negative[symbol] = entry
+            self.report[symbol] = dict(entry, cached=False)
+            self._save(changed=[symbol])
+
+    def clear(self, symbol=None):
+        with self.lock:
+            if symbol is None:
+                self.negative.clear()
+                self._save(merge=False)
+            else:
+                self.negative.pop(symbol, None)
+                self._save(removed=[symbol])
+
+    def reset_report(self):
+        with self.lock:
+            self.report = {}
+
+    def merge_report(self, report):
+        """併入子程序的失敗紀錄（子程序已寫入負向快取檔，這裡同步記憶體中的副本）"""
+        with self.lock:
+            for sym, e in report.items():
+                self.report[sym] = e
+                if e["reason"] != "circuit_open":
+                    self.negative[sym] = {k: e[k] for k in ("reason", "detail", "expires", "strikes") if k in e}
+
+    def failure_report(self):
+        rows = []
+        for sym, e in sorted(self.report.items()):
+            rows.append({
+                "代號": sym,
+                "原因": e["reason"],
+                "說明": REASON_TEXT.get(e["reason"], e["reason"]),
+                "細節": e.get("detail", ""),
+                "來源": "負向快取" if e.get("cached") else "本次抓取",
+                "重試時間": datetime.fromtimestamp(e["expires"]).strftime("%m/%d %H:%M"),
+            })
+        return rows
+
+
+# 全域共用實例（同一程序內各引擎與 app.py 共用同一份快取與斷路器；
+# 掃描子程序各有一份，負向快取經由檔案合併，斷路器跳脫時間經由 CircuitBreaker.share 共用）
+guard = FetchGuard()
+
+
+def print_failure_report(rows=None):
+    rows = guard.failure_report() if rows is None else rows
+    if not rows:
+        return
+    print(f"\n⚠️ 抓取失敗 {len(rows)} 檔：")
+    for r in rows:
+        print(f"  {r['代號']:<10} {r['說明']}（{r['來源']}，{r['重試時間']} 後重試） {r['細節']}")
+
+
+def last_download_error(yf_module, symbol):
+    """yfinance 不會對失敗的 download 拋例外，錯誤訊息留在 yf.shared._ERRORS"""
+    errors = getattr(getattr(yf_module, "shared", None), "_ERRORS", None) or {}
+    return errors.get(symbol) or errors.get(str(symbol).upper())
@@ -0,0 +1,161 @@
+# =====================================================
+# SJ 抓取區間規劃 - 由指標需求推導最少 K 棒數與日期區間
+# =====================================================
+# 以往的區間是拍腦袋決定的（lookback+100 天、365 天、360 天），
+# 有的用途抓太多、有的用途不夠（被 len(df) < 150 默默剔除）。
+# 這裡從 indicator_graph 的運算圖推算暖機長度（EMA 收斂、VRI 14 根、Slope 5 根），
+# 加上各輸出的視窗（Z 分數 60 根、回溯 150 根、20 日擴散率、近 5 日），
+# 再用交易日曆換算成最小的日期區間。
+
+# --------------------
+# 套件導入
+# --------------------
+import math
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+
+from indicator_graph import STANDARD
+from trading_calendar import calendar_for, UNKNOWN_YEAR_MARGIN
+
+# --------------------
+# 核心參數（對應 get_four_dimension_advice / calc_trend_stability 的寫死視窗）
+# --------------------
+Z_WINDOW = 60            # iloc[idx-60 : idx+1]
+BACKSCAN = 150           # for offset in range(1, 150)，p_idx < 60 即停止
+STABILITY_WINDOW = 20    # calc_trend_stability(df, 20)
+LAST_DAYS = 5            # calc_last5_trend_series(df, 20, 5)
+EMA_SETTLE_TOL = 0.01    # 初始值權重降到 1% 以下才視為收斂
+MARGIN_BARS = 5          # 停牌、資料缺漏的保險
+TF_MIN_BARS = {"週": 20, "月": 12}   # 週 / 月線去除暖機後至少要有的 K 棒數（timeframes.py 使用）
+TF_RULE = {"週": "W-FRI", "月": "M"}  # 重新取樣規則（timeframes.py 使用）
+
+
+# --------------------
+# 運算圖暖機長度
+# --------------------
+def ema_settle_bars(span, tol=EMA_SETTLE_TOL):
+    alpha = 2.0 / (span + 1)
+    return int(math.ceil(math.log(tol) / math.log(1 - alpha)))
+
+
+def expr_warmup(expr, memo=None):
+    """回傳 (NaN 暖機根數, 數值收斂根數)"""
+    memo = {} if memo is None else memo
+    if expr.key in memo:
+        return memo[expr.key]
+    kids = [expr_warmup(a, memo) for a in expr.args]
+    nan = max([k[0] for k in kids], default=0)
+    settle = max([k[1] for k in kids], default=0)
+    n = expr.params[0] if expr.params else 0
+    if expr.op in ("sma", "slope"):
+        nan += n - 1
+        settle += n - 1
+    elif expr.op in ("diff", "shift"):
+        nan += n
+        settle += n
+    elif expr.op == "ema":
+        settle = max(settle, nan + ema_settle_bars(n))
+    memo[expr.key] = (nan, max(settle, nan))
+    return memo[expr.key]
+
+
+def pipeline_warmup(pipeline=STANDARD):
+    memo = {}
+    parts = [expr_warmup(e, memo) for e in pipeline.columns.values()]
+    return max(p[0] for p in parts), max(p[1] for p in parts)
+
+
+# --------------------
+# 各用途需要的「指標有效」K 棒數：(完整重現, 最少可計算)
+# --------------------
+# 狀態（map_status）只取決於操作建議與 Slope_Z，用不到 BACKSCAN；
+# 回溯只影響 get_four_dimension_advice 的 last_action_display，只有要顯示它的用途才需要。
+def _needs():
+    status = Z_WINDOW + 1
+    advice = status + (BACKSCAN - 1)
+    stability = status + STABILITY_WINDOW - 1
+    return {
+        "indicators": (1, 1),                                   # 最新一根 PVO / VRI / Slope / Score
+        "zscore": (status, 3),                                  # get_advice、map_status
+        "advice": (advice, 3),                                  # get_four_dimension_advice 的 last_action_display
+        "stability": (stability, STABILITY_WINDOW + 2),          # + 20 日擴散率
+        "last5": (stability + LAST_DAYS - 1, STABILITY_WINDOW + LAST_DAYS + 2),  # + 近 5 日擴散率
+    }
+
+
+NEEDS = _needs()
+
+
+class FetchPlan:
+    def __init__(self, use, symbol, start, end, bars, min_bars, warmup):
+        self.use = use
+        self.symbol = symbol
+        self.start = start
+        self.end = end
+        self.bars = bars            # 需下載的交易日數
+        self.min_bars = min_bars    # 去除暖機後至少要有的 K 棒數
+        self.warmup = warmup
+
+    def __repr__(self):
+        return (f"FetchPlan({self.use}, {self.symbol}, {self.start:%Y-%m-%d}~{self.end:%Y-%m-%d}, "
+                f"bars={self.bars}, min_bars={self.min_bars})")
+
+
+def _walk_sessions(cal, d, n, end):
+    """由 d 往回數 n 個交易日；缺休市日表的年份每年多數 UNKNOWN_YEAR_MARGIN 個"""
+    for _ in range(n):
+        d = cal.prev_session(d)
+    extra = UNKNOWN_YEAR_MARGIN * len(cal.unknown_years(d, end))
+    for _ in range(extra):
+        d = cal.prev_session(d)
+    return d, n + extra
+
+
+def timeframe_start(tf, end_dt, symbol="", pipeline=STANDARD):
+    """
+    週 / 月線要算出狀態所需的日 K 起點。
+    以交易日曆逐日往回數到涵蓋「NaN 暖機 + 最少根數 + 尚未收完的當期」個有交易的週期
+    （整週休市，如農曆年，不算一期），再往回數日線本身的 NaN 暖機：
+    日 K 先經 calc_indicators 去掉暖機列，剩下的才會重新取樣成週 / 月 K。
+    """
+    return _timeframe_start(tf, pd.Timestamp(end_dt).to_pydatetime(), calendar_for(symbol), pipeline)
+
+
+@lru_cache(maxsize=256)
+def _timeframe_start(tf, end, cal, pipeline):
+    # 同一次掃描所有代號共用同一個結果（只取決於週期、終點與交易所）
+    nan, _ = pipeline_warmup(pipeline)
+    periods = nan + TF_MIN_BARS[tf] + 1
+    d = cal.prev_session(end.date())
+    seen = {pd.Period(d, TF_RULE[tf])}
+    while True:
+        p = cal.prev_session(d)
+        key = pd.Period(p, TF_RULE[tf])
+        if key not in seen:
+            if len(seen) >= periods:
+                break
+            seen.add(key)
+        d = p
+    d, _ = _walk_sessions(cal, d, nan + MARGIN_BARS, end)
+    return datetime.combine(d, datetime.min.time())
+
+
+def plan_fetch(use, end_dt, symbol="", extra_bars=0, timeframes=(), pipeline=STANDARD):
+    """
+    use：NEEDS 的鍵；end_dt：下載區間終點（不含）；extra_bars：額外需要的歷史（例如前一日比較）。
+    timeframes：同一份日 K 還要重新取樣成哪些週期（週 / 月），區間會延伸到足夠算出該週期狀態。
+    回傳的 start 是往回數足交易日後的日期，直接給 download_ohlcv 使用。
+    """
+    full, minimum = NEEDS[use]
+    _, settle = pipeline_warmup(pipeline)
+    bars = settle + full + extra_bars + MARGIN_BARS
+    cal = calendar_for(symbol)
+    end = pd.Timestamp(end_dt).to_pydatetime()
+    # 缺休市日表的年份會把休市日算成交易日，區間可能不夠長：每個這樣的年份多往回數一段
+    d, bars = _walk_sessions(cal, end.date(), bars, end)
+    start = datetime.combine(d, datetime.min.time())
+    for tf in timeframes:
+        start = min(start, timeframe_start(tf, end, symbol, pipeline))
+    return FetchPlan(use, symbol, start, end, bars, minimum + extra_bars, settle)
@@ -0,0 +1,217 @@
+# =====================================================
+# SJ 本地替身資料伺服器 - 提供固定資料、可設定延遲
+# =====================================================
+# 回應與 Yahoo chart API 相同格式（/v8/finance/chart/<代號>），另加批次端點
+# /v8/finance/bulk?symbols=a,b,c，讓 http_client 可以完全離線量測與調校。
+#   latency          每個請求的回應延遲（模擬網路來回 + 伺服器處理；同連線上的 pipeline 請求可重疊）
+#   connect_latency  每條新連線的建立成本（模擬 TCP / TLS 握手）
+# 資料來源：預設先找 bar_cache 已快取的真實 K 棒，沒有時以代號為種子產生固定的模擬 K 棒。
+
+# --------------------
+# 套件導入
+# --------------------
+import sys
+import json
+import zlib
+import asyncio
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import numpy as np
+import pandas as pd
+
+# --------------------
+# 核心參數
+# --------------------
+HOST = "127.0.0.1"
+PORT = 8765
+MISSING_PREFIX = "XX"  # 以此開頭的代號回 404，用來測試負向快取
+
+
+# --------------------
+# 資料來源
+# --------------------
+@lru_cache(maxsize=1)
+def _business_days(today):
+    return pd.bdate_range("2010-01-01", today)
+
+
+@lru_cache(maxsize=4096)
+def _synthetic_full(symbol):
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    full = _business_days(pd.Timestamp.today().normalize())
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(full))))
+    open_ = close * (1 + rng.normal(0, 0.005, len(full)))
+    df = pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, len(full))),
+        "Low": np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, len(full))),
+        "Close": close,
+        "Volume": rng.integers(1_000, 50_000, len(full)).astype(float) * 1000,
+    }, index=full)
+    return df
+
+
+def synthetic_bars(symbol, start_dt, end_dt):
+    df = _synthetic_full(symbol)
+    return df[(df.index >= pd.Timestamp(start_dt)) & (df.index < pd.Timestamp(end_dt))]
+
+
+def fixture_bars(symbol, start_dt, end_dt):
+    if symbol.upper().startswith(MISSING_PREFIX):
+        return None
+    try:
+        import bar_cache
+        entry = bar_cache.load(symbol)
+    except Exception:
+        entry = None
+    if entry is not None:
+        return bar_cache._slice(entry["df"], start_dt, end_dt)
+    return synthetic_bars(symbol, start_dt, end_dt)
+
+
+def chart_result(symbol, df):
+    idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    ts = (idx - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+
+    def _col(c):
+        return [None if np.isnan(v) else float(v) for v in df[c].to_numpy(dtype=float)]
+
+    return {
+        "meta": {"symbol": symbol, "gmtoffset": 0, "dataGranularity": "1d"},
+        "timestamp": [int(t) for t in ts],
+        "indicators": {"quote": [{
+            "open": _col("Open"), "high": _col("High"), "low": _col("Low"),
+            "close": _col("Close"), "volume": _col("Volume"),
+        }]},
+    }
+
+
+def _not_found(symbol):
+    return {"code": "Not Found", "description": f"No data found, symbol may be delisted: {symbol}"}
+
+
+# --------------------
+# 伺服器
+# --------------------
+class FixtureServer:
+    def __init__(self, source=fixture_bars, host=HOST, port=0, latency=0.0, connect_latency=0.0):
+        self.source = source
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.server = None
+        self._handlers = {}  # 連線處理程序 -> writer
+        self.stats = {"connections": 0, "requests": 0, "bulk_requests": 0}
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        # 先關掉仍開著的 keep-alive 連線，讓各連線的處理程序正常結束
+        handlers = list(self._handlers)
+        for w in self._handlers.values():
+            w.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"fixture server：{self.url}（延遲 {self.latency * 1000:.0f} ms）")
+        async with self.server:
+            await self.server.serve_forever()
+
+    # ---------- 路由 ----------
+    def _route(self, target):
+        u = urlsplit(target)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        start = pd.to_datetime(int(q.get("period1", 0)), unit="s")
+        end = pd.to_datetime(int(q.get("period2", 2 ** 31 - 1)), unit="s")
+        if u.path.endswith("/bulk"):
+            self.stats["bulk_requests"] += 1
+            results = []
+            for s in filter(None, q.get("symbols", "").split(",")):
+                df = self.source(s, start, end)
+                if df is not None and not df.empty:
+                    results.append(chart_result(s, df))
+            return 200, "OK", {"results": results}
+        if "/chart/" in u.path:
+            symbol = unquote(u.path.rsplit("/", 1)[-1])
+            df = self.source(symbol, start, end)
+            if df is None or df.empty:
+                return 404, "Not Found", {"chart": {"result": None, "error": _not_found(symbol)}}
+            return 200, "OK", {"chart": {"result": [chart_result(symbol, df)], "error": None}}
+        return 404, "Not Found", {"error": "unknown endpoint"}
+
+    async def _respond(self, target):
+        await asyncio.sleep(self.latency)
+        status, reason, payload = self._route(target)
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {reason}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: keep-alive\r\n\r\n").encode("latin-1")
+        return head + body
+
+    async def _handle(self, reader, writer):
+        self.stats["connections"] += 1
+        self._handlers[asyncio.current_task()] = writer
+        await asyncio.sleep(self.connect_latency)
+        pending = asyncio.Queue()
+
+        async def write_in_order():
+            # pipeline：回應可平行準備，但必須依請求順序寫回
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                writer.write(await task)
+                await writer.drain()
+
+        writer_task = asyncio.create_task(write_in_order())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                target = line.decode("latin-1").split(" ")[1]
+                close = False
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    if h.lower().startswith(b"connection:") and b"close" in h.lower():
+                        close = True
+                self.stats["requests"] += 1
+                await pending.put(asyncio.create_task(self._respond(target)))
+                if close:
+                    break
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            await pending.put(None)
+            try:
+                await writer_task
+            except ConnectionError:
+                pass
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+
+# --------------------
+# 主程式
+# --------------------
+if __name__ == "__main__":
+    # python fixture_server.py [port] [延遲 ms] [建線延遲 ms]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    lat = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    conn_lat = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0
+    asyncio.run(FixtureServer(port=port, latency=lat, connect_latency=conn_lat).serve_forever())
@@ -0,0 +1,378 @@
+# =====================================================
+# SJ 非同步資料客戶端 - 連線池 + keep-alive + pipelining
+# =====================================================
+# yf.download / yf.Ticker 每次呼叫都重新建立連線，掃描時間大多花在 TCP / TLS 握手。
+# 這裡用標準庫 asyncio 實作 HTTP/1.1 客戶端：
+#   1. 連線池：固定數量的 keep-alive 連線，跨請求、跨呼叫重複使用
+#   2. pipelining：同一條連線一次送出多個請求，再依序讀回應，省去每個請求的來回延遲
+#   3. 批次端點：一個請求帶多檔代號（本地替身伺服器提供；遠端不支援時自動退回逐檔）
+# 回應格式與 Yahoo chart API（/v8/finance/chart）相同，可直接對本地替身伺服器
+# （fixture_server.py）離線量測每條連線的吞吐量，再調整連線數與 pipeline 深度。
+# 設定 SJ_HTTP_BACKEND=<base url> 後，analysis_engine 會改用這裡取代 yfinance。
+
+# --------------------
+# 套件導入
+# --------------------
+import sys
+import json
+import gzip
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit, urlencode, quote
+
+import numpy as np
+import pandas as pd
+
+# --------------------
+# 核心參數
+# --------------------
+POOL_SIZE = 4          # 每個主機的 keep-alive 連線數
+PIPELINE_DEPTH = 8     # 同一條連線上一次送出的請求數
+BULK_SIZE = 50         # 批次端點每個請求的代號數
+TIMEOUT = 10           # 秒；單一批次（含連線）的逾時
+USER_AGENT = "Mozilla/5.0 (compatible; sj-scan)"
+
+CHART_PATH = "/v8/finance/chart/"
+BULK_PATH = "/v8/finance/bulk"
+
+
+class HTTPError(Exception):
+    def __init__(self, status, reason, detail=""):
+        super().__init__(f"{status} {reason} {detail}".strip())
+        self.status = status
+
+
+# --------------------
+# HTTP/1.1 連線
+# --------------------
+class Connection:
+    def __init__(self, host, port, ssl):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.reader = None
+        self.writer = None
+        self.reusable = False
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl or None)
+        self.reusable = True
+
+    def close(self):
+        self.reusable = False
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _request(self, path):
+        return (f"GET {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"User-Agent: {USER_AGENT}\r\n"
+                "Accept: application/json\r\n"
+                "Accept-Encoding: gzip\r\n"
+                "Connection: keep-alive\r\n\r\n").encode("latin-1")
+
+    async def _read_response(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionResetError("connection closed by server")
+        _, status, *reason = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                parts.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(parts)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.reusable = False
+        if headers.get("connection", "").lower() == "close":
+            self.reusable = False
+        if headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return int(status), (reason[0] if reason else ""), body
+
+    async def pipeline(self, paths):
+        """一次寫出所有請求，再依序讀回應；回傳 [(status, reason, body)]"""
+        self.writer.write(b"".join(self._request(p) for p in paths))
+        await self.writer.drain()
+        return [await self._read_response() for _ in paths]
+
+
+# --------------------
+# 連線池
+# --------------------
+class ConnectionPool:
+    def __init__(self, host, port, ssl=False, size=POOL_SIZE, keep_alive=True):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.size = size
+        self.keep_alive = keep_alive
+        self._idle = []
+        self._slots = None
+        self.connects = 0
+        self.requests = 0
+
+    async def _acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        await self._slots.acquire()
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.reusable and not conn.reader.at_eof():
+                return conn
+            conn.close()
+        conn = Connection(self.host, self.port, self.ssl)
+        await conn.open()
+        self.connects += 1
+        return conn
+
+    def _release(self, conn):
+        if self.keep_alive and conn.reusable:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    async def request_many(self, paths, timeout=TIMEOUT):
+        """同一條連線上 pipeline 送出；中途被伺服器關閉時，剩下的請求換一條新連線重送一次"""
+        out = []
+        retried = False
+        while len(out) < len(paths):
+            conn = await self._acquire()
+            try:
+                todo = paths[len(out):]
+                self.requests += len(todo)
+                out += await asyncio.wait_for(conn.pipeline(todo), timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if retried:
+                    raise
+                retried = True
+            except BaseException:
+                conn.close()
+                raise
+            finally:
+                self._release(conn)
+        return out
+
+    def close(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+
+
+# --------------------
+# chart 回應解析（Yahoo chart API 格式）
+# --------------------
+def parse_chart(result):
+    """chart.result[0] -> 與 yf.download(auto_adjust=True) 相同欄位的日 K"""
+    ts = result.get("timestamp") or []
+    if not ts:
+        return None
+    quote_ = result["indicators"]["quote"][0]
+    offset = result.get("meta", {}).get("gmtoffset", 0)
+    idx = pd.to_datetime(np.asarray(ts, dtype="int64") + offset, unit="s").normalize()
+    df = pd.DataFrame({
+        "Open": quote_.get("open"),
+        "High": quote_.get("high"),
+        "Low": quote_.get("low"),
+        "Close": quote_.get("close"),
+        "Volume": quote_.get("volume"),
+    }, index=idx, dtype=float)
+    adj = (result["indicators"].get("adjclose") or [{}])[0].get("adjclose")
+    if adj is not None:
+        ratio = np.asarray(adj, dtype=float) / df["Close"].to_numpy()
+        for c in ["Open", "High", "Low", "Close"]:
+            df[c] = df[c] * ratio
+    df = df[~df.index.duplicated(keep="last")].dropna(subset=["Close"])
+    df.index.name = "Date"
+    return df if not df.empty else None
+
+
+def _chart_error(status, reason, payload):
+    err = (payload.get("chart") or payload).get("error") if isinstance(payload, dict) else None
+    detail = f"{err.get('code', '')}: {err.get('description', '')}" if err else ""
+    return HTTPError(status, reason, detail)
+
+
+def _epoch(ts):
+    ts = pd.Timestamp(ts)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts
+    return int(ts.timestamp())
+
+
+# --------------------
+# 資料客戶端
+# --------------------
+class ChartClient:
+    def __init__(self, base_url, pool_size=POOL_SIZE, depth=PIPELINE_DEPTH, bulk=True,
+                 bulk_size=BULK_SIZE, keep_alive=True):
+        u = urlsplit(base_url)
+        ssl = u.scheme == "https"
+        self.pool = ConnectionPool(u.hostname, u.port or (443 if ssl else 80), ssl,
+                                   pool_size, keep_alive)
+        self.prefix = u.path.rstrip("/")
+        self.depth = depth
+        self.bulk = bulk
+        self.bulk_size = bulk_size
+
+    def _query(self, start_dt, end_dt):
+        return urlencode({"period1": _epoch(start_dt), "period2": _epoch(end_dt),
+                          "interval": "1d", "events": "history"})
+
+    def chart_path(self, symbol, start_dt, end_dt):
+        return f"{self.prefix}{CHART_PATH}{quote(symbol)}?{self._query(start_dt, end_dt)}"
+
+    def bulk_path(self, symbols, start_dt, end_dt):
+        return (f"{self.prefix}{BULK_PATH}?symbols={quote(','.join(symbols), safe=',')}"
+                f"&{self._query(start_dt, end_dt)}")
+
+    async def _pipelined(self, paths):
+        batches = [paths[i:i + self.depth] for i in range(0, len(paths), self.depth)]
+        done = await asyncio.gather(*[self.pool.request_many(b) for b in batches])
+        return [r for batch in done for r in batch]
+
+    async def _fetch_single(self, symbols, start_dt, end_dt):
+        responses = await self._pipelined([self.chart_path(s, start_dt, end_dt) for s in symbols])
+        out = {}
+        for s, (status, reason, body) in zip(symbols, responses):
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                payload = {}
+            result = ((payload.get("chart") or {}).get("result") or [None])[0]
+            out[s] = parse_chart(result) if status == 200 and result else _chart_error(status, reason, payload)
+        return out
+
+    async def _fetch_bulk(self, symbols, start_dt, end_dt):
+        chunks = [symbols[i:i + self.bulk_size] for i in range(0, len(symbols), self.bulk_size)]
+        responses = await self._pipelined([self.bulk_path(c, start_dt, end_dt) for c in chunks])
+        out = {}
+        for chunk, (status, reason, body) in zip(chunks, responses):
+            if status == 404 and not body.startswith(b"{\"results\""):
+                self.bulk = False  # 遠端沒有批次端點
+                out.update(await self._fetch_single(chunk, start_dt, end_dt))
+                continue
+            if status != 200:
+                err = HTTPError(status, reason)
+                out.update({s: err for s in chunk})
+                continue
+            by_symbol = {r["meta"]["symbol"]: r for r in json.loads(body)["results"]}
+            for s in chunk:
+                r = by_symbol.get(s)
+                out[s] = parse_chart(r) if r is not None else HTTPError(404, "Not Found", "No data found")
+        return out
+
+    async def fetch_many(self, symbols, start_dt, end_dt):
+        """{代號: DataFrame / None（無資料）/ Exception}"""
+        symbols = list(dict.fromkeys(symbols))
+        if self.bulk and len(symbols) > 1:
+            return await self._fetch_bulk(symbols, start_dt, end_dt)
+        return await self._fetch_single(symbols, start_dt, end_dt)
+
+    async def fetch(self, symbol, start_dt, end_dt):
+        return (await self._fetch_single([symbol], start_dt, end_dt))[symbol]
+
+    def close(self):
+        self.pool.close()
+
+
+# --------------------
+# 同步介面：背景事件迴圈持有連線池，讓逐檔呼叫也能共用 keep-alive 連線
+# --------------------
+class SyncChartClient:
+    def __init__(self, base_url, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self.client = ChartClient(base_url, **kwargs)
+
+    def _run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def download(self, symbol, start_dt, end_dt):
+        """與 yf.download 相同的回傳：DataFrame，失敗時拋出例外"""
+        res = self._run(self.client.fetch(symbol, start_dt, end_dt))
+        if isinstance(res, Exception):
+            raise res
+        return res if res is not None else pd.DataFrame()
+
+    def download_many(self, symbols, start_dt, end_dt):
+        return self._run(self.client.fetch_many(symbols, start_dt, end_dt))
+
+    def stats(self):
+        return {"connects": self.client.pool.connects, "requests": self.client.pool.requests}
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.client.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_clients = {}
+
+
+def get_client(base_url):
+    if base_url not in _clients:
+        _clients[base_url] = SyncChartClient(base_url)
+    return _clients[base_url]
+
+
+# --------------------
+# 離線量測：對本地替身伺服器比較各種連線設定
+# --------------------
+async def bench(n_symbols=200, latency=0.02, connect_latency=0.05):
+    from fixture_server import FixtureServer
+    server = FixtureServer(latency=latency, connect_latency=connect_latency)
+    await server.start()
+    symbols = [f"{1101 + i}.TW" for i in range(n_symbols)]
+    end = pd.Timestamp.today().normalize()
+    start = end - pd.Timedelta(days=400)
+    configs = [
+        ("每請求新連線", dict(pool_size=1, depth=1, bulk=False, keep_alive=False)),
+        ("keep-alive x1", dict(pool_size=1, depth=1, bulk=False)),
+        ("pipeline x1", dict(pool_size=1, depth=PIPELINE_DEPTH, bulk=False)),
+        (f"pipeline x{POOL_SIZE}", dict(pool_size=POOL_SIZE, depth=PIPELINE_DEPTH, bulk=False)),
+        (f"批次 x{POOL_SIZE}", dict(pool_size=POOL_SIZE, depth=PIPELINE_DEPTH, bulk=True)),
+    ]
+    rows = []
+    for name, kw in configs:
+        client = ChartClient(server.url, **kw)
+        t0 = time.perf_counter()
+        res = await client.fetch_many(symbols, start, end)
+        dt = time.perf_counter() - t0
+        ok = sum(isinstance(v, pd.DataFrame) for v in res.values())
+        conns = min(client.pool.connects, kw["pool_size"]) or 1
+        rows.append({"設定": name, "秒數": round(dt, 3), "檔/秒": round(len(symbols) / dt, 1),
+                     "每連線 檔/秒": round(len(symbols) / dt / conns, 1),
+                     "連線數": client.pool.connects, "請求數": client.pool.requests, "成功": ok})
+        client.close()
+    await server.stop()
+    return pd.DataFrame(rows)
+
+
+# --------------------
+# 主程式
+# --------------------
+if __name__ == "__main__":
+    # python http_client.py [檔數] [延遲 ms] [建線延遲 ms]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    lat = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+    conn_lat = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    print(asyncio.run(bench(n, lat, conn_lat)).to_string(index=False))
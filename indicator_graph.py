@@ -0,0 +1,228 @@
+# =====================================================
+# SJ 指標運算圖 - 宣告式定義、共用子運算只算一次
+# =====================================================
+# PVO / VRI / Slope / Score 只在這裡定義一次，
+# analysis_engine、indicator_utils、backtest_5d 都透過 calc_indicators 使用。
+# 每個節點以 (運算, 參數, 子節點) 為鍵；不同欄位或不同權重的 Score
+# 只要用到相同的 EMA12/EMA26/rolling 等中間結果，都只會計算一次。
+# 輸入可以是單檔 DataFrame（欄位為 OHLCV），也可以是 {欄位: (日期, 代號) DataFrame} 的面板。
+
+# --------------------
+# 套件導入
+# --------------------
+import numpy as np
+
+from profiling import profiled
+
+
+# --------------------
+# 運算節點
+# --------------------
+class Expr:
+    __slots__ = ("op", "args", "params", "key")
+
+    def __init__(self, op, args=(), params=()):
+        self.op = op
+        self.args = tuple(args)
+        self.params = tuple(params)
+        self.key = (op, self.params, tuple(a.key for a in self.args))
+
+    # ---------- 算術 ----------
+    def _bin(self, op, other, swap=False):
+        other = other if isinstance(other, Expr) else const(other)
+        return Expr(op, (other, self) if swap else (self, other))
+
+    def __add__(self, o): return self._bin("add", o)
+    def __radd__(self, o): return self._bin("add", o, swap=True)
+    def __sub__(self, o): return self._bin("sub", o)
+    def __rsub__(self, o): return self._bin("sub", o, swap=True)
+    def __mul__(self, o): return self._bin("mul", o)
+    def __rmul__(self, o): return self._bin("mul", o, swap=True)
+    def __truediv__(self, o): return self._bin("div", o)
+    def __rtruediv__(self, o): return self._bin("div", o, swap=True)
+    def __gt__(self, o): return self._bin("gt", o)
+    def __lt__(self, o): return self._bin("lt", o)
+
+    # ---------- 時序運算 ----------
+    def ema(self, span): return Expr("ema", (self,), (span,))
+    def sma(self, n): return Expr("sma", (self,), (n,))
+    def diff(self, n=1): return Expr("diff", (self,), (n,))
+    def shift(self, n=1): return Expr("shift", (self,), (n,))
+    def slope(self, n=5): return Expr("slope", (self,), (n,))
+
+    def where(self, cond, other=0):
+        other = other if isinstance(other, Expr) else const(other)
+        return Expr("where", (self, cond, other))
+
+    def __repr__(self):
+        if self.op == "col":
+            return self.params[0]
+        if self.op == "const":
+            return repr(self.params[0])
+        inner = ", ".join([repr(a) for a in self.args] + [repr(p) for p in self.params])
+        return f"{self.op}({inner})"
+
+
+def col(name):
+    return Expr("col", params=(name,))
+
+
+def const(value):
+    return Expr("const", params=(float(value),))
+
+
+# --------------------
+# 運算實作（Series 與 DataFrame 皆可，沿日期軸計算）
+# --------------------
+def _slope(x, n):
+    """與舊版 get_slope_poly（np.polyfit）相同：最近 n 點的線性迴歸斜率 / 視窗第一點 × 100"""
+    t = np.arange(n) - (n - 1) / 2.0
+    den = (t ** 2).sum()
+    num = sum(x.shift(n - 1 - k) * t[k] for k in range(n))
+    base = x.shift(n - 1)
+    base = base.where(base != 0, 1)
+    return (num / den) / base * 100
+
+
+OPS = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": lambda a, b: a / b,
+    "gt": lambda a, b: a > b,
+    "lt": lambda a, b: a < b,
+    "ema": lambda x, span: x.ewm(span=span, adjust=False).mean(),
+    "sma": lambda x, n: x.rolling(n).mean(),
+    "diff": lambda x, n: x.diff(n),
+    "shift": lambda x, n: x.shift(n),
+    "slope": _slope,
+    "where": lambda x, cond, other: x.where(cond, other),
+}
+
+
+# --------------------
+# 編譯與執行
+# --------------------
+class Plan:
+    """依拓撲順序排好的唯一節點清單"""
+
+    def __init__(self, outputs):
+        self.outputs = dict(outputs)
+        self.steps = []
+        seen = set()
+
+        def visit(e):
+            if e.key in seen:
+                return
+            for a in e.args:
+                visit(a)
+            seen.add(e.key)
+            self.steps.append(e)
+
+        for e in self.outputs.values():
+            visit(e)
+
+    def run(self, data, memo=None):
+        """memo 為 {節點鍵: 結果}；傳入同一個 memo 可在多個變體間共用中間結果"""
+        memo = {} if memo is None else memo
+        for e in self.steps:
+            if e.key in memo:
+                continue
+            if e.op == "col":
+                memo[e.key] = data[e.params[0]]
+            elif e.op == "const":
+                memo[e.key] = e.params[0]
+            else:
+                memo[e.key] = OPS[e.op](*[memo[a.key] for a in e.args], *e.params)
+        return {name: memo[e.key] for name, e in self.outputs.items()}
+
+    def __len__(self):
+        return len(self.steps)
+
+
+class Pipeline:
+    """欄位名稱 -> 運算式；編譯結果依輸出欄位組合快取"""
+
+    def __init__(self):
+        self.columns = {}
+        self._plans = {}
+
+    def define(self, name, expr):
+        self.columns[name] = expr
+        self._plans.clear()
+        return expr
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def compile(self, names=None):
+        names = tuple(names or self.columns)
+        if names not in self._plans:
+            self._plans[names] = Plan({n: self.columns[n] for n in names})
+        return self._plans[names]
+
+    def bind(self, data):
+        return Evaluation(self, data)
+
+
+class Evaluation:
+    """綁定一份資料；不同輸出 / 不同 Score 權重共用同一個 memo"""
+
+    def __init__(self, pipeline, data):
+        self.pipeline = pipeline
+        self.data = data
+        self.memo = {}
+
+    def get(self, names=None):
+        return self.pipeline.compile(names).run(self.data, self.memo)
+
+    def expr(self, **exprs):
+        """計算臨時運算式，例如 ev.expr(Score_v2=0.5*SLOPE + 0.5*PVO)"""
+        return Plan(exprs).run(self.data, self.memo)
+
+    def __getitem__(self, name):
+        return self.get([name])[name]
+
+
+# --------------------
+# 標準指標定義
+# --------------------
+VOLUME = col("Volume")
+CLOSE = col("Close")
+
+EMA12_VOL = VOLUME.ema(12)
+EMA26_VOL = VOLUME.ema(26)
+PVO = (EMA12_VOL - EMA26_VOL) / (EMA26_VOL + 1e-6) * 100
+VOL_UP = VOLUME.where(CLOSE.diff() > 0, 0)
+VRI = VOL_UP.sma(14) / (VOLUME.sma(14) + 1e-6) * 100
+SLOPE = CLOSE.slope(5)
+
+
+def score_expr(w_slope=0.6, w_pvo=0.2, w_vri=0.2):
+    return SLOPE * w_slope + PVO * w_pvo + VRI * w_vri
+
+
+SCORE = score_expr()
+
+STANDARD = Pipeline()
+STANDARD.define("PVO", PVO)
+STANDARD.define("VRI", VRI)
+STANDARD.define("Slope", SLOPE)
+STANDARD.define("Score", SCORE)
+
+INDICATOR_COLUMNS = list(STANDARD.columns)
+
+
+@profiled
+def calc_indicators(df, pipeline=STANDARD):
+    """單檔 OHLCV -> 加上 PVO / VRI / Slope / Score，並剔除暖機期 NaN"""
+    df = df.copy()
+    for name, values in pipeline.compile().run(df).items():
+        df[name] = values
+    return df.dropna()
+
+
+@profiled
+def calc_panel(close, volume, names=None, pipeline=STANDARD, memo=None):
+    """面板版本：close / volume 為 (日期, 代號) DataFrame，回傳 {欄位: 面板}"""
+    return pipeline.compile(names).run({"Close": close, "Volume": volume}, memo)
@@ -1,27 +1,11 @@
 
-import sys
 import warnings
 import logging
-import numpy as np
 import pandas as pd
 from datetime import datetime, date, timedelta
 
-# --------------------
-# 自動導入與安裝 yfinance / pandas_ta
-# --------------------
-try:
-    import yfinance as yf
-except ImportError:
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "yfinance"])
-    import yfinance as yf
-
-try:
-    import pandas_ta as ta
-except ImportError:
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas_ta"])
-    import pandas_ta as ta
+from analysis_engine import download_ohlcv, get_taiwan_symbol
+from indicator_graph import calc_indicators
 
 # --------------------
 # 屏蔽警告
@@ -61,43 +45,14 @@ print(f"分析基準日 base_dt: {base_dt}")
 # --------------------
 # 核心函式
 # --------------------
-def get_slope_poly(series, window=5):
-    if len(series) < window:
-        return 0
-    y = series.values[-window:]
-    x = np.arange(window)
-    slope, _ = np.polyfit(x, y, 1)
-    return (slope / (y[0] if y[0] != 0 else 1)) * 100
-
-def get_taiwan_symbol(symbol):
-    s = str(symbol).strip()
-    if not s.isdigit():
-        return s
-    for suffix in [".TW", ".TWO"]:
-        try:
-            t = yf.Ticker(f"{s}{suffix}")
-            if not t.history(period="1d").empty:
-                return f"{s}{suffix}"
-        except:
-            pass
-    return f"{s}.TW"
 
 def get_indicator_data(symbol, start_dt, end_dt):
+    df = download_ohlcv(symbol, start_dt, end_dt)
+    if df is None:
+        return None
     try:
-        df = yf.download(symbol, start=start_dt, end=end_dt,
-                         progress=False, auto_adjust=True)
-        if df.empty:
-            return None
-
-        df['PVO'] = ((ta.ema(df['Volume'], 12) - ta.ema(df['Volume'], 26))
-                     / (ta.ema(df['Volume'], 26) + 1e-6)) * 100
-        df['VRI'] = (ta.sma(df['Volume'].where(df['Close'].diff() > 0, 0), 14)
-                     / (ta.sma(df['Volume'], 14) + 1e-6)) * 100
-        df['Slope'] = df['Close'].rolling(5).apply(lambda x: get_slope_poly(x, 5))
-        df['Score'] = df['Slope'] * 0.6 + df['PVO'] * 0.2 + df['VRI'] * 0.2
-
-        return df.dropna()
-    except:
+        return calc_indicators(df)
+    except Exception:
         return None
 
 def get_advice(df, idx):
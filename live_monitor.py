@@ -0,0 +1,303 @@
+# =====================================================
+# SJ 盤中即時監控 - 只重算有新報價的個股
+# =====================================================
+# 每一輪只向報價源要「上次游標之後」變動的個股，合併進當日 K 棒，
+# 重算該股指標與狀態，回傳變動列與狀態統計差異。
+# 每輪成本與變動檔數成正比，與監控清單大小無關。
+
+# --------------------
+# 套件導入
+# --------------------
+import time
+import zlib
+import numpy as np
+import pandas as pd
+from datetime import datetime, date, timedelta
+
+from analysis_engine import download_ohlcv, calc_indicators, get_taiwan_symbol
+from backtest_5d import get_four_dimension_advice
+from signal_status import map_status, STATUS_RANK
+from trading_calendar import calendar_for, SETTLE_DELAY
+from fetch_plan import plan_fetch
+
+import yfinance as yf
+
+# --------------------
+# 核心參數
+# --------------------
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+
+
+# --------------------
+# 報價源：yfinance 盤中 1 分 K
+# --------------------
+class YFinanceQuoteFeed:
+    """以 1 分 K 合成當日 K 棒；每輪只抓各檔上次看到的那一分鐘之後的資料"""
+
+    def __init__(self):
+        self.day = {}   # 代號 -> 當日合成 K 棒
+        self.seen = {}  # 代號 -> (最後一根 1 分 K 時間, 其成交量)；該分鐘可能尚未走完，下輪重抓覆蓋
+
+    def resolve(self, code):
+        return get_taiwan_symbol(code)
+
+    def history(self, symbol, start_dt, end_dt):
+        return download_ohlcv(symbol, start_dt, end_dt)
+
+    def _start(self, symbol):
+        cal = calendar_for(symbol)
+        now = cal.now()
+        seen = self.seen.get(symbol)
+        if seen is not None and seen[0].date() == now.date():
+            return seen[0]
+        return cal.session_open(now.date())
+
+    def _fold(self, symbol, sub):
+        """把新的 1 分 K 併入當日 K 棒；回傳是否有變動"""
+        ts0 = sub.index[0]
+        seen = self.seen.get(symbol)
+        bar = self.day.get(symbol)
+        if bar is None or bar["Date"] != pd.Timestamp(ts0.date()):
+            bar, seen = None, None
+        vol = float(sub["Volume"].sum())
+        if seen is not None and ts0 == seen[0]:
+            vol -= seen[1]  # 上輪最後一分鐘的量已計入，這輪重抓到的是它的更新值
+        if bar is None:
+            bar = {"Date": pd.Timestamp(ts0.date()), "Open": float(sub["Open"].iloc[0]),
+                   "High": float(sub["High"].max()), "Low": float(sub["Low"].min()),
+                   "Close": float(sub["Close"].iloc[-1]), "Volume": vol}
+        else:
+            bar = dict(bar, High=max(bar["High"], float(sub["High"].max())),
+                       Low=min(bar["Low"], float(sub["Low"].min())),
+                       Close=float(sub["Close"].iloc[-1]), Volume=bar["Volume"] + vol)
+        self.seen[symbol] = (sub.index[-1], float(sub["Volume"].iloc[-1]))
+        changed = self.day.get(symbol) != bar
+        self.day[symbol] = bar
+        return changed
+
+    def changes(self, symbols, cursor=None):
+        # 只在開盤到收盤定案前輪詢；盤前、盤後與休市日零網路 I/O
+        symbols = [s for s in symbols if calendar_for(s).is_open(grace=SETTLE_DELAY)]
+        if not symbols:
+            return [], cursor
+        starts = {s: self._start(s) for s in symbols}
+        # 以 epoch 秒傳入：yfinance 把不帶時區的時間當成交易所當地時間，美股會少抓開盤後數小時
+        start = int(min(starts.values()).timestamp())
+        df = yf.download(symbols, start=start, interval="1m",
+                         group_by="ticker", progress=False, auto_adjust=True)
+        out = []
+        if df is None or df.empty:
+            return out, cursor
+        for sym in symbols:
+            try:
+                sub = df[sym] if isinstance(df.columns, pd.MultiIndex) else df
+                sub = sub.dropna(subset=["Close"])
+            except KeyError:
+                continue
+            tz = calendar_for(sym).tz
+            if sub.index.tz is None:
+                sub.index = sub.index.tz_localize("UTC")
+            sub = sub.tz_convert(tz)
+            sub = sub[sub.index >= starts[sym]]
+            if sub.empty:
+                continue
+            if self._fold(sym, sub):
+                out.append((sym, self.day[sym]))
+        return out, cursor
+
+
+# --------------------
+# 報價源：本地模擬（測試 / 離線展示用）
+# --------------------
+class LocalQuoteFeed:
+    """以序號日誌記錄每筆報價，changes() 只掃描游標之後的紀錄"""
+
+    def __init__(self, seed=0, base_date=None):
+        self.rng = np.random.default_rng(seed)
+        self.base_date = pd.Timestamp(base_date or date.today())
+        self.journal = []
+        self.bars = {}
+        self.latest = {}
+
+    def resolve(self, code):
+        return str(code)
+
+    def history(self, symbol, start_dt, end_dt):
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        idx = pd.bdate_range(pd.Timestamp(start_dt).normalize(), self.base_date - timedelta(days=1))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(idx))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(idx)))
+        df = pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, len(idx))),
+            "Low": np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, len(idx))),
+            "Close": close,
+            "Volume": rng.integers(1_000, 50_000, len(idx)).astype(float) * 1000,
+        }, index=idx)
+        self.bars[symbol] = df.iloc[-1].to_dict()
+        return df
+
+    def push(self, symbol, close, volume=0.0):
+        today = self.latest.get(symbol)
+        if today is None:
+            prev_close = self.bars.get(symbol, {"Close": close})["Close"]
+            bar = {"Date": self.base_date, "Open": prev_close,
+                   "High": max(prev_close, close), "Low": min(prev_close, close),
+                   "Close": close, "Volume": volume}
+        else:
+            bar = dict(today, High=max(today["High"], close), Low=min(today["Low"], close),
+                       Close=close, Volume=today["Volume"] + volume)
+        self.latest[symbol] = bar
+        self.journal.append((symbol, bar))
+
+    def tick(self, symbols, n=3, vol=0.01):
+        """隨機挑 n 檔產生一筆新報價"""
+        symbols = list(symbols)
+        for i in self.rng.choice(len(symbols), size=min(n, len(symbols)), replace=False):
+            sym = symbols[i]
+            last = self.latest.get(sym) or self.bars.get(sym)
+            if last is None:
+                continue
+            close = last["Close"] * (1 + self.rng.normal(0, vol))
+            self.push(sym, close, float(self.rng.integers(100, 5_000)) * 1000)
+
+    def changes(self, symbols, cursor=None):
+        cursor = cursor or 0
+        wanted = symbols if isinstance(symbols, (set, dict)) else set(symbols)
+        latest = {}
+        for sym, bar in self.journal[cursor:]:
+            if sym in wanted:
+                latest[sym] = bar
+        return list(latest.items()), len(self.journal)
+
+
+# --------------------
+# 即時監控核心
+# --------------------
+class LiveMonitor:
+    def __init__(self, codes, feed=None, target_date=None):
+        self.feed = feed or YFinanceQuoteFeed()
+        self.target_date = target_date or date.today()
+        self.cursor = None
+        self.raw = {}       # feed 代號 -> 原始 OHLCV
+        self.rows = {}      # 顯示代號 -> 顯示列
+        self.code_of = {}   # feed 代號 -> 顯示代號
+        self.status_count = {}
+        self.min_bars = {}  # feed 代號 -> fetch_plan 推算的最少 K 棒數
+        self._load(codes)
+
+    # ---------- 初始化 ----------
+    def _load(self, codes):
+        end_dt = datetime.combine(self.target_date, datetime.min.time()) + timedelta(days=1)
+        for code in dict.fromkeys(codes):
+            symbol = self.feed.resolve(code)
+            plan = plan_fetch("zscore", end_dt, symbol)  # 只顯示狀態，不需要回溯
+            raw = self.feed.history(symbol, plan.start, end_dt)
+            if raw is None or raw.empty:
+                continue
+            self.raw[symbol] = raw[OHLCV].copy()
+            self.code_of[symbol] = code
+            self.min_bars[symbol] = plan.min_bars
+            row = self._evaluate(symbol)
+            if row is not None:
+                self._set_row(code, row)
+
+    # ---------- 單股重算 ----------
+    def _evaluate(self, symbol):
+        df = calc_indicators(self.raw[symbol])
+        if len(df) < self.min_bars[symbol]:
+            return None
+        op, last, sz, scz = get_four_dimension_advice(df, len(df) - 1)
+        status, _ = map_status(op, sz)
+        curr = df.iloc[-1]
+        return {
+            "代號": self.code_of[symbol],
+            "時間": df.index[-1].strftime("%Y-%m-%d"),
+            "收盤": round(float(curr["Close"]), 2),
+            "狀態": status,
+            "PVO": round(float(curr["PVO"]), 2),
+            "VRI": round(float(curr["VRI"]), 2),
+            "Slope_Z": round(float(sz), 2),
+            "Score_Z": round(float(scz), 2),
+            "_rank": STATUS_RANK.get(status, 99),
+        }
+
+    def _set_row(self, code, row):
+        old = self.rows.get(code)
+        if old is not None:
+            self.status_count[old["狀態"]] -= 1
+            if self.status_count[old["狀態"]] == 0:
+                del self.status_count[old["狀態"]]
+        self.rows[code] = row
+        self.status_count[row["狀態"]] = self.status_count.get(row["狀態"], 0) + 1
+        return old
+
+    def _merge_bar(self, symbol, bar):
+        raw = self.raw[symbol]
+        ts = pd.Timestamp(bar["Date"])
+        values = [bar[c] for c in OHLCV]
+        if len(raw) and raw.index[-1] == ts:
+            raw.iloc[-1] = values
+        elif not len(raw) or raw.index[-1] < ts:
+            raw.loc[ts] = values
+        else:
+            return False
+        return True
+
+    # ---------- 每輪輪詢 ----------
+    def step(self):
+        """回傳 {changed: [列], transitions: [(代號, 舊狀態, 新狀態)], counts: {...}}"""
+        changes, self.cursor = self.feed.changes(self.raw, self.cursor)
+        changed, transitions = [], []
+        for symbol, bar in changes:
+            if symbol not in self.raw or not self._merge_bar(symbol, bar):
+                continue
+            row = self._evaluate(symbol)
+            if row is None:
+                continue
+            code = self.code_of[symbol]
+            old = self._set_row(code, row)
+            changed.append(row)
+            if old is None or old["狀態"] != row["狀態"]:
+                transitions.append((code, old["狀態"] if old else None, row["狀態"]))
+        return {"changed": changed, "transitions": transitions, "counts": dict(self.status_count)}
+
+    def table(self):
+        if not self.rows:
+            return pd.DataFrame()
+        return pd.DataFrame(list(self.rows.values()))\
+            .sort_values(["_rank", "Slope_Z"], ascending=[True, False])\
+            .drop(columns=["_rank"])
+
+    @staticmethod
+    def diff_table(diff):
+        """step() 的變動列 -> 顯示用 DataFrame（排序同 table()）"""
+        if not diff["changed"]:
+            return pd.DataFrame()
+        return pd.DataFrame(diff["changed"])\
+            .sort_values(["_rank", "Slope_Z"], ascending=[True, False])\
+            .drop(columns=["_rank"]).reset_index(drop=True)
+
+    def run(self, interval=30, cycles=None, on_update=None):
+        n = 0
+        while cycles is None or n < cycles:
+            diff = self.step()
+            if on_update is not None and diff["changed"]:
+                on_update(diff)
+            n += 1
+            if cycles is None or n < cycles:
+                time.sleep(interval)
+
+
+# --------------------
+# 主程式（本地模擬報價）
+# --------------------
+if __name__ == "__main__":
+    from config import WATCH_LIST
+    feed = LocalQuoteFeed(seed=42)
+    mon = LiveMonitor(WATCH_LIST[:20], feed=feed)
+    print(mon.table().head(10))
+    for _ in range(5):
+        feed.tick(mon.raw, n=3)
+        diff = mon.step()
+        print(f"變動 {len(diff['changed'])} 檔，狀態轉換 {diff['transitions']}")
@@ -0,0 +1,186 @@
+# =====================================================
+# SJ 市場掃描 - 單檔計算 + 多程序分段掃描
+# =====================================================
+# app.py 市場分析的逐檔計算集中在 scan_symbol。
+# run_scan 把清單切段交給子程序；子程序把結果列與指標 K 棒寫成 Arrow IPC 檔，
+# 只回傳檔案路徑與失敗紀錄，主程序以 memory map 讀回（見 scan_ipc.py）。
+# 每個子程序有自己的 FetchGuard / 斷路器；跳脫時間放在共用記憶體（multiprocessing.Value），
+# 任一子程序跳脫，其他子程序與主程序立即跟著停手。
+# workers=0 時在本程序執行，輸出相同的 Arrow Table。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from analysis_engine import get_indicator_data, get_taiwan_symbol, prefetch_ohlcv
+from backtest_5d import get_four_dimension_advice
+from fetch_guard import guard
+from fetch_plan import plan_fetch
+from profiling import profiler, profiled
+from scan_history import ScanHistory
+from scan_ipc import RowBuffer, BarBuffer, ScanTables, write_ipc, read_ipc, new_run_dir
+from signal_status import map_status, STATUS_RANK
+from timeframes import get_timeframe_status
+from trading_calendar import calendar_for
+from trend_stability import calc_trend_stability, interpret_trend_stability
+
+# --------------------
+# 核心參數
+# --------------------
+CHUNKS_PER_WORKER = 2  # 每個子程序分到的段數；段數越多負載越平均
+# 月線需要兩年以上的日 K，全市場都抓太貴；掃描只算週線，月線留在單股分析
+SCAN_TIMEFRAMES = ("週",)
+
+# 結果列欄位型別固定，各子程序的 IPC 檔可直接串接
+ROW_SCHEMA = pa.schema(
+    [("代號", pa.string()), ("收盤", pa.float64()), ("狀態", pa.string()), ("操作建議", pa.string()),
+     ("PVO", pa.float64()), ("VRI", pa.float64()), ("Slope_Z", pa.float64()), ("Score_Z", pa.float64()),
+     ("20日擴散率%", pa.float64()), ("趨勢解讀", pa.string())]
+    + [f for tf in SCAN_TIMEFRAMES for f in [(f"{tf}線狀態", pa.string()), (f"{tf}線Slope_Z", pa.float64())]]
+    + [("_rank", pa.int64()), ("_日期", pa.timestamp("ns")), ("_定案", pa.bool_()), ("_昨日狀態", pa.string())]
+)
+
+
+def _round(v, nd=2):
+    return round(float(v), nd) if v is not None and not pd.isna(v) else None
+
+
+# --------------------
+# 單檔計算
+# --------------------
+@profiled
+def scan_symbol(sym, end_dt, history=None):
+    """回傳 (結果列, 指標 df)；資料不足時回傳 (None, None)"""
+    symbol = get_taiwan_symbol(sym)
+    # 多抓一根：比較昨日狀態
+    plan = plan_fetch("stability", end_dt, symbol, extra_bars=1, timeframes=SCAN_TIMEFRAMES)
+    df = get_indicator_data(symbol, plan.start, end_dt)
+    if df is None or len(df) < plan.min_bars:
+        return None, None
+
+    op, last, sz, scz = get_four_dimension_advice(df, len(df) - 1)
+    status, _ = map_status(op, sz)
+    curr = df.iloc[-1]
+
+    trend_ratio, _, _ = calc_trend_stability(df, 20)
+    trend_text, _ = interpret_trend_stability(trend_ratio)
+
+    # 週 / 月線：由同一份日 K 重新取樣，不另外抓資料
+    tf_cols = {}
+    for tf in SCAN_TIMEFRAMES:
+        tf_status, tf_sz, _ = get_timeframe_status(symbol, df, tf)
+        tf_cols[f"{tf}線狀態"] = tf_status
+        tf_cols[f"{tf}線Slope_Z"] = _round(tf_sz)
+
+    # 掃描歷史已有昨日「收盤定案後」的狀態時直接沿用，不重算前一天；盤中寫入的暫定值不算
+    status_prev = None
+    if len(df) > 1:
+        if history is not None:
+            status_prev = history.values_on(df.index[-2], final_only=True).get(sym)
+        if not status_prev:
+            op_prev, _, sz_prev, _ = get_four_dimension_advice(df, len(df) - 2)
+            status_prev, _ = map_status(op_prev, sz_prev)
+
+    is_tw = ".TW" in symbol or ".TWO" in symbol
+    row = {
+        "代號": sym,
+        "收盤": _round(curr.get("Close"), 0 if is_tw else 2),
+        "狀態": status,
+        "操作建議": op,
+        "PVO": _round(curr.get("PVO")),
+        "VRI": _round(curr.get("VRI")),
+        "Slope_Z": _round(sz),
+        "Score_Z": _round(scz),
+        "20日擴散率%": trend_ratio,
+        "趨勢解讀": trend_text,
+        **tf_cols,
+        "_rank": STATUS_RANK.get(status, 99),
+        "_日期": pd.Timestamp(df.index[-1]).tz_localize(None),
+        "_定案": calendar_for(symbol).is_final(df.index[-1]),
+        "_昨日狀態": status_prev,
+    }
+    return row, df
+
+
+def _scan_codes(codes, end_dt, history_name=None):
+    history = ScanHistory(history_name) if history_name else None
+    prefetch_ohlcv([plan_fetch("stability", end_dt, get_taiwan_symbol(s), extra_bars=1, timeframes=SCAN_TIMEFRAMES)
+                    for s in codes])
+    rows, bars = RowBuffer(), BarBuffer()
+    for sym in codes:
+        row, df = scan_symbol(sym, end_dt, history)
+        if row is None:
+            continue
+        rows.add(row)
+        bars.add(sym, df)
+    return rows, bars
+
+
+def _init_worker(breaker_shared):
+    """子程序啟動：斷路器改用主程序建立的共用跳脫時間"""
+    guard.breaker.share(breaker_shared)
+
+
+def _scan_chunk(codes, end_dt, history_name, out_dir, part, profile=None):
+    """子程序入口：寫出兩個 IPC 檔，只回傳路徑、失敗紀錄與效能統計"""
+    guard.reset_report()
+    if profile is not None:
+        # 同一子程序會處理多段，每段只回傳自己的統計
+        profiler.reset()
+        profiler.enable(track_alloc=profile == "alloc")
+    rows, bars = _scan_codes(codes, end_dt, history_name)
+    paths = None
+    if len(rows):
+        paths = (write_ipc(os.path.join(out_dir, f"rows_{part:03d}.arrow"), [rows.batch(ROW_SCHEMA)], ROW_SCHEMA),
+                 write_ipc(os.path.join(out_dir, f"bars_{part:03d}.arrow"), bars.batches, bars.schema()))
+    return paths, guard.report, profiler.snapshot() if profile is not None else None
+
+
+# --------------------
+# 主程序端
+# --------------------
+def run_scan(codes, end_dt, history_name=None, workers=0):
+    """回傳 ScanTables（rows：結果列 Table；frame / close_panel：指標 K 棒）"""
+    codes = list(dict.fromkeys(codes))
+    if workers <= 0 or len(codes) < 2:
+        rows, bars = _scan_codes(codes, end_dt, history_name)
+        if not len(rows):
+            return ScanTables(None, [])
+        return ScanTables(pa.Table.from_batches([rows.batch(ROW_SCHEMA)]), [bars.table()])
+
+    out_dir = new_run_dir()
+    n_chunks = min(len(codes), workers * CHUNKS_PER_WORKER)
+    chunks = [codes[i::n_chunks] for i in range(n_chunks)]
+    # spawn 的子程序不繼承主程序的開關，分析模式需明確傳入
+    profile = ("alloc" if profiler.track_alloc else "on") if profiler.enabled else None
+    ctx = multiprocessing.get_context("spawn")  # streamlit 執行緒環境下不用 fork
+    breaker_shared = ctx.Value("d", guard.breaker.tripped_at)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(breaker_shared,)) as pool:
+        futures = [pool.submit(_scan_chunk, c, end_dt, history_name, out_dir, i, profile)
+                   for i, c in enumerate(chunks)]
+        outputs = [f.result() for f in futures]
+    guard.breaker.adopt(breaker_shared.value)
+
+    row_tables, bar_tables = [], []
+    for paths, report, prof in outputs:
+        guard.merge_report(report)
+        if prof is not None:
+            profiler.merge(prof)
+        if paths is not None:
+            row_tables.append(read_ipc(paths[0]))
+            bar_tables.append(read_ipc(paths[1]))
+    if not row_tables:
+        return ScanTables(None, [])
+    # 子程序的順序為交錯切段，依原清單順序重排結果列
+    rows = pa.concat_tables(row_tables)
+    order = {c: i for i, c in enumerate(codes)}
+    rows = rows.take(np.argsort([order[c] for c in rows.column("代號").to_pylist()], kind="stable"))
+    return ScanTables(rows, bar_tables)
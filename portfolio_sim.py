@@ -0,0 +1,185 @@
+# =====================================================
+# SJ 投組模擬 - 依 map_status 訊號每日調倉
+# =====================================================
+# 面板為 (日期, 代號)。選股、權重、目標張數都以整個陣列一次計算；
+# 每日迴圈只剩幾個長度為代號數的向量運算（張數取整與現金需要逐日推進）。
+# 不使用融資：每日先賣後買，買進金額以當下現金為上限，現金永不為負。
+# 台股成本：手續費 0.1425%（買賣皆收）、證交稅 0.3%（賣出）。
+
+# --------------------
+# 套件導入
+# --------------------
+import numpy as np
+import pandas as pd
+
+from data_archive import Archive, rolling_z, zscore_panel
+from signal_status import STATUS_LIST, STATUS_RANK, LONG_STATUSES, map_status_array
+
+# --------------------
+# 核心參數
+# --------------------
+FEE_RATE = 0.001425
+TAX_RATE = 0.003
+LOT_SIZE = 1000
+TRADING_DAYS = 252
+
+
+# --------------------
+# 選股與權重（整個面板一次算完）
+# --------------------
+def rank_key(slope_z, score_z, long_statuses=LONG_STATUSES):
+    """排序鍵面板：狀態名次優先、同名次 Score_Z 高者優先；非多方狀態為 inf"""
+    codes = map_status_array(slope_z)
+    rank_of = np.array([STATUS_RANK[s] for s in STATUS_LIST] + [99], dtype=float)
+    rank = rank_of[codes]  # codes == -1 取到最後一個 99
+    eligible = np.isin(codes, [STATUS_LIST.index(s) for s in long_statuses])
+    key = rank * 1e3 - np.nan_to_num(score_z, nan=-1e2)
+    return np.where(eligible, key, np.inf)
+
+
+def candidate_order(key, n):
+    """每日排序鍵最小的前 n 檔（已排序），回傳 (日期, n) 索引"""
+    n = min(n, key.shape[1])
+    part = np.argpartition(key, n - 1, axis=1)[:, :n]
+    rows = np.arange(key.shape[0])[:, None]
+    return part[rows, np.argsort(key[rows, part], axis=1)]
+
+
+def inverse_vol(close, vol_window=20):
+    vol = pd.DataFrame(close).pct_change().rolling(vol_window, min_periods=5).std().to_numpy()
+    return np.nan_to_num(np.divide(1.0, vol, out=np.full_like(vol, np.nan), where=vol > 0))
+
+
+# --------------------
+# 模擬
+# --------------------
+def simulate(close, slope_z, score_z, capital=1_000_000, max_positions=10,
+             weighting="equal", lot_size=LOT_SIZE, fee=FEE_RATE, tax=TAX_RATE,
+             delay=1, hold_while_long=True, resize=False, long_statuses=LONG_STATUSES):
+    """
+    close / slope_z / score_z：DataFrame（index 為日期、columns 為代號）或同形狀陣列。
+    delay=1 表示第 t 日收盤的訊號在第 t+1 日收盤成交，避免用到當日資訊。
+    hold_while_long=True 時持股只要仍是多方狀態就續抱，空出的名額才依排名補入。
+    resize=False 時續抱的部位不隨權益重新調整張數，只處理進出場。
+    weighting："equal" 每檔 1/max_positions；"vol" 依 1/波動度分配同樣的總曝險。
+    """
+    index = close.index if isinstance(close, pd.DataFrame) else pd.RangeIndex(len(close))
+    px_raw = np.asarray(close, dtype=float)
+    px = np.nan_to_num(pd.DataFrame(px_raw).ffill().to_numpy())
+    tradable = ~np.isnan(px_raw)
+    key = rank_key(np.asarray(slope_z, dtype=float), np.asarray(score_z, dtype=float), long_statuses)
+    eligible = np.isfinite(key)
+    cand = candidate_order(key, max_positions * 3)
+    inv_vol = inverse_vol(px) if weighting == "vol" else None
+
+    n_days, n_sym = px.shape
+    shares = np.zeros(n_sym)
+    cash = float(capital)
+    out = np.zeros((n_days, 6))  # 權益、曝險、換手、持股數、成本、現金
+    for t in range(n_days):
+        p = px[t]
+        s = t - delay
+        sel = np.zeros(n_sym, dtype=bool)
+        if s >= 0:
+            if hold_while_long:
+                sel = (shares > 0) & eligible[s]
+            free = max_positions - int(sel.sum())
+            for c in cand[s]:
+                if free <= 0 or not eligible[s, c]:
+                    break
+                if not sel[c]:
+                    sel[c] = True
+                    free -= 1
+        if inv_vol is None:
+            w = sel / float(max_positions)
+        else:
+            iv = inv_vol[s] * sel if s >= 0 else np.zeros(n_sym)
+            w = iv / iv.sum() * (sel.sum() / max_positions) if iv.sum() > 0 else sel / float(max_positions)
+
+        equity = cash + shares @ p
+        lot_value = p * lot_size
+        target = np.floor(np.divide(w * equity, lot_value,
+                                    out=np.zeros(n_sym), where=lot_value > 0)) * lot_size
+        if not resize:
+            target = np.where((shares > 0) & sel, shares, target)
+        target = np.where(tradable[t], target, shares)  # 停牌不交易
+        trade = target - shares
+        # 先賣後買：買進只能用賣出後的現金（含手續費），不足時各檔等比例減碼到整張
+        sell = np.clip(-trade, 0, None)
+        sell_val = sell @ p
+        cash += sell_val * (1 - fee - tax)
+        buy = np.clip(trade, 0, None)
+        buy_val = buy @ p
+        budget = max(cash, 0.0) / (1 + fee)
+        if buy_val > budget:
+            buy = np.floor(buy * (budget / buy_val) / lot_size) * lot_size
+            buy_val = buy @ p
+        cash -= buy_val * (1 + fee)
+        cost = buy_val * fee + sell_val * (fee + tax)
+        shares = shares - sell + buy
+        hold_val = shares @ p
+        equity = cash + hold_val
+        out[t] = (equity, hold_val / equity if equity else 0.0,
+                  (buy_val + sell_val) / equity if equity else 0.0,
+                  np.count_nonzero(shares), cost, cash)
+
+    return pd.DataFrame({
+        "權益": out[:, 0],
+        "曝險%": out[:, 1] * 100,
+        "換手率%": out[:, 2] * 100,
+        "持股數": out[:, 3].astype(int),
+        "成本": out[:, 4],
+        "現金": out[:, 5],
+    }, index=index)
+
+
+def summarize(result, capital=None):
+    eq = result["權益"]
+    capital = capital or eq.iloc[0]
+    years = max(len(eq) / TRADING_DAYS, 1e-9)
+    daily = eq.pct_change().dropna()
+    peak = eq.cummax()
+    return {
+        "總報酬%": round((eq.iloc[-1] / capital - 1) * 100, 2),
+        "年化報酬%": round(((eq.iloc[-1] / capital) ** (1 / years) - 1) * 100, 2),
+        "最大回撤%": round(((eq / peak) - 1).min() * 100, 2),
+        "Sharpe": round(daily.mean() / (daily.std() + 1e-12) * np.sqrt(TRADING_DAYS), 2),
+        "平均曝險%": round(result["曝險%"].mean(), 1),
+        "年化換手率%": round(result["換手率%"].mean() * TRADING_DAYS, 1),
+        "總成本": round(result["成本"].sum(), 0),
+    }
+
+
+# --------------------
+# 資料來源
+# --------------------
+def panels_from_frames(frames):
+    """{代號: get_indicator_data 結果} -> (close, slope_z, score_z) DataFrame"""
+    frames = {k: v for k, v in frames.items() if v is not None and not v.empty}
+    close = pd.DataFrame({k: v["Close"] for k, v in frames.items()}).sort_index()
+    slope = pd.DataFrame({k: v["Slope"] for k, v in frames.items()}).reindex(close.index)
+    score = pd.DataFrame({k: v["Score"] for k, v in frames.items()}).reindex(close.index)
+    z = lambda df: pd.DataFrame(rolling_z(df.to_numpy().T).T, index=df.index, columns=df.columns).where(df.notna())
+    return close, z(slope), z(score)
+
+
+def panels_from_archive(archive, start=None, end=None):
+    """由 data_archive 取 (close, slope_z, score_z)；Close 為記憶體映射 view 的轉置"""
+    ds = archive.date_slice(start, end)
+    idx = archive.dates[ds]
+    close = pd.DataFrame(archive.field("Close")[:, ds].T, index=idx, columns=archive.symbols)
+    sz = pd.DataFrame(zscore_panel(archive, "Slope", start, end).T, index=idx, columns=archive.symbols)
+    scz = pd.DataFrame(zscore_panel(archive, "Score", start, end).T, index=idx, columns=archive.symbols)
+    return close, sz, scz
+
+
+# --------------------
+# 主程式
+# --------------------
+if __name__ == "__main__":
+    import sys
+    arc = Archive(sys.argv[1] if len(sys.argv) > 1 else "archive_tw")
+    close, sz, scz = panels_from_archive(arc)
+    for w in ["equal", "vol"]:
+        res = simulate(close, sz, scz, weighting=w)
+        print(w, summarize(res))
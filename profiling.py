@@ -0,0 +1,254 @@
+# =====================================================
+# SJ 效能分析 - 熱點函式的逐檔耗時與配置統計
+# =====================================================
+# 全域計時看不出哪幾檔特別貴（歷史很長、上櫃代號探測兩次、回溯很深）。
+# 以 @profiled 標記熱點函式；開啟分析模式（SJ_PROFILE=1，或 app 側邊欄勾選）後，
+# 每次呼叫依（代號, 函式）累計呼叫次數、累計 / 自身時間，
+# SJ_PROFILE=alloc 時另以 tracemalloc 記錄淨配置量。
+# 代號取自：profiler.symbol(...) 區塊 > 第一個字串參數 > DataFrame.attrs["symbol"]；
+# 代號解析函式（2330 -> 2330.TW）的結果記為別名，之後的呼叫都歸回輸入代號。
+# 關閉時包裝只多一次開關查詢。
+# 分析器是模組層級的單例；streamlit 同一程序服務多位使用者，
+# 各自的開關與統計放在 ProfileState，以 profiler.bind(...) 綁定到該使用者的執行緒。
+# 輸出：report.csv（可排序的明細）與 stacks.folded（flamegraph.pl / speedscope 可讀的摺疊堆疊）。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import sys
+import time
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+from fetch_guard import CACHE_DIR
+
+# --------------------
+# 核心參數
+# --------------------
+PROFILE_DIR = os.path.join(CACHE_DIR, "profile")
+NO_SYMBOL = "-"
+
+
+# --------------------
+# 分析器
+# --------------------
+class ProfileState:
+    """一組開關與統計：程序共用一份，app 另為每個 session 保留一份"""
+
+    def __init__(self):
+        self.enabled = False
+        self.track_alloc = False
+        self.reset()
+
+    def reset(self):
+        self.stats = {}   # (代號, 函式) -> [呼叫次數, 累計秒, 自身秒, 累計配置, 自身配置]
+        self.stacks = {}  # "代號;外層;...;函式" -> 自身秒
+
+
+class Profiler:
+    def __init__(self):
+        mode = os.environ.get("SJ_PROFILE", "")
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.aliases = {}  # 解析後代號 -> 輸入代號
+        self.shared = ProfileState()  # 未綁定的執行緒（CLI、掃描子程序）使用
+        if mode not in ("", "0"):
+            self.enable(track_alloc=mode == "alloc")
+
+    # ---------- 開關 ----------
+    def bind(self, state):
+        """本執行緒之後的呼叫改用 state 的開關與統計；None 還原為程序共用的一份"""
+        self._local.state = state
+        return state
+
+    @property
+    def state(self):
+        return getattr(self._local, "state", None) or self.shared
+
+    @property
+    def enabled(self):
+        return self.state.enabled
+
+    @property
+    def track_alloc(self):
+        return self.state.track_alloc
+
+    def enable(self, track_alloc=False):
+        state = self.state
+        state.track_alloc = track_alloc
+        if track_alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        state.enabled = True
+
+    def disable(self):
+        state = self.state
+        state.enabled = False
+        if state.track_alloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        state.track_alloc = False
+
+    def reset(self):
+        with self.lock:
+            self.state.reset()
+
+    # ---------- 代號歸屬 ----------
+    def _frames(self):
+        if not hasattr(self._local, "frames"):
+            self._local.frames = []
+            self._local.symbols = []
+        return self._local.frames
+
+    @contextmanager
+    def symbol(self, sym):
+        """區塊內的呼叫都歸到 sym（用於參數裡沒有代號的函式）"""
+        self._frames()
+        self._local.symbols.append(str(sym))
+        try:
+            yield
+        finally:
+            self._local.symbols.pop()
+
+    def _symbol_of(self, args, frames):
+        if self._local.symbols:
+            return self._local.symbols[-1]
+        if args:
+            a = args[0]
+            if isinstance(a, str):
+                return self.aliases.get(a, a)
+            attrs = getattr(a, "attrs", None)
+            if isinstance(attrs, dict) and "symbol" in attrs:
+                return self.aliases.get(attrs["symbol"], attrs["symbol"])
+        return frames[0][3] if frames else NO_SYMBOL
+
+    # ---------- 包裝 ----------
+    def wrap(self, func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            frames = self._frames()
+            sym = self._symbol_of(args, frames)
+            frame = [name, 0.0, 0, sym]  # 函式, 子呼叫時間, 子呼叫配置, 代號
+            track = self.track_alloc and tracemalloc.is_tracing()
+            a0 = tracemalloc.get_traced_memory()[0] if track else 0
+            frames.append(frame)
+            t0 = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                da = tracemalloc.get_traced_memory()[0] - a0 if track else 0
+                frames.pop()
+                if frames:
+                    frames[-1][1] += dt
+                    frames[-1][2] += da
+                self._record(sym, name, dt, dt - frame[1], da, da - frame[2],
+                             [f[0] for f in frames] + [name], frames)
+            if isinstance(result, pd.DataFrame) and sym != NO_SYMBOL:
+                result.attrs.setdefault("symbol", sym)
+            elif isinstance(result, str) and args and isinstance(args[0], str) and result != sym:
+                self.aliases[result] = sym
+            return result
+
+        return wrapper
+
+    def _record(self, sym, name, cum, self_t, cum_a, self_a, path, frames):
+        root = frames[0][3] if frames and frames[0][3] != NO_SYMBOL else sym
+        key = ";".join([root] + path)
+        state = self.state
+        with self.lock:
+            s = state.stats.setdefault((sym, name), [0, 0.0, 0.0, 0, 0])
+            s[0] += 1
+            # 同一函式遞迴時只在最外層計入累計值
+            if name not in path[:-1]:
+                s[1] += cum
+                s[3] += cum_a
+            s[2] += self_t
+            s[4] += self_a
+            state.stacks[key] = state.stacks.get(key, 0.0) + self_t
+
+    # ---------- 子程序合併 ----------
+    def snapshot(self):
+        state = self.state
+        with self.lock:
+            return {"stats": {k: list(v) for k, v in state.stats.items()}, "stacks": dict(state.stacks)}
+
+    def merge(self, snap):
+        state = self.state
+        with self.lock:
+            for k, v in snap["stats"].items():
+                s = state.stats.setdefault(tuple(k), [0, 0.0, 0.0, 0, 0])
+                for i, x in enumerate(v):
+                    s[i] += x
+            for k, v in snap["stacks"].items():
+                state.stacks[k] = state.stacks.get(k, 0.0) + v
+
+    # ---------- 報表 ----------
+    def report(self, sort="自身秒"):
+        rows = [{
+            "代號": sym, "函式": name, "呼叫次數": n,
+            "累計秒": round(cum, 4), "自身秒": round(self_t, 4),
+            "平均毫秒": round(cum / n * 1000, 3) if n else 0.0,
+            "累計配置KB": round(cum_a / 1024, 1), "自身配置KB": round(self_a / 1024, 1),
+        } for (sym, name), (n, cum, self_t, cum_a, self_a) in self.snapshot()["stats"].items()]
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows).sort_values(sort, ascending=False).reset_index(drop=True)
+
+    def by_symbol(self):
+        """每檔的總自身時間（= 該檔所有熱點函式的總耗時），由貴到便宜"""
+        df = self.report()
+        if df.empty:
+            return df
+        out = df.groupby("代號").agg(呼叫次數=("呼叫次數", "sum"), 總秒=("自身秒", "sum"),
+                                    配置KB=("自身配置KB", "sum"))
+        slowest = df.loc[df.groupby("代號")["自身秒"].idxmax()].set_index("代號")["函式"]
+        out["最耗時函式"] = slowest
+        return out.sort_values("總秒", ascending=False).reset_index()
+
+    def folded(self):
+        """摺疊堆疊格式：每行「代號;外層;...;函式 微秒」"""
+        return [f"{k} {int(round(v * 1e6))}" for k, v in sorted(self.snapshot()["stacks"].items())
+                if v > 0]
+
+    def dump(self, out_dir=PROFILE_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        report_path = os.path.join(out_dir, "report.csv")
+        stacks_path = os.path.join(out_dir, "stacks.folded")
+        self.report().to_csv(report_path, index=False, encoding="utf-8-sig")
+        with open(stacks_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.folded()) + "\n")
+        return report_path, stacks_path
+
+
+# 全域共用實例
+profiler = Profiler()
+
+
+def profiled(func):
+    return profiler.wrap(func)
+
+
+# --------------------
+# 主程式：對觀察清單跑一次市場掃描並輸出報表
+# --------------------
+if __name__ == "__main__":
+    # python profiling.py [檔數]
+    from datetime import date, datetime, timedelta
+    from config import WATCH_LIST
+    from market_scan import run_scan
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    profiler.enable(track_alloc=os.environ.get("SJ_PROFILE") == "alloc")
+    end_dt = datetime.combine(date.today(), datetime.min.time()) + timedelta(days=1)
+    run_scan(WATCH_LIST[:n], end_dt)
+    print(profiler.by_symbol().head(15).to_string(index=False))
+    print()
+    print(profiler.report().head(15).to_string(index=False))
+    print("\n輸出：", *profiler.dump())
@@ -0,0 +1,435 @@
+# =====================================================
+# SJ 掃描歷史 - 欄式、字典編碼、只增不改的每日掃描紀錄
+# =====================================================
+# 每次市場掃描的結果（狀態、操作建議、Z 分數...）追加一個區段：
+#   - 狀態 / 建議等字串以共用字典編碼成小整數（uint8，超過 255 種自動升為 uint16）
+#   - 代號以代號字典編碼，日期以 2000-01-01 起算的天數（uint16）
+#   - 數值欄位用 float16 / float32 / uint8 等精簡型別
+# 區段為 np.savez_compressed 壓縮檔；區段數超過 COMPACT_AT 時合併成一個，
+# 載入時只需讀少數幾個檔。同一天重跑掃描會追加新區段，讀取時以最後一次為準。
+# 2,000 檔 × 一年的每日快照約數 MB，載入為毫秒等級。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from fetch_guard import CACHE_DIR
+
+# --------------------
+# 核心參數
+# --------------------
+HISTORY_DIR = os.path.join(CACHE_DIR, "scan_history")
+DAY0 = pd.Timestamp("2000-01-01")
+COMPACT_AT = 32
+LOCK_TIMEOUT = 30   # 等待其他程序寫完的秒數
+LOCK_STALE = 120    # 鎖檔超過此秒數視為持有者已當掉
+
+# 類別欄位（字典編碼）
+CATEGORICAL = ["狀態", "操作建議", "趨勢解讀", "週線狀態"]
+
+# 數值欄位與儲存型別；uint8 欄位以 255 表示缺值
+NUMERIC = {
+    "收盤": np.float32,
+    "PVO": np.float16,
+    "VRI": np.float16,
+    "Slope_Z": np.float16,
+    "Score_Z": np.float16,
+    "週線Slope_Z": np.float16,
+    "20日擴散率%": np.uint8,
+}
+UINT8_NA = 255
+
+# 每列另存「寫入時該交易日是否已收盤定案」（1 / 0，255 為舊資料未記錄）；
+# 盤中掃描寫入的是暫定狀態，隔天比較昨日狀態時不可沿用
+FINAL = "final"
+COLUMNS = ["day", "symbol", FINAL] + CATEGORICAL + list(NUMERIC)
+
+
+def _to_day(ts):
+    return np.uint16((pd.Timestamp(ts).normalize() - DAY0).days)
+
+
+def _from_day(code):
+    return DAY0 + pd.to_timedelta(np.asarray(code, dtype=int), unit="D")
+
+
+def _encode_numeric(values, dtype):
+    x = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+    if dtype == np.uint8:
+        return np.where(np.isnan(x), UINT8_NA, np.clip(np.round(x), 0, UINT8_NA - 1)).astype(np.uint8)
+    return x.astype(dtype)
+
+
+def _missing(name, n):
+    """舊區段沒有的欄位：類別為空字串、數值為缺值"""
+    if name in CATEGORICAL:
+        return np.zeros(n, dtype=np.uint8)
+    dtype = NUMERIC.get(name, np.uint8)
+    return np.full(n, UINT8_NA if dtype == np.uint8 else np.nan, dtype=dtype)
+
+
+def _decode_numeric(arr):
+    if arr.dtype == np.uint8:
+        return np.where(arr == UINT8_NA, np.nan, arr.astype(float))
+    return arr.astype(float)
+
+
+@contextmanager
+def _dir_lock(path, timeout=LOCK_TIMEOUT, stale=LOCK_STALE):
+    """跨程序互斥：以 O_EXCL 建立鎖檔（Windows / Linux 皆可用）"""
+    lock = os.path.join(path, "lock")
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > stale:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"掃描歷史鎖定逾時：{lock}")
+            time.sleep(0.02)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+# --------------------
+# 歷史庫
+# --------------------
+# 多個掃描程序 / Streamlit 工作階段可同時寫入同一個歷史庫：
+# 寫入時持有目錄鎖，先重讀磁碟上最新的 meta（字典編碼、區段序號都以它為準）再追加；
+# 讀取時發現 meta 被其他程序換過就重新載入。
+class ScanHistory:
+    def __init__(self, name="default", root=HISTORY_DIR):
+        self.path = os.path.join(root, name)
+        self.meta_file = os.path.join(self.path, "meta.json")
+        self._lock = threading.RLock()
+        self._files = []
+        self._read_meta()
+
+    def _meta_stamp(self):
+        try:
+            st = os.stat(self.meta_file)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _read_meta(self):
+        self._stamp = self._meta_stamp()
+        try:
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            self.meta = {"strings": [""], "symbols": [], "segments": [], "next": 0,
+                         "last_day": -1, "overlap": False}
+        self._string_id = {s: i for i, s in enumerate(self.meta["strings"])}
+        self._symbol_id = {s: i for i, s in enumerate(self.meta["symbols"])}
+        self._reset()
+
+    def _refresh(self):
+        """其他程序寫入過（meta 檔換過）就重新載入"""
+        if self._meta_stamp() != self._stamp:
+            self._read_meta()
+
+    def _reset(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._cols = None
+        self._lookup = {}
+
+    # ---------- 字典 ----------
+    def _codes(self, values, table, index):
+        out = []
+        for v in values:
+            v = "" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)
+            if v not in index:
+                index[v] = len(table)
+                table.append(v)
+            out.append(index[v])
+        return out
+
+    def _string_dtype(self):
+        return np.uint8 if len(self.meta["strings"]) <= 256 else np.uint16
+
+    # ---------- 寫入 ----------
+    def _save_meta(self):
+        tmp = self.meta_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp, self.meta_file)
+        self._stamp = self._meta_stamp()
+
+    def _write_segment(self, cols):
+        name = f"seg_{self.meta['next']:05d}.npz"
+        self.meta["next"] += 1
+        path = os.path.join(self.path, name)
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(f, **cols)
+        os.replace(path + ".tmp", path)
+        return name
+
+    def append(self, day, table, code_col="代號", final=None):
+        """追加一天的掃描結果；table 為掃描輸出的 DataFrame（欄位缺少時存為缺值）。
+        final：該日 K 棒是否已定案（單一布林或逐列陣列，None 為未知）"""
+        if table is None or table.empty:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, _dir_lock(self.path):
+            self._read_meta()
+            return self._append(day, table, code_col, final)
+
+    def _append(self, day, table, code_col, final):
+        table = table.drop_duplicates(subset=[code_col], keep="last")
+        n = len(table)
+        if _to_day(day) <= self.meta.get("last_day", -1):
+            self.meta["overlap"] = True
+        self.meta["last_day"] = max(int(_to_day(day)), self.meta.get("last_day", -1))
+        cols = {
+            "day": np.full(n, _to_day(day), dtype=np.uint16),
+            "symbol": np.asarray(self._codes(table[code_col], self.meta["symbols"], self._symbol_id),
+                                 dtype=np.uint16),
+            FINAL: np.full(n, UINT8_NA, dtype=np.uint8) if final is None
+            else np.broadcast_to(np.asarray(final, dtype=bool), (n,)).astype(np.uint8),
+        }
+        for c in CATEGORICAL:
+            values = table[c] if c in table else [""] * n
+            codes = self._codes(values, self.meta["strings"], self._string_id)
+            cols[c] = np.asarray(codes, dtype=self._string_dtype())
+        for c, dtype in NUMERIC.items():
+            cols[c] = _encode_numeric(table[c] if c in table else [np.nan] * n, dtype)
+        self.meta["segments"].append(self._write_segment(cols))
+        self.meta.setdefault("ranges", []).append([int(cols["day"][0])] * 2)
+        self._reset()
+        if len(self.meta["segments"]) > COMPACT_AT:
+            self._compact()
+        else:
+            self._save_meta()
+        return n
+
+    def compact(self):
+        """所有區段合併為一個（同一天同一代號只留最後一次）"""
+        if not os.path.isdir(self.path):
+            return
+        with self._lock, _dir_lock(self.path):
+            self._read_meta()
+            self._compact()
+
+    def _compact(self):
+        if not self.meta["segments"]:
+            return
+        cols = {k: self._column(k) for k in COLUMNS}
+        old = list(self.meta["segments"])
+        self.meta["segments"] = [self._write_segment(cols)]
+        self.meta["ranges"] = [[int(cols["day"].min()), int(cols["day"].max())]]
+        self.meta["overlap"] = False
+        # 先寫好指向新區段的 meta（原子替換）再刪舊區段：中途當掉時 meta 不會指向不存在的檔案
+        self._save_meta()
+        self._reset()
+        for name in old:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    # ---------- 讀取（逐欄延遲解壓：只查狀態時不必解開數值欄位） ----------
+    def _segments(self):
+        if self._cols is None:
+            try:
+                files = [np.load(os.path.join(self.path, n)) for n in self.meta["segments"]]
+            except FileNotFoundError:
+                # 讀到一半其他程序合併並刪掉了舊區段：改讀最新的 meta
+                self._read_meta()
+                files = [np.load(os.path.join(self.path, n)) for n in self.meta["segments"]]
+            self._cols = {}
+            self._files = files
+            self._order = None
+            if self.meta.get("overlap"):
+                # 同一天重跑：保留最後寫入的列，並依日期排序
+                day = np.concatenate([f["day"] for f in self._files])
+                sym = np.concatenate([f["symbol"] for f in self._files])
+                key = day.astype(np.int64) * 65536 + sym
+                _, last = np.unique(key[::-1], return_index=True)
+                keep = np.sort(len(key) - 1 - last)
+                self._order = keep[np.argsort(day[keep], kind="stable")]
+        return self._files
+
+    def _column(self, name):
+        files = self._segments()
+        if name not in self._cols:
+            parts = [f[name] if name in f.files else _missing(name, len(f["day"])) for f in files]
+            col = np.concatenate(parts) if parts else np.zeros(0)
+            self._cols[name] = col[self._order] if self._order is not None else col
+        return self._cols[name]
+
+    def _load(self):
+        self._refresh()
+        return {"day": self._column("day"), "symbol": self._column("symbol")} \
+            if self.meta["segments"] else None
+
+    def __len__(self):
+        cols = self._load()
+        return 0 if cols is None else len(cols["day"])
+
+    def days(self):
+        cols = self._load()
+        if cols is None:
+            return pd.DatetimeIndex([])
+        return _from_day(np.unique(cols["day"]))
+
+    def _day_rows(self, d):
+        """只讀涵蓋 d 的區段，回傳該日各欄（同代號取最後一次）"""
+        self._refresh()
+        self._segments()
+        ranges = self.meta.get("ranges", [])
+        if len(ranges) != len(self.meta["segments"]):
+            cols = self._load()
+            mask = cols["day"] == d
+            return {k: self._column(k)[mask] for k in COLUMNS}
+        files = [f for f, (lo, hi) in zip(self._files, ranges) if lo <= d <= hi]
+        parts = []
+        for f in files:
+            mask = f["day"] == d
+            n = int(mask.sum())
+            parts.append({k: f[k][mask] if k in f.files else _missing(k, n) for k in COLUMNS})
+        if not parts:
+            return {k: np.zeros(0, dtype=np.uint16) for k in ["day", "symbol"]}
+        rows = {k: np.concatenate([p[k] for p in parts]) for k in COLUMNS}
+        _, last = np.unique(rows["symbol"][::-1], return_index=True)
+        keep = np.sort(len(rows["symbol"]) - 1 - last)
+        return {k: v[keep] for k, v in rows.items()}
+
+    def snapshot(self, day=None):
+        """某一天（預設最近一天）的掃描結果"""
+        self._refresh()
+        if not self.meta["segments"]:
+            return pd.DataFrame()
+        d = _to_day(day) if day is not None else self.meta["last_day"]
+        rows = self._day_rows(d)
+        if len(rows["symbol"]) == 0:
+            return pd.DataFrame()
+        strings = np.asarray(self.meta["strings"], dtype=object)
+        symbols = np.asarray(self.meta["symbols"], dtype=object)
+        out = {"代號": symbols[rows["symbol"]]}
+        for c in CATEGORICAL:
+            out[c] = strings[rows[c]] if c in rows else ""
+        for c in NUMERIC:
+            out[c] = _decode_numeric(rows[c]) if c in rows else np.nan
+        out["_定案"] = rows[FINAL] == 1
+        return pd.DataFrame(out)
+
+    def prev_day(self, day):
+        """day 之前最近一次有紀錄的日期"""
+        days = self.days()
+        days = days[days < pd.Timestamp(day).normalize()]
+        return days[-1] if len(days) else None
+
+    def values_on(self, day, field="狀態", final_only=False):
+        """{代號: 值}；final_only 時只取該日收盤定案後寫入的紀錄。同一天重複查詢直接用快取"""
+        key = (_to_day(day), field, final_only)
+        if key not in self._lookup:
+            snap = self.snapshot(day)
+            if final_only and not snap.empty:
+                snap = snap[snap["_定案"]]
+            self._lookup[key] = dict(zip(snap["代號"], snap[field])) if not snap.empty else {}
+        return self._lookup[key]
+
+    def matrix(self, field="狀態"):
+        """(日期, 代號) 編碼矩陣；類別欄位缺值為 0（空字串），數值欄位為 NaN"""
+        cols = self._load()
+        if cols is None:
+            return pd.DataFrame()
+        days, di = np.unique(cols["day"], return_inverse=True)
+        n_sym = len(self.meta["symbols"])
+        values = self._column(field)
+        if field in CATEGORICAL:
+            m = np.zeros((len(days), n_sym), dtype=values.dtype)
+            m[di, cols["symbol"]] = values
+        else:
+            m = np.full((len(days), n_sym), np.nan)
+            m[di, cols["symbol"]] = _decode_numeric(values)
+        return pd.DataFrame(m, index=_from_day(days), columns=self.meta["symbols"])
+
+    # ---------- 查詢 ----------
+    def diff(self, day=None, prev=None, field="狀態"):
+        """兩天之間 field 有變化的代號（含新增 / 消失）"""
+        days = self.days()
+        if len(days) == 0:
+            return pd.DataFrame(columns=["代號", "前值", "今值"])
+        day = pd.Timestamp(day).normalize() if day is not None else days[-1]
+        prev = pd.Timestamp(prev).normalize() if prev is not None else self.prev_day(day)
+        m = self.matrix(field) if field in CATEGORICAL else None
+        if m is None:
+            raise ValueError(f"diff 只支援類別欄位：{CATEGORICAL}")
+        strings = np.asarray(self.meta["strings"], dtype=object)
+        today = m.loc[day].to_numpy()
+        before = m.loc[prev].to_numpy() if prev is not None else np.zeros_like(today)
+        changed = np.flatnonzero(today != before)
+        return pd.DataFrame({
+            "代號": m.columns[changed],
+            "前值": strings[before[changed]],
+            "今值": strings[today[changed]],
+        })
+
+    def timeline(self, symbol, field="狀態"):
+        """單一代號的狀態區段：起日、迄日、值、天數"""
+        cols = self._load()
+        sid = self._symbol_id.get(symbol)
+        if cols is None or sid is None:
+            return pd.DataFrame(columns=["起日", "迄日", field, "天數"])
+        mask = cols["symbol"] == sid
+        days = _from_day(cols["day"][mask])
+        codes = self._column(field)[mask]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:] - 1, len(codes) - 1]
+        strings = np.asarray(self.meta["strings"], dtype=object)
+        return pd.DataFrame({
+            "起日": days[starts],
+            "迄日": days[ends],
+            field: strings[codes[starts]],
+            "天數": ends - starts + 1,
+        })
+
+    def last_entered(self, value, field="狀態"):
+        """每個代號最近一次「進入」value 的日期（前一次紀錄不是 value）"""
+        code = self._string_id.get(value)
+        m = self.matrix(field)
+        if code is None or m.empty:
+            return pd.Series(dtype="datetime64[ns]")
+        x = m.to_numpy()
+        entered = (x == code) & np.vstack([np.ones((1, x.shape[1]), bool), x[:-1] != code])
+        has = entered.any(axis=0)
+        last = x.shape[0] - 1 - np.argmax(entered[::-1], axis=0)
+        return pd.Series(m.index[last[has]], index=m.columns[has], name=f"最近進入{value}")
+
+    def counts(self, field="狀態"):
+        """(日期, 值) 的數量表"""
+        m = self.matrix(field)
+        if m.empty:
+            return pd.DataFrame()
+        strings = np.asarray(self.meta["strings"], dtype=object)
+        x = m.to_numpy()
+        present = np.unique(x[x != 0])
+        return pd.DataFrame({strings[c]: (x == c).sum(axis=1) for c in present}, index=m.index)
+
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, s)) for s in self.meta["segments"])
@@ -0,0 +1,179 @@
+# =====================================================
+# SJ 掃描結果交換 - Arrow IPC 記憶體映射檔
+# =====================================================
+# 掃描子程序把結果列與指標 K 棒寫成 Arrow record batch（IPC 檔），
+# 主程序（app.py）以 memory map 開啟：數值欄位直接指向檔案頁面，不經 pickle、不複製。
+# 有 /dev/shm（tmpfs 共享記憶體）時寫在那裡，否則寫在 .sj_cache/scan_ipc。
+# pyarrow 為 streamlit 的相依套件，另已明列於 requirements.txt（掃描程序直接匯入）。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import json
+import time
+import uuid
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from fetch_guard import CACHE_DIR
+
+# --------------------
+# 核心參數
+# --------------------
+SHM_DIR = "/dev/shm"
+SCAN_DIR = os.path.join(SHM_DIR, "sj_scan") if os.path.isdir(SHM_DIR) else os.path.join(CACHE_DIR, "scan_ipc")
+BAR_FIELDS = ["Open", "High", "Low", "Close", "Volume", "PVO", "VRI", "Slope", "Score"]
+# 其他程序（另一個 app 工作階段、命令列掃描）的目錄可能還在寫入或被映射，只清超過此秒數的
+RUN_MAX_AGE = 6 * 3600
+
+# 本程序建立過的掃描目錄（由舊到新）
+_own_runs = []
+
+
+# --------------------
+# 結果列：逐欄累積，不建立 list of dicts
+# --------------------
+class RowBuffer:
+    def __init__(self):
+        self.columns = {}
+        self.n = 0
+
+    def add(self, row):
+        for k, v in row.items():
+            if k not in self.columns:
+                self.columns[k] = [None] * self.n
+            self.columns[k].append(v)
+        self.n += 1
+        for k, col in self.columns.items():
+            if len(col) < self.n:
+                col.append(None)
+
+    def __len__(self):
+        return self.n
+
+    def batch(self, schema=None):
+        if schema is not None:
+            return pa.RecordBatch.from_pydict({f.name: self.columns.get(f.name, [None] * self.n)
+                                               for f in schema}, schema=schema)
+        return pa.RecordBatch.from_pydict(self.columns)
+
+
+# --------------------
+# 指標 K 棒：長表（代號, 日期, 欄位...），每檔為連續一段
+# --------------------
+class BarBuffer:
+    def __init__(self, fields=BAR_FIELDS):
+        self.fields = fields
+        self.batches = []
+        self.index = {}  # 代號 -> (起始列, 列數)
+        self.n = 0
+
+    def add(self, symbol, df):
+        n = len(df)
+        idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        arrays = [pa.array(np.full(n, symbol, dtype=object), pa.string()),
+                  pa.array(idx.values.astype("datetime64[ns]"))]
+        arrays += [pa.array(df[f].to_numpy(dtype=np.float64)) if f in df
+                   else pa.nulls(n, pa.float64()) for f in self.fields]
+        self.batches.append(pa.RecordBatch.from_arrays(arrays, ["代號", "Date"] + self.fields))
+        self.index[symbol] = (self.n, n)
+        self.n += n
+
+    def schema(self):
+        fields = [pa.field("代號", pa.string()), pa.field("Date", pa.timestamp("ns"))]
+        fields += [pa.field(f, pa.float64()) for f in self.fields]
+        meta = {b"index": json.dumps(self.index, ensure_ascii=False).encode()}
+        return pa.schema(fields, metadata=meta)
+
+    def table(self):
+        schema = self.schema()
+        return pa.Table.from_batches(self.batches, schema=schema)
+
+
+# --------------------
+# IPC 檔讀寫
+# --------------------
+def write_ipc(path, batches, schema):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for b in batches:
+                writer.write_batch(b)
+    os.replace(tmp, path)
+    return path
+
+
+def read_ipc(path):
+    """memory map 開啟，回傳的 Table 直接參照檔案頁面"""
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def new_run_dir(root=SCAN_DIR, keep=1, max_age=RUN_MAX_AGE):
+    """每次掃描一個目錄（名稱含程序代號與隨機碼，多個工作階段同時掃描不互撞）。
+    本程序的舊目錄只保留最近 keep 個；其他程序的目錄超過 max_age 秒才刪
+    （仍被映射的檔案刪除後照常可讀）"""
+    os.makedirs(root, exist_ok=True)
+    while len(_own_runs) >= max(keep, 1):
+        remove_run_dir(_own_runs.pop(0))
+    cutoff = time.time() - max_age
+    for d in os.listdir(root):
+        p = os.path.join(root, d)
+        if not d.startswith("run_") or p in _own_runs:
+            continue
+        try:
+            if os.path.getmtime(p) < cutoff:
+                shutil.rmtree(p, ignore_errors=True)
+        except OSError:
+            pass
+    path = os.path.join(root, f"run_{pd.Timestamp.now():%Y%m%d_%H%M%S}_{os.getpid()}_{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    _own_runs.append(path)
+    return path
+
+
+def remove_run_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    if path in _own_runs:
+        _own_runs.remove(path)
+
+
+# --------------------
+# 主程序端：合併多個子程序的輸出（concat 只串接 chunk，不複製）
+# --------------------
+class ScanTables:
+    def __init__(self, rows, bars):
+        self.rows = rows
+        self.bars = bars
+        self.index = {}
+        offset = 0
+        for chunk in bars:
+            meta = json.loads((chunk.schema.metadata or {}).get(b"index", b"{}"))
+            self.index.update({s: (offset + a, n) for s, (a, n) in meta.items()})
+            offset += chunk.num_rows
+        self._bars = pa.concat_tables([b.replace_schema_metadata(None) for b in bars]) if bars else None
+
+    def frame(self, symbol):
+        """單檔指標 K 棒（slice 為零複製，轉 DataFrame 時才複製該檔）"""
+        if symbol not in self.index or self._bars is None:
+            return None
+        a, n = self.index[symbol]
+        df = self._bars.slice(a, n).drop(["代號"]).to_pandas()
+        return df.set_index("Date")
+
+    def close_panel(self, tail=None):
+        """(日期, 代號) 收盤價面板，直接由 Arrow 欄位取值"""
+        if self._bars is None:
+            return pd.DataFrame()
+        cols = {}
+        for s, (a, n) in self.index.items():
+            if tail is not None:
+                a, n = a + max(n - tail, 0), min(n, tail)
+            part = self._bars.slice(a, n)
+            cols[s] = pd.Series(part.column("Close").to_numpy(),
+                                index=pd.DatetimeIndex(part.column("Date").to_numpy()))
+        return pd.DataFrame(cols).sort_index()
@@ -0,0 +1,54 @@
+# =====================================================
+# SJ 狀態分類 - app.py / 即時監控 / 其他引擎共用
+# =====================================================
+import numpy as np
+
+# --------------------
+# 狀態分類函式
+# --------------------
+def map_status(op_text, slope_z):
+    if "做空" in op_text or "空單" in op_text:
+        if slope_z < -1.0:
+            return "🔻 空單進場", 1
+        else:
+            return "⚠️ 空頭觀望", 4
+    if slope_z > 1.5:
+        return "⭐ 多單進場", 1
+    if 0.5 < slope_z <= 1.5:
+        return "✅ 多單續抱", 2
+    if abs(slope_z) <= 0.3:
+        return "⚠️ 空手觀望", 4
+    if slope_z > 0:
+        return "⚠️ 多頭觀望", 4
+    return "⚠️ 空頭觀望", 4
+
+STATUS_RANK = {
+    "⭐ 多單進場": 1,
+    "✅ 多單續抱": 2,
+    "⚠️ 多頭觀望": 3,
+    "⚠️ 空手觀望": 4,
+    "🔻 空單進場": 5,
+    "⚠️ 空頭觀望": 6,
+}
+
+LONG_STATUSES = ["⭐ 多單進場", "✅ 多單續抱"]
+
+# --------------------
+# 向量化版本（面板研究 / 回測用）
+# --------------------
+# get_four_dimension_advice 的操作建議不會出現「做空 / 空單」，
+# 因此 map_status 實際只取決於 Slope_Z，可以整個陣列一次分類。
+STATUS_LIST = list(STATUS_RANK)
+
+
+def map_status_array(slope_z):
+    """回傳 STATUS_LIST 的索引陣列，NaN 對應 -1"""
+    sz = np.asarray(slope_z, dtype=float)
+    out = np.select(
+        [sz > 1.5, (sz > 0.5) & (sz <= 1.5), np.abs(sz) <= 0.3, sz > 0],
+        [STATUS_LIST.index("⭐ 多單進場"), STATUS_LIST.index("✅ 多單續抱"),
+         STATUS_LIST.index("⚠️ 空手觀望"), STATUS_LIST.index("⚠️ 多頭觀望")],
+        default=STATUS_LIST.index("⚠️ 空頭觀望"),
+    )
+    out[np.isnan(sz)] = -1
+    return out
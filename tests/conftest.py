@@ -0,0 +1,7 @@
+# 測試一律使用暫存快取目錄，不碰 .sj_cache（需在匯入任何專案模組之前設定）
+import os
+import sys
+import tempfile
+
+os.environ["SJ_CACHE_DIR"] = tempfile.mkdtemp(prefix="sj_test_cache_")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
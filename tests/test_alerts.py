@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from alerts import AlertEngine, MemorySink
+from backtest_5d import get_four_dimension_advice
+from data_archive import Archive, ArchiveWriter, zscore_panel
+from indicator_graph import calc_indicators
+
+TPE = "Asia/Taipei"
+INTRADAY = pd.Timestamp("2026-10-16 10:00", tz=TPE)
+AFTER_CLOSE = pd.Timestamp("2026-10-16 14:30", tz=TPE)
+
+
+def _engine(tmp_path):
+    return AlertEngine(sinks=[MemorySink()], state_file=str(tmp_path / "state.json"))
+
+
+def test_first_record_has_no_event(tmp_path):
+    e = _engine(tmp_path)
+    assert e.update("2330", "2026-10-15", "✅ 多單續抱", 1.0, 1.0) is None
+    assert e.last("2330")["final"] is True
+
+
+def test_transition_into_entry_alerts_once(tmp_path):
+    e = _engine(tmp_path)
+    e.update("2330", "2026-10-14", "✅ 多單續抱", 1.0, 1.0)
+    event = e.update("2330", "2026-10-15", "⭐ 多單進場", 2.0, 1.0)
+    assert event["from"] == "✅ 多單續抱" and event["to"] == "⭐ 多單進場"
+    assert not e.needs_update("2330", "2026-10-15")
+    # 同一天同一狀態重送不會重複通報
+    assert e.update("2330", "2026-10-15", "⭐ 多單進場", 2.0, 1.0) is None
+    assert len(e.flush()) == 1
+
+
+def test_non_entry_status_is_not_alerted(tmp_path):
+    e = _engine(tmp_path)
+    e.update("2330", "2026-10-14", "⭐ 多單進場", 2.0, 1.0)
+    assert e.update("2330", "2026-10-15", "⚠️ 空手觀望", 0.0, 0.0) is None
+
+
+def test_provisional_record_is_reevaluated_after_close(tmp_path):
+    e = _engine(tmp_path)
+    e.update("2330", "2026-10-15", "✅ 多單續抱", 1.0, 1.0)
+    assert e.update("2330", "2026-10-16", "✅ 多單續抱", 1.0, 1.0, now=INTRADAY) is None
+    assert e.last("2330")["final"] is False
+    assert e.needs_update("2330", "2026-10-16")
+    # 定案狀態和前一交易日比較，不是和當天的暫定值比較
+    event = e.update("2330", "2026-10-16", "⭐ 多單進場", 2.0, 1.0, now=AFTER_CLOSE)
+    assert event["from"] == "✅ 多單續抱" and event["定案"] is True
+    assert not e.needs_update("2330", "2026-10-16")
+
+
+def test_final_confirmation_of_provisional_alert(tmp_path):
+    e = _engine(tmp_path)
+    e.update("2330", "2026-10-15", "✅ 多單續抱", 1.0, 1.0)
+    provisional = e.update("2330", "2026-10-16", "⭐ 多單進場", 2.0, 1.0, now=INTRADAY)
+    assert provisional["定案"] is False
+    final = e.update("2330", "2026-10-16", "⭐ 多單進場", 2.1, 1.0, now=AFTER_CLOSE)
+    assert final["定案"] is True and final["from"] == "✅ 多單續抱"
+
+
+def test_state_survives_reload(tmp_path):
+    e = _engine(tmp_path)
+    e.update("2330", "2026-10-15", "✅ 多單續抱", 1.0, 1.0)
+    e.update("2330", "2026-10-16", "⭐ 多單進場", 2.0, 1.0, now=INTRADAY)
+    e.flush()
+    e2 = _engine(tmp_path)
+    assert e2.needs_update("2330", "2026-10-16")
+    assert e2.update("2330", "2026-10-16", "⭐ 多單進場", 2.0, 1.0, now=INTRADAY) is None
+
+
+def _archive_with_gaps(path):
+    idx = pd.bdate_range("2025-06-02", "2026-09-30")
+    frames = {}
+    for k, sym in enumerate(["AAA", "BBB"]):
+        rng = np.random.default_rng(k)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(idx))))
+        df = calc_indicators(pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99,
+                                           "Close": close, "Volume": rng.uniform(1e6, 2e6, len(idx))},
+                                          index=idx))
+        frames[sym] = df
+    # AAA 在最後 60 根內停牌兩段：位置視窗會少算有效 K 棒
+    frames["AAA"] = frames["AAA"].drop(frames["AAA"].index[-50:-35]).drop(frames["AAA"].index[-20:-12])
+    w = ArchiveWriter(str(path), list(frames), idx)
+    for sym, df in frames.items():
+        w.write_symbol(sym, df)
+    w.close()
+    return Archive(str(path))
+
+
+def test_archive_z_counts_valid_bars_like_backtest(tmp_path):
+    arc = _archive_with_gaps(tmp_path / "arc")
+    e = _engine(tmp_path)
+    e.process_archive(arc)
+    panel = zscore_panel(arc, "Slope", dtype=float)
+    for i, sym in enumerate(arc.symbols):
+        df = arc.frame(sym)
+        _, _, sz, scz = get_four_dimension_advice(df, len(df) - 1)
+        assert e.last(sym)["sz"] == pytest.approx(sz, abs=0.011)
+        assert e.last(sym)["scz"] == pytest.approx(scz, abs=0.011)
+        assert e.last(sym)["sz"] == pytest.approx(panel[i, -1], abs=0.011)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chart_utils import build_chart_spec, downsample, lttb, minmax_downsample, status_bands
+from indicator_graph import calc_indicators
+
+
+def _series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.Series(100 + np.cumsum(rng.normal(0, 1, n)), index=pd.bdate_range("2016-01-04", periods=n))
+
+
+@pytest.mark.parametrize("n_buckets", [1, 7, 50, 300])
+def test_minmax_keeps_bucket_extremes_and_ends(n_buckets):
+    y = _series(2_500).to_numpy()
+    idx = minmax_downsample(y, n_buckets)
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert (np.diff(idx) > 0).all() and len(idx) <= 2 * n_buckets + 2
+    edges = np.linspace(0, len(y), n_buckets + 1).astype(int)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        kept = y[idx[(idx >= lo) & (idx < hi)]]
+        assert kept.min() == y[lo:hi].min() and kept.max() == y[lo:hi].max()
+
+
+def test_lttb_keeps_ends_and_spikes():
+    s = _series(5_000, seed=1)
+    s.iloc[1_234] = s.max() + 50   # 單日尖峰
+    s.iloc[3_210] = s.min() - 50
+    idx = lttb(s.index.asi8, s.to_numpy(), 400)
+    assert len(idx) == 400
+    assert idx[0] == 0 and idx[-1] == len(s) - 1
+    assert (np.diff(idx) > 0).all()
+    assert {1_234, 3_210} <= set(idx)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_limits_points(method):
+    s = _series(3_000, seed=2)
+    out = downsample(s, 600, method)
+    assert len(out) <= 600
+    assert out.index[0] == s.index[0] and out.index[-1] == s.index[-1]
+    assert out.index.is_monotonic_increasing
+    pd.testing.assert_series_equal(out, s.loc[out.index])
+    assert out.max() == s.max() and out.min() == s.min()
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_small_series_pass_through(method):
+    s = _series(600, seed=3)
+    s.iloc[[5, 40]] = np.nan
+    out = downsample(s, 600, method)
+    pd.testing.assert_series_equal(out, s.dropna())
+    np.testing.assert_array_equal(lttb(np.arange(10), np.arange(10.0), 20), np.arange(10))
+    np.testing.assert_array_equal(minmax_downsample(np.arange(10.0), 5), np.arange(10))
+
+
+def test_status_bands_are_contiguous_and_spec_is_bounded():
+    close = _series(1_500, seed=4).abs() + 10
+    rng = np.random.default_rng(4)
+    df = calc_indicators(pd.DataFrame({"Close": close, "Volume": rng.uniform(1e6, 2e6, len(close))}))
+    bands, slope_z = status_bands(df)
+    assert len(slope_z) == len(df)
+    assert (bands["start"] <= bands["end"]).all()
+    assert (bands["start"].iloc[1:].to_numpy() == bands["end"].iloc[:-1].to_numpy()).all()
+    spec = build_chart_spec(df, max_points=200)
+    lines = [d for name, d in spec["datasets"].items() if d and "value" in d[0]]
+    assert len(lines) == 5 and all(len(d) <= 200 for d in lines)
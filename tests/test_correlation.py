@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation
+from correlation import RollingCorrelation, annotate_clusters, blocked_corr, cluster_labels
+
+WINDOW = 20
+
+
+def _returns(n_days=80, n_sym=7, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 0.02, (n_days, n_sym))
+    x[rng.random(x.shape) < 0.1] = np.nan   # 停牌 / 尚未上市
+    x[:30, 5] = np.nan
+    return pd.DataFrame(x, index=pd.bdate_range("2026-01-05", periods=n_days),
+                        columns=[f"S{k}" for k in range(n_sym)])
+
+
+def _groups(n_days=250, sizes=(4, 3, 3), seed=1):
+    """每群共用一個因子，另加一檔獨立標的"""
+    rng = np.random.default_rng(seed)
+    cols, labels = [], []
+    for g, size in enumerate(sizes):
+        factor = rng.normal(0, 0.02, n_days)
+        for _ in range(size):
+            cols.append(factor + rng.normal(0, 0.004, n_days))
+            labels.append(g)
+    cols.append(rng.normal(0, 0.02, n_days))
+    labels.append(len(sizes))
+    names = [f"G{g}_{k}" for k, g in enumerate(labels)]
+    return pd.DataFrame(np.column_stack(cols), columns=names), np.array(labels)
+
+
+def test_push_matches_blocked_corr_with_nans():
+    r = _returns()
+    rc = RollingCorrelation(window=WINDOW, block=3)   # 分塊邊界不整除代號數
+    for t, row in enumerate(r.to_numpy()):
+        rc.push(row)
+        if t >= 5:
+            want = blocked_corr(r.to_numpy()[max(0, t + 1 - WINDOW):t + 1], block=3)
+            np.testing.assert_allclose(rc.corr(), want, atol=1e-5)
+    assert len(rc.rows) == WINDOW
+
+
+def test_push_refits_periodically(monkeypatch):
+    monkeypatch.setattr(correlation, "REFIT_EVERY", 7)
+    r = _returns(seed=2)
+    rc = RollingCorrelation(window=WINDOW).fit(r.to_numpy()[:WINDOW])
+    for row in r.to_numpy()[WINDOW:]:
+        rc.push(row)
+        assert rc.pushes < 7
+    np.testing.assert_allclose(rc.corr(), blocked_corr(r.to_numpy()[-WINDOW:]), atol=1e-5)
+
+
+def test_update_pushes_new_days_and_refits_on_rewrite():
+    r = _returns(seed=3)
+    rc = RollingCorrelation(window=WINDOW).update(r.iloc[:40])
+    rc.update(r.iloc[:55])
+    assert rc.pushes == 15
+    np.testing.assert_allclose(rc.corr(), blocked_corr(r.iloc[35:55].to_numpy()), atol=1e-5)
+
+    # 盤中暫定 K 棒收盤後被改寫：最後一天的報酬不同，整段重算
+    rewritten = r.iloc[:55].copy()
+    rewritten.iloc[-1] = 0.01
+    rc.update(rewritten)
+    assert rc.pushes == 0
+    np.testing.assert_allclose(rc.corr(), blocked_corr(rewritten.iloc[-WINDOW:].to_numpy()), atol=1e-5)
+
+    # 代號改變也整段重算
+    rc.update(r.iloc[:56, :4])
+    assert rc.columns == list(r.columns[:4])
+    np.testing.assert_allclose(rc.corr(), blocked_corr(r.iloc[36:56, :4].to_numpy()), atol=1e-5)
+
+
+def test_cluster_labels_recover_blocks():
+    r, truth = _groups()
+    labels = cluster_labels(blocked_corr(r.to_numpy()))
+    # 分群編號任意，比對分割是否相同
+    assert len(set(labels)) == len(set(truth))
+    for g in set(truth):
+        assert len(set(labels[truth == g])) == 1
+    assert len({labels[truth == g][0] for g in set(truth)}) == len(set(truth))
+    assert list(cluster_labels(np.eye(1))) == [1]
+
+
+def test_annotate_clusters_picks_leader():
+    r, truth = _groups()
+    table = pd.DataFrame({"代號": r.columns, "_rank": np.arange(len(truth))[::-1],
+                          "Score_Z": np.zeros(len(truth))})
+    out = annotate_clusters(table, r).set_index("代號")
+    leaders = out["群組龍頭"].to_dict()
+    # 每群 _rank 最小（排在最後的代號）為龍頭；獨立標的沒有龍頭
+    for g in range(3):
+        members = list(r.columns[truth == g])
+        assert {leaders[m] for m in members} == {members[-1]}
+        assert out.loc[members[0], "群組"].endswith(f"（{len(members)}檔）")
+    assert leaders[r.columns[-1]] == ""
+    # 傳入預先算好的相關矩陣結果相同
+    corr = RollingCorrelation(window=len(r)).fit(r.to_numpy()).corr()
+    pd.testing.assert_frame_equal(annotate_clusters(table, r, corr=corr).set_index("代號"), out)
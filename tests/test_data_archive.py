@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest_5d
+import trading_calendar
+from data_archive import (ALL_FIELDS, INDICATOR_FIELDS, Archive, ArchiveWriter, build_archive,
+                          last_z, rolling_z)
+from indicator_graph import calc_indicators
+from trading_calendar import TWSE
+
+
+def _bars(idx, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(idx))))
+    return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                         "Volume": rng.uniform(1e6, 2e6, len(idx))}, index=pd.DatetimeIndex(idx))
+
+
+def _dropna_z(row, window=60):
+    # 逐檔 dropna 後的 rolling，同 get_four_dimension_advice 的視窗定義
+    s = pd.Series(row).dropna()
+    r = s.rolling(window + 1, min_periods=1)
+    out = np.full(len(row), np.nan)
+    out[s.index] = ((s - r.mean()) / (r.std() + 1e-6)).to_numpy()
+    return out
+
+
+@pytest.fixture
+def makeup_saturday(monkeypatch):
+    # 模擬證交所公告一個週六補行交易日
+    monkeypatch.setitem(trading_calendar.TWSE_EXTRA_SESSIONS, 2026, ["2026-02-07"])
+    trading_calendar.twse_extra_sessions.cache_clear()
+    yield pd.Timestamp("2026-02-07")
+    trading_calendar.twse_extra_sessions.cache_clear()
+
+
+def test_mmap_round_trip_drops_empty_dates(tmp_path):
+    dates = pd.bdate_range("2026-03-02", periods=30)
+    a = _bars(dates.delete(10), seed=1)            # 第 10 天停牌
+    a.loc[a.index[3], "Volume"] = np.nan
+    b = _bars(dates, seed=2).drop(dates[20])       # 第 20 天全體無 K 棒（假日）
+    a = a.drop(dates[20])
+    w = ArchiveWriter(str(tmp_path), ["AAA", "BBB", "AAA"], dates, fields=["Open", "High", "Low", "Close", "Volume"])
+    assert w.symbols == ["AAA", "BBB"]
+    assert w.write_symbol("AAA", a) and w.write_symbol("BBB", b)
+    assert not w.write_symbol("AAA", None)
+    w.close()
+
+    arc = Archive(str(tmp_path))
+    assert list(arc.dates) == list(dates.delete(20))
+    assert isinstance(arc.field("Close"), np.memmap)
+    view = arc.panel("Close", dates[5], dates[15])
+    assert np.shares_memory(view, arc.field("Close")) and view.shape == (2, 11)
+    for sym, df in [("AAA", a), ("BBB", b)]:
+        got = arc.frame(sym)
+        assert list(got.index) == list(df.index)
+        np.testing.assert_array_equal(got.to_numpy(), df[arc.fields].to_numpy(dtype=np.float32))
+    # 停牌日在面板上是 NaN，frame 會剔除
+    assert np.isnan(arc.series("Close", "AAA")[10])
+    assert np.isnan(arc.frame("AAA").loc[a.index[3], "Volume"])
+
+
+def test_rolling_z_skips_gaps_like_dropna():
+    rng = np.random.default_rng(3)
+    block = rng.normal(0, 1, (4, 200))
+    block[0, 50:80] = np.nan      # 長停牌
+    block[1, ::7] = np.nan        # 零星缺值
+    block[2, :120] = np.nan       # 新上市
+    z = rolling_z(block)
+    for i, row in enumerate(block):
+        np.testing.assert_allclose(z[i], _dropna_z(row), rtol=1e-9, atol=1e-9, equal_nan=True)
+    assert np.isnan(z[np.isnan(block)]).all()
+
+
+def test_last_z_reads_back_enough_valid_bars():
+    rng = np.random.default_rng(4)
+    block = rng.normal(0, 1, (3, 300))
+    block[0, 200:290] = np.nan    # 停牌 90 天：只看最後 61 個位置會不足
+    block[1, -1] = np.nan         # 最後一天無資料
+    z = last_z(block)
+    assert z[0] == pytest.approx(_dropna_z(block[0])[-1])
+    assert np.isnan(z[1])
+    assert z[2] == pytest.approx(_dropna_z(block[2])[-1])
+
+
+def test_build_uses_trading_calendar(tmp_path, makeup_saturday, capsys):
+    start, end = pd.Timestamp("2026-01-05"), pd.Timestamp("2026-03-31")
+    sessions = pd.DatetimeIndex(TWSE.sessions(start, end))
+    assert makeup_saturday in sessions and pd.Timestamp("2026-02-16") not in sessions
+
+    def loader(code, s, e):
+        idx = sessions
+        if code == "2317":
+            idx = idx.append(pd.DatetimeIndex(["2026-02-16"])).sort_values()  # 資料源多出一根休市日 K 棒
+        return _bars(idx, seed=int(code))
+
+    def compute(df):
+        return df.assign(PVO=1.0, VRI=2.0, Slope=df["Close"].pct_change(), Score=3.0).dropna()
+
+    arc = build_archive(str(tmp_path), ["2330", "2317"], start, end, loader=loader, compute=compute)
+    assert list(arc.dates) == list(sessions)
+    assert arc.frame("2330").loc[makeup_saturday, "Close"] == np.float32(loader("2330", start, end).loc[makeup_saturday, "Close"])
+    assert "2317 有 1 根 K 棒不在交易日曆上" in capsys.readouterr().out
+    # 指標為 dropna 後的區段，OHLCV 保留完整歷史
+    first = arc.frame("2330").iloc[0]
+    assert not np.isnan(first["Close"]) and np.isnan(first["Slope"])
+    assert arc.fields == ALL_FIELDS
+
+
+def test_resolve_uses_stored_symbols(tmp_path):
+    w = ArchiveWriter(str(tmp_path), ["2330", "6488.TWO", "AAPL"], pd.bdate_range("2026-03-02", periods=3))
+    w.write_symbol("2330", _bars(w.dates))
+    w.close()
+    arc = Archive(str(tmp_path))
+    assert arc.resolve("2330") == "2330"
+    assert arc.resolve("2330.TW") == "2330"
+    assert arc.resolve("6488") == "6488.TWO"
+    assert arc.resolve("$aapl") == "AAPL"
+    assert arc.resolve("2317") is None
+
+
+def test_backtest_archive_mode_stays_offline(tmp_path, monkeypatch, capsys):
+    idx = pd.DatetimeIndex(TWSE.sessions("2024-06-03", "2026-01-12"))
+    raws = {s: _bars(idx, seed=k) for k, s in enumerate(["0050.TW", "2330"])}
+    w = ArchiveWriter(str(tmp_path), list(raws), idx)
+    for s, raw in raws.items():
+        w.write_symbol(s, raw.join(calc_indicators(raw)[INDICATOR_FIELDS]))
+    w.close()
+
+    def offline(symbol):
+        raise AssertionError(f"archive mode probed {symbol}")
+
+    monkeypatch.setattr(backtest_5d, "get_taiwan_symbol", offline)
+    monkeypatch.setattr(backtest_5d, "download_ohlcv", offline)
+    monkeypatch.setattr(backtest_5d, "ARCHIVE_PATH", str(tmp_path))
+    monkeypatch.setattr(backtest_5d, "WATCH_LIST", ["2330", "9999"])
+    backtest_5d.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert sum(l.startswith("2330") for l in lines) == backtest_5d.SHOW_DAYS
+    assert sum(l.startswith("0050") for l in lines) == backtest_5d.SHOW_DAYS
+    assert not any(l.startswith("9999") for l in lines)
@@ -0,0 +1,137 @@
+import json
+import time
+
+import pytest
+
+import analysis_engine as ae
+import fetch_guard
+from fetch_guard import EMPTY_BURST, NEGATIVE_TTL, NEGATIVE_TTL_MAX, CircuitBreaker, FetchGuard, classify_failure
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1_000_000.0}
+    monkeypatch.setattr(fetch_guard.time, "time", lambda: now["t"])
+    return now
+
+
+def test_save_merges_entries_written_by_other_processes(tmp_path):
+    path = str(tmp_path / "negative.json")
+    a, b = FetchGuard(cache_file=path), FetchGuard(cache_file=path)
+    a.record_failure("AAA", "not_found")
+    b.record_failure("BBB", "timeout")
+    with open(path, "r", encoding="utf-8") as f:
+        assert set(json.load(f)) == {"AAA", "BBB"}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_success_elsewhere_is_not_undone_by_stale_copy(tmp_path):
+    path = str(tmp_path / "negative.json")
+    a = FetchGuard(cache_file=path)
+    a.record_failure("AAA", "not_found")
+    b = FetchGuard(cache_file=path)
+    b.record_success("AAA")
+    # a 記憶體裡的 AAA 已過時，下次寫入不可把它帶回
+    a.record_failure("BBB", "not_found")
+    assert set(FetchGuard(cache_file=path)._load()) == {"BBB"}
+    assert set(a.negative) == {"BBB"}
+    b.clear()
+    assert FetchGuard(cache_file=path)._load() == {}
+
+
+def test_breaker_adopts_later_trip():
+    br = CircuitBreaker()
+    br.adopt(None)
+    assert not br.is_open
+    t = time.time()
+    br.adopt(t)
+    assert br.is_open and br.opened_at == t
+    br.adopt(t - 100)
+    assert br.opened_at == t
+
+
+def test_symbol_map_save_merges_disk_copy(monkeypatch, tmp_path):
+    path = tmp_path / "tw_symbols.json"
+    path.write_text(json.dumps({"2330": "2330.TW"}), encoding="utf-8")
+    monkeypatch.setattr(ae, "SYMBOL_MAP_FILE", str(path))
+    monkeypatch.setattr(ae, "_symbol_map", {"6488": "6488.TWO"})
+    ae._save_symbol_map()
+    assert ae._load_symbol_map() == {"2330": "2330.TW", "6488": "6488.TWO"}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("exc, message, reason", [
+    (Exception("HTTP Error 429: Too Many Requests"), None, "throttled"),
+    (None, "Rate limit exceeded", "throttled"),
+    (TimeoutError("read timed out"), None, "timeout"),
+    (None, "No data found, symbol may be delisted", "not_found"),
+    (Exception("404 Not Found"), None, "not_found"),
+    (ConnectionError("Failed to resolve host"), None, "network"),
+    (ValueError("bad json"), None, "error"),
+    (None, None, "empty"),
+    (None, "", "empty"),
+])
+def test_classify_failure(exc, message, reason):
+    assert classify_failure(exc=exc, message=message) == reason
+
+
+def test_breaker_trips_half_opens_and_recloses(clock):
+    br = CircuitBreaker(window=10, min_calls=4, threshold=0.5, cooldown=60)
+    for ok in [True, False, True]:
+        br.record(ok)
+    assert br.allow()  # 未達最少次數不判斷
+    br.record(False)
+    assert br.is_open and not br.allow()
+    clock["t"] += 59
+    assert not br.allow()
+    clock["t"] += 1
+    assert br.allow() and br.half_open  # 冷卻結束放行一筆試探
+    br.record(False)
+    assert br.is_open  # 試探失敗立刻再開
+    clock["t"] += 60
+    assert br.allow()
+    br.record(True)
+    assert not br.half_open and br.allow()
+
+
+def test_negative_entry_expires(tmp_path, clock):
+    g = FetchGuard(cache_file=str(tmp_path / "negative.json"))
+    g.record_failure("AAA", "throttled")
+    assert g.check("AAA") == "throttled"
+    clock["t"] += NEGATIVE_TTL["throttled"] - 1
+    assert g.check("AAA") == "throttled"
+    clock["t"] += 1
+    assert g.check("AAA") is None
+    # 重新載入也一樣
+    assert FetchGuard(cache_file=str(tmp_path / "negative.json")).check("AAA") is None
+
+
+def test_empty_ttl_starts_short_and_grows_on_repeats(tmp_path, clock):
+    g = FetchGuard(cache_file=str(tmp_path / "negative.json"))
+    ttls = []
+    for _ in range(10):
+        g.record_failure("AAA", "empty")
+        ttls.append(g.negative["AAA"]["expires"] - clock["t"])
+        clock["t"] = g.negative["AAA"]["expires"]
+        assert g.check("AAA") is None
+    assert ttls[0] == NEGATIVE_TTL["empty"] < 3600
+    assert ttls[1] == 2 * ttls[0] and ttls[2] == 4 * ttls[0]
+    assert ttls[-1] == NEGATIVE_TTL_MAX["empty"]
+    # 抓到資料即歸零
+    g.record_success("AAA")
+    g.record_failure("AAA", "empty")
+    assert g.negative["AAA"]["expires"] - clock["t"] == NEGATIVE_TTL["empty"]
+
+
+def test_consecutive_empty_frames_trip_breaker(tmp_path, clock):
+    g = FetchGuard(cache_file=str(tmp_path / "negative.json"), breaker=CircuitBreaker(min_calls=8))
+    # 零星的空表不影響斷路器
+    for i in range(EMPTY_BURST - 1):
+        g.record_failure(f"S{i}", "empty")
+    g.record_success("OK")
+    assert g.check("NEXT") is None
+    # 限流時整串都是空表
+    for i in range(EMPTY_BURST + 3):
+        g.record_failure(f"T{i}", "empty")
+    assert g.breaker.is_open
+    assert g.check("NEXT") == "circuit_open"
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fetch_plan
+from fetch_plan import (MARGIN_BARS, NEEDS, ema_settle_bars, pipeline_warmup, plan_fetch,
+                        timeframe_start)
+from indicator_graph import Pipeline, calc_indicators, col
+from trading_calendar import NYSE, TWSE
+
+END = datetime(2026, 10, 17)   # 週六；區間終點不含
+
+
+def _history(cal, seed=0):
+    idx = pd.DatetimeIndex(cal.sessions("2025-01-02", END - timedelta(days=1)))
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(idx))))
+    return pd.DataFrame({"Close": close, "Volume": rng.uniform(1e6, 5e6, len(idx))}, index=idx)
+
+
+def test_standard_pipeline_warmup():
+    # NaN：Close.diff 1 根 + VRI 的 14 日均量 13 根；收斂：EMA26 初始值權重降到 1%
+    assert pipeline_warmup() == (14, ema_settle_bars(26))
+    assert (1 - 2 / 27) ** ema_settle_bars(26) <= fetch_plan.EMA_SETTLE_TOL < (1 - 2 / 27) ** (ema_settle_bars(26) - 1)
+
+
+def test_custom_pipeline_warmup():
+    p = Pipeline()
+    p.define("A", col("Close").sma(30).diff(2))
+    p.define("B", col("Volume").ema(12).slope(5))
+    nan, settle = pipeline_warmup(p)
+    assert nan == 31
+    assert settle == ema_settle_bars(12) + 4
+    plan = plan_fetch("zscore", END, "AAPL", pipeline=p)
+    assert plan.bars == settle + NEEDS["zscore"][0] + MARGIN_BARS
+
+
+@pytest.mark.parametrize("use", list(NEEDS))
+@pytest.mark.parametrize("symbol, cal", [("2330", TWSE), ("AAPL", NYSE)])
+def test_plan_bars_and_start_follow_warmup(use, symbol, cal):
+    full, minimum = NEEDS[use]
+    _, settle = pipeline_warmup()
+    plan = plan_fetch(use, END, symbol, extra_bars=2)
+    assert plan.bars == settle + full + 2 + MARGIN_BARS
+    assert plan.min_bars == minimum + 2 and plan.warmup == settle
+    # start 往回數足 bars 個交易日（不含終點當天）
+    assert len(cal.sessions(plan.start, END - timedelta(days=1))) == plan.bars
+    assert cal.is_session(plan.start)
+
+
+@pytest.mark.parametrize("use", list(NEEDS))
+def test_planned_window_reproduces_full_history(use):
+    df = _history(TWSE)
+    full, _ = NEEDS[use]
+    plan = plan_fetch(use, END, "2330")
+    want = calc_indicators(df)
+    got = calc_indicators(df[df.index >= plan.start])
+    assert len(got) >= full + MARGIN_BARS
+    tail = got.index[-full:]
+    # 有限視窗的指標完全一致，EMA 類指標在 EMA_SETTLE_TOL 內收斂
+    for name in ["VRI", "Slope"]:
+        np.testing.assert_allclose(got.loc[tail, name], want.loc[tail, name], atol=1e-9)
+    assert (got.loc[tail, "PVO"] - want.loc[tail, "PVO"]).abs().max() < 1.0
+
+
+def test_modes_are_ordered():
+    bars = {use: plan_fetch(use, END, "2330").bars for use in NEEDS}
+    assert bars["indicators"] < bars["zscore"] < bars["stability"] < bars["last5"] < bars["advice"]
+
+
+def test_timeframes_extend_start():
+    base = plan_fetch("zscore", END, "2330")
+    plan = plan_fetch("zscore", END, "2330", timeframes=("週", "月"))
+    assert plan.start == min(base.start, timeframe_start("月", END, "2330")) < base.start
+    assert plan.bars == base.bars
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_guard import classify_failure
+from fixture_server import FixtureServer, synthetic_bars
+from http_client import HTTPError, SyncChartClient, parse_chart
+
+START, END = datetime(2026, 1, 1), datetime(2026, 7, 1)
+
+
+class NoBulkServer(FixtureServer):
+    """沒有批次端點的資料源（例如真正的 Yahoo）"""
+
+    def _route(self, target):
+        if "/bulk" in target:
+            return 404, "Not Found", {"error": "unknown endpoint"}
+        return super()._route(target)
+
+
+def _serve(server):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    return loop
+
+
+@pytest.fixture
+def server():
+    srv = FixtureServer()
+    loop = _serve(srv)
+    yield srv
+    asyncio.run_coroutine_threadsafe(srv.stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def test_download_matches_source(server):
+    client = SyncChartClient(server.url)
+    try:
+        df = client.download("AAPL", START, END)
+        ref = synthetic_bars("AAPL", START, END)
+        assert list(df.columns) == ["Open", "High", "Low", "Close", "Volume"]
+        assert df.index.equals(pd.DatetimeIndex(ref.index, name="Date"))
+        np.testing.assert_allclose(df["Close"], ref["Close"])
+    finally:
+        client.close()
+
+
+def test_missing_symbol_is_not_found(server):
+    client = SyncChartClient(server.url)
+    try:
+        with pytest.raises(HTTPError) as info:
+            client.download("XXDEAD", START, END)
+        assert info.value.status == 404
+        assert classify_failure(exc=info.value) == "not_found"
+    finally:
+        client.close()
+
+
+def test_keep_alive_reuses_connections(server):
+    client = SyncChartClient(server.url, pool_size=2)
+    try:
+        for s in ["A", "B", "C", "D", "E", "F"]:
+            client.download(s, START, END)
+        assert client.stats()["requests"] == 6
+        assert client.stats()["connects"] == 1
+        assert server.stats["connections"] == 1
+    finally:
+        client.close()
+
+
+def test_download_many_uses_bulk(server):
+    client = SyncChartClient(server.url)
+    try:
+        symbols = [f"S{i}" for i in range(30)] + ["XXDEAD"]
+        out = client.download_many(symbols, START, END)
+        assert server.stats["bulk_requests"] == 1
+        assert all(isinstance(out[s], pd.DataFrame) for s in symbols[:-1])
+        assert isinstance(out["XXDEAD"], HTTPError)
+    finally:
+        client.close()
+
+
+def test_bulk_falls_back_to_pipelined_singles():
+    srv = NoBulkServer()
+    loop = _serve(srv)
+    client = SyncChartClient(srv.url)
+    try:
+        symbols = [f"S{i}" for i in range(12)]
+        out = client.download_many(symbols, START, END)
+        assert all(isinstance(out[s], pd.DataFrame) for s in symbols)
+        assert srv.stats["requests"] == 1 + len(symbols)
+        assert client.client.bulk is False
+    finally:
+        client.close()
+        asyncio.run_coroutine_threadsafe(srv.stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def test_parse_chart_applies_adjclose():
+    result = {
+        "meta": {"gmtoffset": 0},
+        "timestamp": [1767225600, 1767312000],
+        "indicators": {
+            "quote": [{"open": [10, 20], "high": [11, 21], "low": [9, 19],
+                       "close": [10, 20], "volume": [100, 200]}],
+            "adjclose": [{"adjclose": [5, 20]}],
+        },
+    }
+    df = parse_chart(result)
+    assert df["Close"].tolist() == [5.0, 20.0]
+    assert df["Open"].tolist() == [5.0, 20.0]
+    assert df["Volume"].tolist() == [100.0, 200.0]
+    assert parse_chart({"timestamp": []}) is None
@@ -0,0 +1,109 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicator_graph
+from indicator_graph import (CLOSE, EMA12_VOL, PVO, SCORE, STANDARD, calc_indicators, calc_panel, col,
+                             score_expr)
+
+
+def _ohlcv(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                         "Volume": rng.uniform(1e6, 5e6, n)}, index=pd.bdate_range("2025-01-02", periods=n))
+
+
+def _get_slope_poly(series, window=5):
+    # 改寫前 analysis_engine 的版本
+    y = series.values[-window:]
+    slope, _ = np.polyfit(np.arange(window), y, 1)
+    base = y[0] if y[0] != 0 else 1
+    return (slope / base) * 100
+
+
+def _reference(df):
+    # 改寫前 analysis_engine.calc_indicators
+    df = df.copy()
+    ema12_vol = df["Volume"].ewm(span=12, adjust=False).mean()
+    ema26_vol = df["Volume"].ewm(span=26, adjust=False).mean()
+    df["PVO"] = ((ema12_vol - ema26_vol) / (ema26_vol + 1e-6)) * 100
+    vol_up = df["Volume"].where(df["Close"].diff() > 0, 0)
+    df["VRI"] = (vol_up.rolling(14).mean() / (df["Volume"].rolling(14).mean() + 1e-6)) * 100
+    df["Slope"] = df["Close"].rolling(5).apply(lambda x: _get_slope_poly(x, 5), raw=False)
+    df["Score"] = df["Slope"] * 0.6 + df["PVO"] * 0.2 + df["VRI"] * 0.2
+    return df.dropna()
+
+
+@pytest.fixture
+def op_calls(monkeypatch):
+    calls = Counter()
+    for name, fn in list(indicator_graph.OPS.items()):
+        def counted(*args, _name=name, _fn=fn):
+            calls[_name] += 1
+            return _fn(*args)
+        monkeypatch.setitem(indicator_graph.OPS, name, counted)
+    return calls
+
+
+@pytest.mark.parametrize("n", [5, 10])
+def test_slope_matches_polyfit(n):
+    close = _ohlcv(80)["Close"]
+    close.iloc[30] = 0.0  # 視窗第一點為 0 時以 1 為基數
+    got = indicator_graph.OPS["slope"](close, n)
+    want = close.rolling(n).apply(lambda x: _get_slope_poly(x, n), raw=False)
+    np.testing.assert_allclose(got.to_numpy(), want.to_numpy(), rtol=1e-10, atol=1e-10, equal_nan=True)
+    assert got.iloc[:n - 1].isna().all()
+
+
+def test_calc_indicators_matches_previous_engine():
+    df = _ohlcv()
+    got = calc_indicators(df)
+    want = _reference(df)
+    assert list(got.index) == list(want.index)
+    pd.testing.assert_frame_equal(got, want, rtol=1e-10)
+
+
+def test_equal_expressions_share_a_node():
+    assert col("Volume").ema(12).key == EMA12_VOL.key
+    assert (CLOSE.slope(5) * 0.6).key != (CLOSE.slope(10) * 0.6).key
+    plan = STANDARD.compile()
+    assert len({e.key for e in plan.steps}) == len(plan)
+    # Score 用到的 PVO 子樹不會在計畫中出現第二次
+    assert sum(e.key == PVO.key for e in plan.steps) == 1
+
+
+def test_shared_nodes_run_once_per_frame(op_calls):
+    calc_indicators(_ohlcv())
+    # EMA12/EMA26、兩個 14 日均量、Close.diff、Slope 各只算一次，Score 不重算子樹
+    assert op_calls["ema"] == 2
+    assert op_calls["sma"] == 2
+    assert op_calls["diff"] == 1
+    assert op_calls["slope"] == 1
+    assert op_calls["where"] == 1
+    calc_indicators(_ohlcv(seed=1))
+    assert op_calls["ema"] == 4 and op_calls["slope"] == 2
+
+
+def test_score_variants_reuse_memo(op_calls):
+    ev = STANDARD.bind(_ohlcv())
+    base = ev.get()
+    before = Counter(op_calls)
+    out = ev.expr(Score_v2=score_expr(0.5, 0.3, 0.2), Score=SCORE)
+    added = op_calls - before
+    # 只多出新權重的乘法與加法；VRI * 0.2 與原 Score 相同，沿用 memo
+    assert added == Counter({"mul": 2, "add": 2})
+    pd.testing.assert_series_equal(out["Score"], base["Score"])
+
+
+def test_panel_matches_single_frame():
+    frames = {s: _ohlcv(seed=k) for k, s in enumerate(["AAA", "BBB"])}
+    close = pd.DataFrame({s: df["Close"] for s, df in frames.items()})
+    volume = pd.DataFrame({s: df["Volume"] for s, df in frames.items()})
+    panel = calc_panel(close, volume)
+    for s, df in frames.items():
+        one = calc_indicators(df)
+        for name in ["PVO", "VRI", "Slope", "Score"]:
+            np.testing.assert_allclose(panel[name][s].loc[one.index].to_numpy(), one[name].to_numpy(), rtol=1e-10)
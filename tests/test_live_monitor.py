@@ -0,0 +1,113 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import live_monitor
+from live_monitor import LiveMonitor, LocalQuoteFeed, YFinanceQuoteFeed
+from trading_calendar import NYSE, TradingCalendar
+
+NY = "America/New_York"
+
+
+def _minutes(start, closes, volumes):
+    idx = pd.date_range(pd.Timestamp(start, tz=NY), periods=len(closes), freq="1min").tz_convert("UTC")
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({"Open": closes, "High": closes + 1, "Low": closes - 1, "Close": closes,
+                         "Volume": np.asarray(volumes, dtype=float)}, index=idx)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": pd.Timestamp("2026-10-16 11:00", tz=NY)}
+    monkeypatch.setattr(TradingCalendar, "now", lambda self: now["t"].tz_convert(self.tz))
+    return now
+
+
+@pytest.fixture
+def download(monkeypatch):
+    calls = []
+    frames = []
+
+    def fake(symbols, **kwargs):
+        calls.append(kwargs)
+        return frames.pop(0)
+
+    monkeypatch.setattr(live_monitor.yf, "download", fake)
+    return calls, frames
+
+
+def test_first_poll_starts_at_session_open(clock, download):
+    calls, frames = download
+    feed = YFinanceQuoteFeed()
+    frames.append(_minutes("2026-10-16 09:30", [10, 12, 11], [100, 200, 50]))
+    out, _ = feed.changes(["AAPL"])
+    # 開盤時間以 epoch 秒傳入，不受 yfinance 的時區假設影響
+    assert calls[0]["start"] == int(NYSE.session_open("2026-10-16").timestamp())
+    bar = dict(out)["AAPL"]
+    assert bar["Date"] == pd.Timestamp("2026-10-16")
+    assert (bar["Open"], bar["High"], bar["Low"], bar["Close"], bar["Volume"]) == (10, 13, 9, 11, 350)
+
+
+def test_refetched_last_minute_replaces_its_volume(clock, download):
+    calls, frames = download
+    feed = YFinanceQuoteFeed()
+    frames.append(_minutes("2026-10-16 09:30", [10, 12, 11], [100, 200, 50]))
+    feed.changes(["AAPL"])
+    # 09:32 那一分鐘上輪只成交 50，這輪重抓為 80，另有新的一分鐘
+    frames.append(_minutes("2026-10-16 09:32", [11.5, 14], [80, 30]))
+    out, _ = feed.changes(["AAPL"])
+    assert calls[1]["start"] == int(pd.Timestamp("2026-10-16 09:32", tz=NY).timestamp())
+    bar = dict(out)["AAPL"]
+    assert bar["Volume"] == 100 + 200 + 80 + 30
+    assert (bar["Open"], bar["High"], bar["Close"]) == (10, 15, 14)
+
+
+def test_unchanged_poll_reports_nothing(clock, download):
+    _, frames = download
+    feed = YFinanceQuoteFeed()
+    frames.append(_minutes("2026-10-16 09:30", [10, 11], [100, 50]))
+    feed.changes(["AAPL"])
+    frames.append(_minutes("2026-10-16 09:31", [11], [50]))
+    assert feed.changes(["AAPL"])[0] == []
+
+
+def test_closed_market_makes_no_request(clock, download):
+    calls, _ = download
+    clock["t"] = pd.Timestamp("2026-10-17 11:00", tz=NY)  # 週六
+    assert YFinanceQuoteFeed().changes(["AAPL"]) == ([], None)
+    assert calls == []
+
+
+def test_local_feed_returns_latest_quote_after_cursor():
+    feed = LocalQuoteFeed(base_date="2026-10-16")
+    feed.push("AAA", 10.0, 100)
+    feed.push("BBB", 20.0, 100)
+    feed.push("AAA", 11.0, 50)
+    out, cursor = feed.changes(["AAA"])
+    assert cursor == 3
+    assert out == [("AAA", feed.latest["AAA"])]
+    assert feed.latest["AAA"]["Volume"] == 150 and feed.latest["AAA"]["High"] == 11.0
+    assert feed.changes(["AAA", "BBB"], cursor) == ([], 3)
+
+
+def test_step_recomputes_only_changed_symbols():
+    feed = LocalQuoteFeed(seed=1, base_date="2026-10-16")
+    mon = LiveMonitor(["AAA", "BBB", "CCC"], feed=feed, target_date=date(2026, 10, 15))
+    assert len(mon.table()) == 3 and sum(mon.status_count.values()) == 3
+    assert mon.step()["changed"] == []
+
+    before = dict(mon.rows)
+    feed.push("BBB", feed.bars["BBB"]["Close"] * 1.2, 5e6)
+    diff = mon.step()
+    assert [r["代號"] for r in diff["changed"]] == ["BBB"]
+    assert mon.rows["AAA"] is before["AAA"] and mon.rows["CCC"] is before["CCC"]
+    assert mon.raw["BBB"].index[-1] == pd.Timestamp("2026-10-16")
+    assert sum(diff["counts"].values()) == 3
+    old = before["BBB"]["狀態"]
+    assert diff["transitions"] == ([] if old == mon.rows["BBB"]["狀態"] else [("BBB", old, mon.rows["BBB"]["狀態"])])
+
+    table = mon.diff_table(diff)
+    assert list(table["代號"]) == ["BBB"] and "_rank" not in table
+    assert mon.diff_table({"changed": []}).empty
@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import analysis_engine
+import fetch_guard
+from fetch_guard import CircuitBreaker, guard
+from fixture_server import FixtureServer
+from market_scan import run_scan
+from scan_history import ScanHistory
+
+END = datetime(2026, 10, 17)
+CODES = ["AAPL", "MSFT", "NVDA", "TSLA", "XXGONE"]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    srv = FixtureServer()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(srv.start(), loop).result(5)
+    # 本程序與 spawn 出來的子程序都改用 fixture server
+    monkeypatch.setattr(analysis_engine, "HTTP_BACKEND", srv.url)
+    monkeypatch.setenv("SJ_HTTP_BACKEND", srv.url)
+    guard.clear()
+    guard.reset_report()
+    yield srv
+    asyncio.run_coroutine_threadsafe(srv.stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    guard.clear()
+
+
+def test_multi_worker_scan_matches_in_process_scan(server):
+    serial = run_scan(CODES, END)
+    assert "XXGONE" in guard.report
+    guard.clear()
+    guard.reset_report()
+    parallel = run_scan(CODES, END, workers=2)
+    assert parallel.rows.column("代號").to_pylist() == ["AAPL", "MSFT", "NVDA", "TSLA"]
+    assert parallel.rows.to_pylist() == serial.rows.to_pylist()
+    for c in ["AAPL", "NVDA"]:
+        assert parallel.frame(c).equals(serial.frame(c))
+    # 子程序的失敗紀錄併回主程序
+    assert guard.report["XXGONE"]["reason"] == "not_found"
+
+
+def test_breaker_trip_is_shared_between_processes():
+    shared = multiprocessing.get_context("spawn").Value("d", 0.0)
+    a, b = CircuitBreaker(min_calls=2), CircuitBreaker(min_calls=2)
+    a.share(shared)
+    b.share(shared)
+    assert b.allow()
+    a.record(False)
+    a.record(False)
+    assert a.is_open and shared.value == a.opened_at
+    # b 自己沒有失敗，但下一次 allow() 就看到 a 的跳脫
+    assert not b.allow() and b.opened_at == a.opened_at
+
+
+def test_breaker_half_opens_after_shared_trip(monkeypatch):
+    shared = multiprocessing.get_context("spawn").Value("d", 0.0)
+    clock = {"t": 1000.0}
+    monkeypatch.setattr(fetch_guard.time, "time", lambda: clock["t"])
+    a, b = CircuitBreaker(min_calls=1, cooldown=60), CircuitBreaker(min_calls=1, cooldown=60)
+    a.share(shared)
+    b.share(shared)
+    a.record(False)
+    assert not b.allow()
+    clock["t"] += 61
+    # 冷卻結束後不會因為同一次共用跳脫又被關回去
+    assert b.allow() and b.half_open
+    b.record(True)
+    assert b.allow()
+
+
+def test_previous_status_ignores_intraday_history(server):
+    # 測試快取目錄為暫存目錄（conftest），歷史庫名稱不與其他測試共用即可
+    name = "prev_status"
+    first = run_scan(["AAPL"], END, history_name=name)
+    computed = first.rows.column("_昨日狀態")[0].as_py()
+    prev_day = first.frame("AAPL").index[-2]
+    bogus = "❓ 測試狀態"
+    history = ScanHistory(name)
+    history.append(prev_day, pd.DataFrame({"代號": ["AAPL"], "狀態": [bogus]}), final=False)
+    assert run_scan(["AAPL"], END, history_name=name).rows.column("_昨日狀態")[0].as_py() == computed
+    history.append(prev_day, pd.DataFrame({"代號": ["AAPL"], "狀態": [bogus]}), final=True)
+    assert run_scan(["AAPL"], END, history_name=name).rows.column("_昨日狀態")[0].as_py() == bogus
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio_sim import simulate, summarize
+
+
+def _panels(n_days=500, n_sym=50, seed=1):
+    rng = np.random.default_rng(seed)
+    close = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_days, n_sym)), axis=0)))
+    close.iloc[100:120, 3] = np.nan  # 停牌
+    slope_z = pd.DataFrame(rng.normal(0.8, 1.0, (n_days, n_sym)))
+    score_z = pd.DataFrame(rng.normal(0.0, 1.0, (n_days, n_sym)))
+    return close, slope_z, score_z
+
+
+@pytest.mark.parametrize("weighting", ["equal", "vol"])
+@pytest.mark.parametrize("resize", [False, True])
+def test_cash_never_negative(weighting, resize):
+    close, sz, scz = _panels()
+    res = simulate(close, sz, scz, max_positions=5, weighting=weighting, resize=resize, lot_size=10)
+    assert (res["現金"] >= 0).all()
+    assert res["曝險%"].max() <= 100 + 1e-9
+    assert (res["持股數"] <= 5).all()
+
+
+def test_equity_accounts_for_costs():
+    close, sz, scz = _panels()
+    res = simulate(close, sz, scz, max_positions=5, lot_size=10, fee=0.0, tax=0.0)
+    assert res["成本"].sum() == 0
+    costly = simulate(close, sz, scz, max_positions=5, lot_size=10)
+    assert costly["權益"].iloc[-1] < res["權益"].iloc[-1]
+
+
+def test_no_signal_keeps_capital():
+    close, sz, scz = _panels()
+    res = simulate(close, sz * 0 - 2, scz, capital=1_000_000)
+    assert (res["權益"] == 1_000_000).all()
+    assert summarize(res)["總報酬%"] == 0
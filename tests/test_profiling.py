@@ -0,0 +1,125 @@
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from profiling import ProfileState, profiled, profiler
+
+
+@profiled
+def load(symbol):
+    df = pd.DataFrame({"Close": [1.0, 2.0]})
+    helper(3)
+    return df
+
+
+@profiled
+def helper(n):
+    time.sleep(0.01 * n)
+    return n
+
+
+@profiled
+def compute(df):
+    return helper(1)
+
+
+@profiled
+def resolve(symbol):
+    return symbol + ".TW"
+
+
+@profiled
+def hold(symbol, mb):
+    return bytearray(mb * 1024 * 1024)
+
+
+@profiled
+def churn(symbol, mb):
+    return len(bytearray(mb * 1024 * 1024))
+
+
+@pytest.fixture
+def state():
+    # 每個測試一份獨立統計，不碰程序共用的那份
+    s = profiler.bind(ProfileState())
+    yield s
+    profiler.disable()
+    profiler.bind(None)
+    profiler.aliases.clear()
+
+
+def test_disabled_is_a_no_op(state):
+    df = load("2330")
+    assert state.stats == {} and state.stacks == {}
+    assert "symbol" not in df.attrs
+    assert profiler.report().empty
+    assert not profiler._frames()
+
+
+def test_symbol_from_args_frame_stack_and_attrs(state):
+    profiler.enable()
+    df = load("2330")
+    # 回傳的 DataFrame 帶上代號，之後以 df 為參數的呼叫歸回同一檔
+    assert df.attrs["symbol"] == "2330"
+    compute(df)
+    with profiler.symbol("AAPL"):
+        helper(0)
+    stats = state.stats
+    assert set(stats) == {("2330", "load"), ("2330", "helper"), ("2330", "compute"), ("AAPL", "helper")}
+    assert stats[("2330", "helper")][0] == 2
+    n, cum, self_t, _, _ = stats[("2330", "load")]
+    assert n == 1 and cum >= 0.03 and self_t < cum - 0.025   # helper 的時間不算 load 自身
+    assert stats[("2330", "helper")][2] >= 0.04
+    assert any(line.startswith("2330;load;helper ") for line in profiler.folded())
+
+
+def test_resolved_symbol_is_an_alias(state):
+    profiler.enable()
+    sym = resolve("2330")
+    load(sym)
+    assert {k[0] for k in state.stats} == {"2330"}
+    assert profiler.by_symbol()["代號"].tolist() == ["2330"]
+
+
+def test_net_allocations_are_attributed(state):
+    profiler.enable(track_alloc=True)
+    assert tracemalloc.is_tracing()
+    kept = hold("AAA", 4)
+    churn("BBB", 4)
+    stats = state.stats
+    assert stats[("AAA", "hold")][4] >= 4 * 1024 * 1024
+    assert abs(stats[("BBB", "churn")][4]) < 512 * 1024   # 配置後即釋放，淨值約 0
+    del kept
+    profiler.disable()
+    assert not tracemalloc.is_tracing()
+
+
+def test_sessions_do_not_share_toggle_or_stats(state):
+    profiler.enable()
+    other = ProfileState()
+    seen = {}
+
+    def other_session():
+        profiler.bind(other)
+        load("OTHER")
+        seen["enabled"] = profiler.enabled
+
+    t = threading.Thread(target=other_session)
+    t.start()
+    t.join()
+    assert seen["enabled"] is False and other.stats == {}
+    assert not profiler.shared.enabled and profiler.shared.stats == {}
+    load("MINE")
+    assert {k[0] for k in state.stats} == {"MINE"}
+
+
+def test_merge_adds_worker_snapshot(state):
+    profiler.enable()
+    load("AAA")
+    snap = profiler.snapshot()
+    profiler.merge(snap)
+    assert state.stats[("AAA", "load")][0] == 2
+    assert profiler.report().set_index(["代號", "函式"]).loc[("AAA", "load"), "呼叫次數"] == 2
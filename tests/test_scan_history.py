@@ -0,0 +1,151 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+import scan_history
+from scan_history import ScanHistory
+
+
+def _table(codes, status, slope=0.0):
+    return pd.DataFrame({"代號": codes, "狀態": status, "Slope_Z": slope})
+
+
+def _history(tmp_path):
+    return ScanHistory("t", root=str(tmp_path))
+
+
+def test_same_day_rerun_last_write_wins(tmp_path):
+    h = _history(tmp_path)
+    h.append("2026-10-15", _table(["2330", "2317"], ["✅ 多單續抱", "⚠️ 空手觀望"]))
+    h.append("2026-10-16", _table(["2330", "2317"], ["✅ 多單續抱", "⚠️ 空手觀望"]))
+    # 盤中掃描後收盤重跑同一天：以最後一次為準
+    h.append("2026-10-16", _table(["2330"], ["⭐ 多單進場"], slope=2.0))
+    assert h.meta["overlap"]
+    snap = h.snapshot("2026-10-16").set_index("代號")
+    assert snap.loc["2330", "狀態"] == "⭐ 多單進場"
+    assert snap.loc["2330", "Slope_Z"] == 2.0
+    assert snap.loc["2317", "狀態"] == "⚠️ 空手觀望"
+    assert h.values_on("2026-10-16")["2330"] == "⭐ 多單進場"
+    assert h.matrix().loc["2026-10-16"].map(dict(enumerate(h.meta["strings"]))).to_dict() == \
+        {"2330": "⭐ 多單進場", "2317": "⚠️ 空手觀望"}
+
+
+def test_backfill_earlier_day_overlaps(tmp_path):
+    h = _history(tmp_path)
+    h.append("2026-10-16", _table(["2330"], ["⭐ 多單進場"]))
+    h.append("2026-10-15", _table(["2330"], ["✅ 多單續抱"]))
+    assert list(h.days()) == [pd.Timestamp("2026-10-15"), pd.Timestamp("2026-10-16")]
+    assert h.snapshot().iloc[0]["狀態"] == "⭐ 多單進場"
+    d = h.diff("2026-10-16")
+    assert d.to_dict("records") == [{"代號": "2330", "前值": "✅ 多單續抱", "今值": "⭐ 多單進場"}]
+
+
+def test_reload_from_disk(tmp_path):
+    h = _history(tmp_path)
+    h.append("2026-10-15", _table(["2330", "2317"], ["✅ 多單續抱", "⚠️ 空手觀望"], slope=1.5))
+    h.append("2026-10-15", _table(["2317"], ["⭐ 多單進場"]))
+    again = _history(tmp_path)
+    pd.testing.assert_frame_equal(again.snapshot("2026-10-15"), h.snapshot("2026-10-15"))
+    assert again.snapshot("2026-10-15").set_index("代號").loc["2317", "狀態"] == "⭐ 多單進場"
+    # 重新載入後繼續追加，字典編碼延續
+    again.append("2026-10-16", _table(["2330"], ["⭐ 多單進場"]))
+    assert _history(tmp_path).diff("2026-10-16", "2026-10-15").set_index("代號").loc["2330", "今值"] == "⭐ 多單進場"
+
+
+def test_compaction_keeps_last_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_history, "COMPACT_AT", 3)
+    h = _history(tmp_path)
+    days = pd.bdate_range("2026-10-01", periods=3)
+    for i, d in enumerate(days):
+        h.append(d, _table(["2330"], ["✅ 多單續抱"], slope=float(i)))
+    h.append(days[1], _table(["2330"], ["⭐ 多單進場"], slope=9.0))
+    assert len(h.meta["segments"]) == 1 and not h.meta["overlap"]
+    files = sorted(f for f in os.listdir(h.path) if f.endswith(".npz"))
+    assert files == h.meta["segments"]
+    again = _history(tmp_path)
+    assert len(again) == 3
+    snap = again.snapshot(days[1]).iloc[0]
+    assert snap["狀態"] == "⭐ 多單進場" and snap["Slope_Z"] == 9.0
+    assert list(again.timeline("2330")["狀態"]) == ["✅ 多單續抱", "⭐ 多單進場", "✅ 多單續抱"]
+
+
+def test_compaction_saves_meta_before_deleting_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_history, "COMPACT_AT", 2)
+    h = _history(tmp_path)
+    removed = []
+    real_remove = os.remove
+
+    def checked_remove(path):
+        if not path.endswith(".npz"):
+            return real_remove(path)  # 目錄鎖檔
+        # 刪除任一舊區段時，磁碟上的 meta 必須已經改指新區段
+        with open(h.meta_file, "r", encoding="utf-8") as f:
+            on_disk = json.load(f)
+        assert os.path.basename(path) not in on_disk["segments"]
+        assert all(os.path.exists(os.path.join(h.path, s)) for s in on_disk["segments"])
+        removed.append(path)
+        real_remove(path)
+
+    monkeypatch.setattr(scan_history.os, "remove", checked_remove)
+    for d in pd.bdate_range("2026-10-01", periods=3):
+        h.append(d, _table(["2330"], ["✅ 多單續抱"]))
+    assert len(removed) == 3
+    assert len(_history(tmp_path)) == 3
+    assert not [f for f in os.listdir(h.path) if f.endswith(".tmp")]
+
+
+def test_values_on_final_only_skips_intraday_records(tmp_path):
+    h = _history(tmp_path)
+    h.append("2026-10-15", _table(["2330", "2317"], ["✅ 多單續抱", "⚠️ 空手觀望"]), final=[True, False])
+    assert h.values_on("2026-10-15") == {"2330": "✅ 多單續抱", "2317": "⚠️ 空手觀望"}
+    assert h.values_on("2026-10-15", final_only=True) == {"2330": "✅ 多單續抱"}
+    # 收盤後重跑：最後一次為定案值
+    h.append("2026-10-15", _table(["2317"], ["⭐ 多單進場"]), final=True)
+    assert _history(tmp_path).values_on("2026-10-15", final_only=True) == \
+        {"2330": "✅ 多單續抱", "2317": "⭐ 多單進場"}
+
+
+def test_segments_without_final_column_are_not_final(tmp_path):
+    h = _history(tmp_path)
+    h.append("2026-10-15", _table(["2330"], ["✅ 多單續抱"]))
+    # 模擬加入 final 欄位前寫下的舊區段
+    path = os.path.join(h.path, h.meta["segments"][0])
+    with np.load(path) as f:
+        cols = {k: f[k] for k in f.files if k != scan_history.FINAL}
+    np.savez_compressed(path, **cols)
+    h.append("2026-10-16", _table(["2330"], ["⭐ 多單進場"]), final=True)
+    again = _history(tmp_path)
+    assert again.values_on("2026-10-15", final_only=True) == {}
+    assert again.values_on("2026-10-16", final_only=True) == {"2330": "⭐ 多單進場"}
+    assert len(again.matrix()) == 2
+
+
+def _append_days(root, tag, n):
+    # 子程序入口：每個程序用不同的狀態字串，字典編碼必須互不干擾
+    h = ScanHistory("shared", root=root)
+    for i, d in enumerate(pd.bdate_range("2026-01-05", periods=n)):
+        h.append(d, _table([f"{tag}{k}" for k in range(3)], [f"{tag}-狀態{i % 4}"] * 3, slope=float(i)))
+
+
+def test_two_processes_append_concurrently(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    n = 20  # 兩個程序合計超過 COMPACT_AT，合併會與另一個程序的追加交錯
+    procs = [ctx.Process(target=_append_days, args=(str(tmp_path), tag, n)) for tag in "AB"]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    h = ScanHistory("shared", root=str(tmp_path))
+    assert len(h) == 2 * 3 * n
+    assert len(set(h.meta["segments"])) == len(h.meta["segments"])
+    assert sorted(f for f in os.listdir(h.path) if f.endswith(".npz")) == sorted(h.meta["segments"])
+    for i, d in enumerate(pd.bdate_range("2026-01-05", periods=n)):
+        snap = h.snapshot(d).set_index("代號")
+        for tag in "AB":
+            assert (snap.loc[[f"{tag}{k}" for k in range(3)], "狀態"] == f"{tag}-狀態{i % 4}").all()
+            assert (snap.loc[[f"{tag}{k}" for k in range(3)], "Slope_Z"] == i).all()
+    assert not os.path.exists(os.path.join(h.path, "lock"))
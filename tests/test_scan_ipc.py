@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from scan_ipc import BarBuffer, RowBuffer, ScanTables, read_ipc, write_ipc
+
+SCHEMA = pa.schema([("代號", pa.string()), ("收盤", pa.float64()), ("狀態", pa.string())])
+
+
+def _bars(seed, n):
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2026-06-01", periods=n, tz="Asia/Taipei")
+    return pd.DataFrame({c: rng.normal(100, 1, n) for c in ["Open", "High", "Low", "Close", "Volume", "PVO"]},
+                        index=idx)
+
+
+def test_row_buffer_fills_missing_columns():
+    rows = RowBuffer()
+    rows.add({"代號": "2330", "收盤": 1000.0})
+    rows.add({"代號": "2317", "狀態": "⭐ 多單進場"})
+    batch = rows.batch(SCHEMA)
+    assert batch.schema == SCHEMA
+    assert batch.to_pydict() == {"代號": ["2330", "2317"], "收盤": [1000.0, None], "狀態": [None, "⭐ 多單進場"]}
+
+
+def test_arrow_round_trip_through_mapped_files(tmp_path):
+    frames = {"2330": _bars(0, 30), "2317": _bars(1, 12), "2454": _bars(2, 25)}
+    parts = [["2330", "2317"], ["2454"]]
+    row_tables, bar_tables = [], []
+    for i, codes in enumerate(parts):
+        rows, bars = RowBuffer(), BarBuffer()
+        for c in codes:
+            rows.add({"代號": c, "收盤": float(frames[c]["Close"].iloc[-1]), "狀態": "✅ 多單續抱"})
+            bars.add(c, frames[c])
+        row_tables.append(read_ipc(write_ipc(str(tmp_path / f"rows_{i}.arrow"), [rows.batch(SCHEMA)], SCHEMA)))
+        bar_tables.append(read_ipc(write_ipc(str(tmp_path / f"bars_{i}.arrow"), bars.batches, bars.schema())))
+    assert not list(tmp_path.glob("*.tmp"))
+
+    tables = ScanTables(pa.concat_tables(row_tables), bar_tables)
+    assert tables.rows.column("代號").to_pylist() == ["2330", "2317", "2454"]
+    for c, df in frames.items():
+        out = tables.frame(c)
+        assert list(out.index) == list(df.index.tz_localize(None))
+        np.testing.assert_array_equal(out["Close"].to_numpy(), df["Close"].to_numpy())
+        np.testing.assert_array_equal(out["PVO"].to_numpy(), df["PVO"].to_numpy())
+        assert out["VRI"].isna().all()  # df 沒有的欄位為缺值
+    assert tables.frame("9999") is None
+
+    panel = tables.close_panel(tail=10)
+    assert list(panel.columns) == ["2330", "2317", "2454"]
+    assert panel["2317"].dropna().tolist() == frames["2317"]["Close"].iloc[-10:].tolist()
+    assert len(panel) == len(set().union(*(df.index[-10:] for df in frames.values())))
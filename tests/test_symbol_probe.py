@@ -0,0 +1,45 @@
+import pytest
+
+import analysis_engine as ae
+from fetch_guard import guard
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(ae, "_symbol_map", {})
+    monkeypatch.setattr(ae, "SYMBOL_MAP_FILE", str(tmp_path / "tw_symbols.json"))
+    guard.clear()
+    yield
+    guard.clear()
+
+
+def test_positive_probe_is_saved(monkeypatch):
+    monkeypatch.setattr(ae, "_has_recent_bars", lambda s: s.endswith(".TWO"))
+    assert ae.get_taiwan_symbol("6488") == "6488.TWO"
+    assert ae._load_symbol_map() == {"6488": "6488.TWO"}
+
+
+def test_empty_probes_are_not_saved(monkeypatch):
+    # yfinance 限流時回傳空表：不能把上櫃代號永久記成 .TW
+    monkeypatch.setattr(ae, "_has_recent_bars", lambda s: False)
+    assert ae.get_taiwan_symbol("6488") == "6488.TW"
+    assert ae._load_symbol_map() == {}
+    monkeypatch.setattr(ae, "_has_recent_bars", lambda s: s.endswith(".TWO"))
+    assert ae.get_taiwan_symbol("6488") == "6488.TWO"
+
+
+def test_probe_respects_negative_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ae, "_has_recent_bars", lambda s: calls.append(s) or True)
+    guard.record_failure("6488.TW", "not_found")
+    assert ae.get_taiwan_symbol("6488") == "6488.TWO"
+    assert calls == ["6488.TWO"]
+
+
+def test_probe_errors_are_recorded(monkeypatch):
+    def boom(s):
+        raise TimeoutError("timed out")
+    monkeypatch.setattr(ae, "_has_recent_bars", boom)
+    assert ae.get_taiwan_symbol("6488") == "6488.TW"
+    assert guard.check("6488.TWO") == "timeout"
+    assert ae._load_symbol_map() == {}
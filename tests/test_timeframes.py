@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_plan import TF_MIN_BARS, plan_fetch
+from indicator_graph import calc_indicators
+from timeframes import TIMEFRAMES, clear_cache, get_timeframe_data, resample_ohlcv
+from trading_calendar import TWSE
+
+
+@pytest.fixture(scope="module")
+def twse_daily():
+    days = pd.DatetimeIndex(TWSE.sessions("2023-06-01", "2026-12-31"))
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+    return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                         "Volume": rng.uniform(1e6, 2e6, len(days))}, index=days)
+
+
+@pytest.mark.parametrize("tf", list(TIMEFRAMES))
+def test_planned_window_covers_timeframe_warmup(twse_daily, tf):
+    # 跨農曆年（2026-02-12 ~ 02-20 整週休市）與 10 月連假的每一個交易日
+    for d in TWSE.sessions("2026-01-26", "2026-04-10") + TWSE.sessions("2026-09-21", "2026-10-30"):
+        end = pd.Timestamp(d) + timedelta(days=1)
+        plan = plan_fetch("stability", end, "2330.TW", extra_bars=1, timeframes=(tf,))
+        raw = twse_daily[(twse_daily.index >= plan.start) & (twse_daily.index < end)]
+        bars = calc_indicators(resample_ohlcv(calc_indicators(raw), TIMEFRAMES[tf]))
+        assert len(bars) >= TF_MIN_BARS[tf], (d, tf, plan.start)
+
+
+def test_cache_refreshes_when_provisional_bar_changes(twse_daily):
+    clear_cache()
+    daily = calc_indicators(twse_daily[twse_daily.index < "2026-10-17"])
+    before = get_timeframe_data("2330.TW", daily, "週")
+    assert get_timeframe_data("2330.TW", daily, "週") is before
+    # 盤中重抓：同一天、同根數，只有最後一根收盤變了
+    moved = daily.copy()
+    moved.iloc[-1, moved.columns.get_loc("Close")] *= 1.05
+    after = get_timeframe_data("2330.TW", moved, "週")
+    assert after is not before
+    assert after["Close"].iloc[-1] == pytest.approx(moved["Close"].iloc[-1])
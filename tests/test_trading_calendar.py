@@ -0,0 +1,76 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from fetch_plan import plan_fetch
+from trading_calendar import NYSE, TWSE, calendar_for, nyse_early_closes, nyse_holidays
+
+NY = "America/New_York"
+TPE = "Asia/Taipei"
+
+
+@pytest.mark.parametrize("day", [
+    "2025-01-01", "2025-01-09", "2025-01-20", "2025-02-17", "2025-04-18", "2025-05-26",
+    "2025-06-19", "2025-07-04", "2025-09-01", "2025-11-27", "2025-12-25",
+    "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25", "2026-07-03", "2026-09-07",
+    "2026-11-26", "2027-12-24",
+])
+def test_nyse_holidays(day):
+    assert pd.Timestamp(day).date() in nyse_holidays(pd.Timestamp(day).year)
+    assert not NYSE.is_session(day)
+
+
+@pytest.mark.parametrize("day", ["2026-07-02", "2026-10-19", "2027-12-31", "2026-11-27"])
+def test_nyse_sessions(day):
+    # 2027-12-31：2028 元旦逢週六不補假
+    assert NYSE.is_session(day)
+
+
+def test_nyse_early_close():
+    assert date(2026, 11, 27) in nyse_early_closes(2026)
+    assert date(2026, 12, 24) in nyse_early_closes(2026)
+    assert NYSE.session_close("2026-11-27").hour == 13
+    assert NYSE.session_close("2026-11-25").hour == 16
+
+
+@pytest.mark.parametrize("day", ["2026-01-01", "2026-02-16", "2026-02-20", "2026-10-09", "2025-10-10"])
+def test_twse_holidays(day):
+    assert not TWSE.is_session(day)
+
+
+def test_twse_sessions_and_neighbours():
+    assert TWSE.is_session("2026-10-19")
+    assert not TWSE.is_session("2026-10-18")  # 週日
+    assert TWSE.prev_session("2026-02-23") == date(2026, 2, 11)  # 跨過農曆年連假
+    assert TWSE.next_session("2026-10-08") == date(2026, 10, 12)
+
+
+def test_finality_and_pending_sessions():
+    assert TWSE.is_provisional("2026-10-16", pd.Timestamp("2026-10-16 13:45", tz=TPE))
+    assert TWSE.is_final("2026-10-16", pd.Timestamp("2026-10-16 14:05", tz=TPE))
+    sat = pd.Timestamp("2026-10-17 10:00", tz=TPE)
+    assert not TWSE.new_bar_possible("2026-10-16", now=sat)
+    mon = pd.Timestamp("2026-10-19 09:30", tz=TPE)
+    assert TWSE.pending_sessions("2026-10-16", now=mon) == [date(2026, 10, 19)]
+    assert NYSE.last_final_session(pd.Timestamp("2026-10-19 12:00", tz=NY)) == date(2026, 10, 16)
+
+
+def test_is_open_grace():
+    assert not TWSE.is_open(pd.Timestamp("2026-10-19 08:59", tz=TPE))
+    assert TWSE.is_open(pd.Timestamp("2026-10-19 13:45", tz=TPE), grace=pd.Timedelta(minutes=30))
+    assert not TWSE.is_open(pd.Timestamp("2026-10-19 13:45", tz=TPE))
+
+
+def test_calendar_for():
+    assert calendar_for("2330") is TWSE and calendar_for("6488.TWO") is TWSE
+    assert calendar_for("AAPL") is NYSE
+
+
+def test_unknown_twse_year_widens_plan():
+    assert TWSE.unknown_years("2026-12-01", "2027-01-10") == [2027]
+    assert NYSE.unknown_years("2026-12-01", "2027-01-10") == []
+    known = plan_fetch("stability", datetime(2026, 10, 20), "2330.TW")
+    unknown = plan_fetch("stability", datetime(2027, 3, 20), "2330.TW")
+    us = plan_fetch("stability", datetime(2027, 3, 20), "AAPL")
+    assert unknown.bars > known.bars == us.bars
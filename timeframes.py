@@ -0,0 +1,73 @@
+# =====================================================
+# SJ 多週期訊號 - 由已抓取的日 K 合成週 / 月 K
+# =====================================================
+# 不另外下載：直接把手上的日線 OHLCV 重新取樣，
+# 套用同一套 PVO / VRI / Slope / Score / Z 分數流程。
+# 結果以 (代號, 週期, 最後日期, 日 K 數, 最後一根收盤 / 量) 為鍵快取，日線未更新就不重算；
+# 盤中重抓當日暫定 K 棒時日期與根數不變，但收盤 / 量會變，週 / 月線跟著重算。
+
+# --------------------
+# 套件導入
+# --------------------
+from analysis_engine import calc_indicators
+from backtest_5d import get_four_dimension_advice
+from signal_status import map_status
+from fetch_plan import TF_MIN_BARS as MIN_BARS, TF_RULE
+
+# --------------------
+# 核心參數
+# --------------------
+TIMEFRAMES = TF_RULE  # 週 -> W-FRI、月 -> M（與 fetch_plan 的區間規劃共用）
+OHLC_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+_cache = {}
+
+
+# --------------------
+# 重新取樣
+# --------------------
+def resample_ohlcv(df, rule):
+    """日 K -> 週 / 月 K；最後一根可能是尚未收完的週期"""
+    cols = {k: v for k, v in OHLC_AGG.items() if k in df.columns}
+    out = df[list(cols)].resample(rule).agg(cols)
+    return out.dropna(subset=["Close"])
+
+
+def _entry(symbol, daily_df, tf):
+    cols = [c for c in ("Close", "Volume") if c in daily_df.columns]
+    tail = daily_df[cols].iloc[-1].to_numpy(dtype=float).tobytes()  # bytes：NaN 也能比對相等
+    key = (symbol, tf, daily_df.index[-1], len(daily_df), tail)
+    if key not in _cache:
+        # 同代號同週期的舊結果直接淘汰，快取大小與清單大小同階
+        for k in [k for k in _cache if k[0] == symbol and k[1] == tf]:
+            del _cache[k]
+        df = calc_indicators(resample_ohlcv(daily_df, TIMEFRAMES[tf]))
+        _cache[key] = {"df": df if len(df) >= MIN_BARS[tf] else None}
+    return _cache[key]
+
+
+def get_timeframe_data(symbol, daily_df, tf):
+    """回傳週 / 月線指標 DataFrame，資料不足時回傳 None"""
+    if daily_df is None or daily_df.empty:
+        return None
+    return _entry(symbol, daily_df, tf)["df"]
+
+
+def get_timeframe_status(symbol, daily_df, tf):
+    """回傳 (狀態, Slope_Z, Score_Z)；資料不足時回傳 ("資料不足", None, None)"""
+    if daily_df is None or daily_df.empty:
+        return "資料不足", None, None
+    entry = _entry(symbol, daily_df, tf)
+    if "status" not in entry:
+        df = entry["df"]
+        if df is None:
+            entry["status"] = ("資料不足", None, None)
+        else:
+            op, last, sz, scz = get_four_dimension_advice(df, len(df) - 1)
+            status, _ = map_status(op, sz)
+            entry["status"] = (status, round(float(sz), 2), round(float(scz), 2))
+    return entry["status"]
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,272 @@
+# =====================================================
+# SJ 交易日曆 - TWSE / NYSE 離線交易時段與休市日
+# =====================================================
+# 用來判斷「上次抓取之後是否可能出現新 K 棒」：
+# 週末、休市日、或盤中尚未收盤（K 棒仍是暫定值）都不需要、也不應該重抓。
+# NYSE 休市日依規則推算；TWSE 休市日（農曆節日與補假）每年由證交所公告，
+# 內建表格之外的年份可用 .sj_cache/holidays_TWSE.json 補充（{"2027": ["2027-01-01", ...]}），
+# 週六補行交易日放在 "sessions" 鍵下（{"sessions": {"2027": ["2027-02-20"]}}）。
+# 兩者都沒有的年份會印出一次警告，休市日當成交易日；fetch_plan 對這些年份多留 UNKNOWN_YEAR_MARGIN 根。
+
+# --------------------
+# 套件導入
+# --------------------
+import os
+import json
+from datetime import date, time, timedelta
+from functools import lru_cache
+
+import pandas as pd
+
+from fetch_guard import CACHE_DIR
+
+# --------------------
+# 核心參數
+# --------------------
+SETTLE_DELAY = timedelta(minutes=30)  # 收盤後多久資料源才會給出定案的日 K
+
+# 證交所公告之休市日（含「市場無交易，僅辦理結算交割」日）
+TWSE_HOLIDAYS = {
+    2025: [
+        "2025-01-01", "2025-01-23", "2025-01-24", "2025-01-27", "2025-01-28",
+        "2025-01-29", "2025-01-30", "2025-01-31", "2025-02-28", "2025-04-03",
+        "2025-04-04", "2025-05-01", "2025-05-30", "2025-09-29", "2025-10-06",
+        "2025-10-10", "2025-10-24", "2025-12-25",
+    ],
+    2026: [
+        "2026-01-01", "2026-02-12", "2026-02-13", "2026-02-16", "2026-02-17",
+        "2026-02-18", "2026-02-19", "2026-02-20", "2026-02-27", "2026-04-03",
+        "2026-04-06", "2026-05-01", "2026-06-19", "2026-09-25", "2026-09-28",
+        "2026-10-09", "2026-10-26", "2026-12-25",
+    ],
+}
+
+# 證交所公告之週六補行交易日（已知年份皆無）
+TWSE_EXTRA_SESSIONS = {}
+
+# 沒有休市日表的年份，每年最多可能少算的交易日數（取已知年份平日休市日數的最大值）
+UNKNOWN_YEAR_MARGIN = max(sum(pd.Timestamp(d).weekday() < 5 for d in v) for v in TWSE_HOLIDAYS.values())
+
+# NYSE 規則以外的臨時休市（國殤日等）
+NYSE_SPECIAL_CLOSURES = ["2025-01-09"]
+
+
+# --------------------
+# 休市日規則
+# --------------------
+def _nth_weekday(year, month, weekday, n):
+    d = date(year, month, 1)
+    d += timedelta(days=(weekday - d.weekday()) % 7)
+    return d + timedelta(weeks=n - 1)
+
+
+def _last_weekday(year, month, weekday):
+    d = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return d - timedelta(days=(d.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def _observed(d):
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    days = {
+        _nth_weekday(year, 1, 0, 3),                 # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),                 # Washington's Birthday
+        _easter(year) - timedelta(days=2),           # Good Friday
+        _last_weekday(year, 5, 0),                   # Memorial Day
+        _observed(date(year, 7, 4)),                 # Independence Day
+        _nth_weekday(year, 9, 0, 1),                 # Labor Day
+        _nth_weekday(year, 11, 3, 4),                # Thanksgiving
+        _observed(date(year, 12, 25)),               # Christmas
+    }
+    ny = date(year, 1, 1)
+    if ny.weekday() != 5:                            # 元旦逢週六不補假
+        days.add(_observed(ny))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))       # Juneteenth
+    days |= {pd.Timestamp(d).date() for d in NYSE_SPECIAL_CLOSURES if d.startswith(str(year))}
+    return frozenset(days)
+
+
+@lru_cache(maxsize=None)
+def nyse_early_closes(year):
+    """13:00 提前收盤：獨立紀念日前一天、感恩節隔天、聖誕夜"""
+    days = set()
+    jul3 = date(year, 7, 3)
+    if jul3.weekday() < 5 and date(year, 7, 4).weekday() < 5:
+        days.add(jul3)
+    days.add(_nth_weekday(year, 11, 3, 4) + timedelta(days=1))
+    xmas_eve = date(year, 12, 24)
+    if xmas_eve.weekday() < 5:
+        days.add(xmas_eve)
+    return frozenset(days - nyse_holidays(year))
+
+
+def _twse_file():
+    path = os.path.join(CACHE_DIR, "holidays_TWSE.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _twse_extra(year):
+    return _twse_file().get(str(year))
+
+
+@lru_cache(maxsize=None)
+def twse_known_year(year):
+    return year in TWSE_HOLIDAYS or _twse_extra(year) is not None
+
+
+@lru_cache(maxsize=None)
+def twse_holidays(year):
+    days = set(TWSE_HOLIDAYS.get(year, [])) | set(_twse_extra(year) or [])
+    if not twse_known_year(year):
+        print(f"⚠️ 交易日曆：缺少 {year} 年 TWSE 休市日，農曆年等休市日會被當成交易日；"
+              f"請更新 TWSE_HOLIDAYS 或 {os.path.join(CACHE_DIR, 'holidays_TWSE.json')}")
+    return frozenset(pd.Timestamp(d).date() for d in days)
+
+
+@lru_cache(maxsize=None)
+def twse_extra_sessions(year):
+    days = set(TWSE_EXTRA_SESSIONS.get(year, [])) | set(_twse_file().get("sessions", {}).get(str(year), []))
+    return frozenset(pd.Timestamp(d).date() for d in days)
+
+
+# --------------------
+# 交易日曆
+# --------------------
+class TradingCalendar:
+    def __init__(self, name, tz, open_time, close_time, holidays, early_closes=None,
+                 early_close_time=None, known_year=None, extra_sessions=None):
+        self.name = name
+        self.tz = tz
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holidays = holidays
+        self.early_closes = early_closes
+        self.early_close_time = early_close_time
+        self.known_year = known_year  # None：休市日全由規則推算，每年都確定
+        self.extra_sessions = extra_sessions  # 週末開市的補行交易日
+
+    # ---------- 日期 ----------
+    def now(self):
+        return pd.Timestamp.now(tz=self.tz)
+
+    def _local(self, ts):
+        ts = pd.Timestamp(ts)
+        return ts.tz_localize(self.tz) if ts.tzinfo is None else ts.tz_convert(self.tz)
+
+    def is_session(self, d):
+        d = pd.Timestamp(d).date()
+        if d.weekday() >= 5:
+            return self.extra_sessions is not None and d in self.extra_sessions(d.year)
+        return d not in self.holidays(d.year)
+
+    def session_open(self, d):
+        return pd.Timestamp.combine(pd.Timestamp(d).date(), self.open_time).tz_localize(self.tz)
+
+    def session_close(self, d):
+        d = pd.Timestamp(d).date()
+        t = self.close_time
+        if self.early_closes is not None and d in self.early_closes(d.year):
+            t = self.early_close_time
+        return pd.Timestamp.combine(d, t).tz_localize(self.tz)
+
+    def unknown_years(self, start, end):
+        """[start, end] 之間沒有休市日表的年份"""
+        if self.known_year is None:
+            return []
+        return [y for y in range(pd.Timestamp(start).year, pd.Timestamp(end).year + 1)
+                if not self.known_year(y)]
+
+    def next_session(self, d):
+        d = pd.Timestamp(d).date() + timedelta(days=1)
+        while not self.is_session(d):
+            d += timedelta(days=1)
+        return d
+
+    def prev_session(self, d):
+        d = pd.Timestamp(d).date() - timedelta(days=1)
+        while not self.is_session(d):
+            d -= timedelta(days=1)
+        return d
+
+    def sessions(self, start, end):
+        """[start, end] 之間的交易日（含週末補行交易日）"""
+        freq = "D" if self.extra_sessions is not None else "B"
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq=freq)
+        return [d.date() for d in days if self.is_session(d)]
+
+    # ---------- 新鮮度判斷 ----------
+    def is_final(self, bar_date, now=None):
+        """該日 K 棒是否已收盤定案（收盤 + SETTLE_DELAY 之後）"""
+        now = self._local(now) if now is not None else self.now()
+        return now >= self.session_close(bar_date) + SETTLE_DELAY
+
+    def is_provisional(self, bar_date, now=None):
+        return self.is_session(bar_date) and not self.is_final(bar_date, now)
+
+    def last_final_session(self, now=None):
+        now = self._local(now) if now is not None else self.now()
+        d = now.date()
+        if not self.is_session(d) or not self.is_final(d, now):
+            d = self.prev_session(d)
+        return d
+
+    def pending_sessions(self, last_bar_date, end=None, now=None):
+        """last_bar_date 之後、end（不含）之前，已經開盤的交易日"""
+        now = self._local(now) if now is not None else self.now()
+        d = self.next_session(last_bar_date)
+        stop = pd.Timestamp(end).date() if end is not None else None
+        out = []
+        while d <= now.date() and (stop is None or d < stop):
+            if self.session_open(d) <= now:
+                out.append(d)
+            d = self.next_session(d)
+        return out
+
+    def new_bar_possible(self, last_bar_date, end=None, now=None):
+        return bool(self.pending_sessions(last_bar_date, end, now))
+
+    def is_open(self, now=None, grace=timedelta(0)):
+        """盤中；grace 延長到收盤後（例如等到 K 棒定案）"""
+        now = self._local(now) if now is not None else self.now()
+        d = now.date()
+        return self.is_session(d) and self.session_open(d) <= now < self.session_close(d) + grace
+
+
+TWSE = TradingCalendar("TWSE", "Asia/Taipei", time(9, 0), time(13, 30), twse_holidays,
+                       known_year=twse_known_year, extra_sessions=twse_extra_sessions)
+NYSE = TradingCalendar("NYSE", "America/New_York", time(9, 30), time(16, 0), nyse_holidays,
+                       nyse_early_closes, time(13, 0))
+
+
+def calendar_for(symbol):
+    s = str(symbol).upper()
+    if s.endswith(".TW") or s.endswith(".TWO") or s.isdigit():
+        return TWSE
+    return NYSE
@@ -0,0 +1,55 @@
+# =====================================================
+# SJ 趨勢穩定度 - 20 日擴散率與近 5 日變化
+# =====================================================
+# 原本定義在 app.py；移出後市場掃描的子程序（market_scan.py）也能直接使用。
+
+# --------------------
+# 套件導入
+# --------------------
+from backtest_5d import get_four_dimension_advice
+from signal_status import map_status
+from profiling import profiled
+
+# --------------------
+# 20日個股擴散率
+# --------------------
+@profiled
+def calc_trend_stability(df, window=20):
+    if df is None or len(df) < window + 2:
+        return None, 0, window
+    count_long = 0
+    for i in range(len(df) - window, len(df)):
+        op, last, sz, scz = get_four_dimension_advice(df, i)
+        status, _ = map_status(op, sz)
+        if status in ["⭐ 多單進場", "✅ 多單續抱"]:
+            count_long += 1
+    ratio = round(count_long / window * 100, 1)
+    return ratio, count_long, window
+
+def interpret_trend_stability(ratio):
+    if ratio is None:
+        return "未提供", "—"
+    if ratio > 70:
+        return "🔥 強勢主升段", "可續抱 / 加碼"
+    elif ratio >= 50:
+        return "⭐ 穩定多頭", "正常波段操作"
+    elif ratio >= 30:
+        return "⚠️ 震盪偏多", "低買高賣"
+    elif ratio >= 15:
+        return "🧊 弱勢整理", "觀望為主"
+    else:
+        return "❄️ 空頭或底部", "型態觀察"
+
+# --------------------
+# 最近5日擴散率變化
+# --------------------
+def calc_last5_trend_series(df, window=20, days=5):
+    series = []
+    if df is None or len(df) < window + days + 2:
+        return series
+    for k in range(days, 0, -1):
+        idx = len(df) - k
+        sub_df = df.iloc[:idx+1]
+        ratio, _, _ = calc_trend_stability(sub_df, window)
+        series.append(ratio)
+    return series